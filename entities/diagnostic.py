@@ -0,0 +1,43 @@
+class Diagnostic:
+    def __init__(self, rule, message, severity="warning", line=None, column=None):
+        """
+        :param rule: Identifier of the rule (or stage) that produced the diagnostic
+        :param message: Human readable description of the problem
+        :param severity: One of "error", "warning" or "info"
+        :param line: 1-based line of the problem, None when unknown
+        :param column: 1-based column of the problem, None when unknown
+        """
+        self.rule = rule
+        self.message = message
+        self.severity = severity
+        self.line = line
+        self.column = column
+
+    def __str__(self) -> str:
+        location = f" at line {self.line}, column {self.column}" if self.line else ""
+        return f"[{self.rule}] {self.message}{location}"
+
+    def __repr__(self) -> str:
+        return (
+            f"Diagnostic(rule={self.rule}, severity={self.severity}, "
+            f"message={self.message}, line={self.line}, column={self.column})"
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "rule": self.rule,
+            "message": self.message,
+            "severity": self.severity,
+            "line": self.line,
+            "column": self.column,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Diagnostic":
+        return cls(
+            data["rule"],
+            data["message"],
+            data.get("severity", "warning"),
+            data.get("line"),
+            data.get("column"),
+        )
@@ -1,12 +1,79 @@
+import functools
+from contextlib import contextmanager
 from typing import List, Tuple
+
 from entities.token_ import Token
 
+# Memo of format() results keyed by (structural hash, arguments), active only
+# inside format_memo()
+_format_memo = None
+
 
 def indent_str(indent_level):
     return "  " * indent_level  # 2 spaces per level
 
 
-class DefaultNode:
+@contextmanager
+def format_memo(memo):
+    """Reuse format() output of structurally equal nodes while the context is active.
+
+    Only nodes carrying a structural hash (see services/hashing.py) take part;
+    the hashes must be up to date with the tree being formatted.
+
+    Args:
+        memo (dict): The memo to read and fill, can be shared between files
+    """
+    global _format_memo
+    previous = _format_memo
+    _format_memo = memo
+    try:
+        yield memo
+    finally:
+        _format_memo = previous
+
+
+def _memoized_format(format_function):
+    @functools.wraps(format_function)
+    def format(self, *args, **kwargs):
+        memo = _format_memo
+        if memo is None:
+            return format_function(self, *args, **kwargs)
+        structural_hash = self.__dict__.get("_structural_hash")
+        if structural_hash is None:
+            return format_function(self, *args, **kwargs)
+        key = (structural_hash, args, tuple(kwargs.items()))
+        result = memo.get(key)
+        if result is None:
+            result = format_function(self, *args, **kwargs)
+            memo[key] = result
+        return result
+
+    return format
+
+
+class Node:
+    """Base class of every AST node.
+
+    ``child_fields`` names the attributes holding child nodes, in source order.
+    An attribute may hold a node, ``None``, or (nested) lists and tuples of
+    nodes; anything else stored there is ignored by the traversal helpers in
+    services/visitor.py.
+
+    ``span`` is the (start, end) character range of the node in the source,
+    end exclusive, or None for nodes that were not produced by the parser.
+    """
+
+    child_fields = ()
+    span = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Leaves are cheaper to format than to look up, only memoize nodes with children
+        if "format" in cls.__dict__ and cls.child_fields:
+            cls.format = _memoized_format(cls.__dict__["format"])
+
+
+class DefaultNode(Node):
     def __init__(self):
         self.comment = None
 
@@ -21,9 +88,27 @@ class DefaultNode:
         return f"{indent_str(indent)}# {self.comment}" if self.comment else ""
 
 
-class ProgramNode:
+class ProgramNode(Node):
+    child_fields = ("statements",)
+
     def __init__(self, statements):
         self.statements = statements
+        self._span_index = None
+
+    def node_at(self, offset):
+        """Return the innermost node whose span contains the offset, or None.
+
+        The interval index is built on the first lookup, call
+        ``invalidate_span_index`` after modifying the tree.
+        """
+        if self._span_index is None:
+            from services.spans import SpanIndex
+
+            self._span_index = SpanIndex(self)
+        return self._span_index.node_at(offset)
+
+    def invalidate_span_index(self):
+        self._span_index = None
 
     def __repr__(self, indent=0):
         string = f"{indent_str(indent)}ProgramNode(\n"
@@ -47,7 +132,9 @@ class ProgramNode:
         return formatted_code.strip()
 
 
-class AssignmentNode:
+class AssignmentNode(Node):
+    child_fields = ("identifier", "value")
+
     def __init__(self, identifier, value):
         self.identifier = identifier
         self.value = value
@@ -62,7 +149,9 @@ class AssignmentNode:
         )
 
 
-class DeclarationNode:
+class DeclarationNode(Node):
+    child_fields = ("type", "identifiers")
+
     def __init__(
         self,
         type_,
@@ -125,6 +214,8 @@ class DeclarationNode:
 
 
 class BinaryExpressionNode(DefaultNode):
+    child_fields = ("left", "right")
+
     def __init__(self, left, operator, right):
         super().__init__()
         self.left = left
@@ -146,6 +237,8 @@ class BinaryExpressionNode(DefaultNode):
 
 
 class IdentifierNode(DefaultNode):
+    child_fields = ("type_cast",)
+
     def __init__(self, value, type_cast=None):
         super().__init__()
         if isinstance(value, Token):
@@ -165,7 +258,7 @@ class IdentifierNode(DefaultNode):
         return result
 
 
-class GlobalIdentifierNode:
+class GlobalIdentifierNode(Node):
     def __init__(self, value):
         self.value = value
 
@@ -177,7 +270,7 @@ class GlobalIdentifierNode:
         return f"${self.value}"
 
 
-class PointerNode:
+class PointerNode(Node):
     def __init__(self, value):
         self.value = value
 
@@ -189,7 +282,7 @@ class PointerNode:
         return f"&{self.value}"
 
 
-class NumberNode:
+class NumberNode(Node):
     def __init__(self, value, is_float=False, is_negative=False):
         self.value = value
         self.is_float = is_float
@@ -203,7 +296,7 @@ class NumberNode:
         return f"{self.value}"
 
 
-class BooleanNode:
+class BooleanNode(Node):
     def __init__(self, value):
         self.value = value
 
@@ -228,7 +321,7 @@ class StringNode(DefaultNode):
         return f"{self.value}"
 
 
-class CommentNode:
+class CommentNode(Node):
     def __init__(self, value):
         self.value = value
 
@@ -240,7 +333,7 @@ class CommentNode:
         return f"{indent_str(indent)}// {self.value}"
 
 
-class MultilineCommentNode:
+class MultilineCommentNode(Node):
     def __init__(self, lines):
         self.lines = lines
 
@@ -260,7 +353,7 @@ class MultilineCommentNode:
         return result
 
 
-class DividerNode:
+class DividerNode(Node):
     def __init__(self, value):
         self.value = value
 
@@ -272,7 +365,9 @@ class DividerNode:
         return f"{self.value}"
 
 
-class AttributeAccessNode:
+class AttributeAccessNode(Node):
+    child_fields = ("identifier",)
+
     def __init__(self, identifier, attribute):
         self.identifier = identifier
         self.attribute = attribute
@@ -285,7 +380,9 @@ class AttributeAccessNode:
         return f"{self.identifier.format()}.{self.attribute.format()}"
 
 
-class IndexAccessNode:
+class IndexAccessNode(Node):
+    child_fields = ("identifier", "index")
+
     def __init__(self, identifier, index):
         self.identifier = identifier
         self.index = index
@@ -298,7 +395,9 @@ class IndexAccessNode:
         return f"{self.identifier.format()}[{self.index.format()}]"
 
 
-class FunctionDeclarationNode:
+class FunctionDeclarationNode(Node):
+    child_fields = ("return_type", "parameters", "block")
+
     def __init__(
         self,
         return_type,
@@ -357,7 +456,9 @@ class FunctionDeclarationNode:
         return string
 
 
-class FunctionCallNode:
+class FunctionCallNode(Node):
+    child_fields = ("identifier", "arguments")
+
     def __init__(self, identifier, arguments):
         self.identifier = identifier
         self.arguments = arguments
@@ -384,6 +485,14 @@ class FunctionCallNode:
 
 
 class IfStatementNode(DefaultNode):
+    child_fields = (
+        "condition",
+        "if_block",
+        "inline_statement",
+        "else_if_clauses",
+        "else_node",
+    )
+
     def __init__(
         self,
         condition,
@@ -439,6 +548,8 @@ class IfStatementNode(DefaultNode):
 
 
 class ElseIfClauseNode(DefaultNode):
+    child_fields = ("condition", "block", "inline_statement")
+
     def __init__(self, condition, block=None, inline_statement=None):
         super().__init__()
         self.condition = condition
@@ -461,6 +572,8 @@ class ElseIfClauseNode(DefaultNode):
 
 
 class ElseClauseNode(DefaultNode):
+    child_fields = ("block", "inline_statement")
+
     def __init__(self, block, inline_statement=None):
         super().__init__()
         self.block = block
@@ -481,7 +594,9 @@ class ElseClauseNode(DefaultNode):
         return result
 
 
-class BlockNode:
+class BlockNode(Node):
+    child_fields = ("statements",)
+
     def __init__(self, statements):
         self.statements = statements
 
@@ -517,7 +632,9 @@ class BlockNode:
         return result
 
 
-class ReturnNode:
+class ReturnNode(Node):
+    child_fields = ("expression",)
+
     def __init__(self, expression):
         self.expression = expression
 
@@ -531,7 +648,7 @@ class ReturnNode:
         return f"{indent_str(indent)}return {self.expression.format()};"
 
 
-class BreakNode:
+class BreakNode(Node):
     def __repr__(self, indent=0):
         return f"{indent_str(indent)}BreakNode()"
 
@@ -540,7 +657,9 @@ class BreakNode:
         return f"{indent_str(indent)}break;"
 
 
-class WhileLoopNode:
+class WhileLoopNode(Node):
+    child_fields = ("condition", "block_or_statement")
+
     def __init__(self, condition, block_or_statement):
         self.condition = condition
         self.block_or_statement = block_or_statement
@@ -567,7 +686,7 @@ class WhileLoopNode:
         return result
 
 
-class TypeNode:
+class TypeNode(Node):
     def __init__(self, value, dyn_type=None):
         self.value = value
         self.dyn_type = dyn_type
@@ -584,7 +703,9 @@ class TypeNode:
         return f"{self.value}"
 
 
-class TemplateTypeNode:
+class TemplateTypeNode(Node):
+    child_fields = ("types",)
+
     def __init__(self, template_type_keyword, types):
         self.template_type_keyword = template_type_keyword
         self.types = types
@@ -601,7 +722,9 @@ class TemplateTypeNode:
         return f"{self.template_type_keyword}<{', '.join([type_.format() for type_ in self.types])}>"
 
 
-class ParameterNode:
+class ParameterNode(Node):
+    child_fields = ("type_", "default_value")
+
     def __init__(
         self, type_, identifier, default_value=None, is_pointer=False, is_const=False
     ):
@@ -619,7 +742,7 @@ class ParameterNode:
         return f"{self.type_.format()} {'*' if self.is_pointer else ''}{'const ' if self.is_const else ''}{self.identifier}"
 
 
-class LibraryNode:
+class LibraryNode(Node):
     def __init__(self, name):
         self.name = name
 
@@ -631,7 +754,7 @@ class LibraryNode:
         return f"#uses {self.name}"
 
 
-class CharNode:
+class CharNode(Node):
     def __init__(self, value):
         self.value = value
 
@@ -643,7 +766,9 @@ class CharNode:
         return f"'{self.value}'"
 
 
-class TernaryExpressionNode:
+class TernaryExpressionNode(Node):
+    child_fields = ("comparison", "success_expression", "failure_expression")
+
     def __init__(self, comparison, success_expression, failure_expression):
         self.comparison = comparison
         self.success_expression = success_expression
@@ -657,7 +782,9 @@ class TernaryExpressionNode:
         return f"{indent_str(indent)}{self.comparison.format()} ? {self.success_expression.format()} : {self.failure_expression.format()}"
 
 
-class ForLoopNode:
+class ForLoopNode(Node):
+    child_fields = ("initialization", "condition", "increment", "block", "statement")
+
     def __init__(self, initialization, condition, increment, block, statement):
         self.initialization = initialization
         self.condition = condition
@@ -684,7 +811,9 @@ class ForLoopNode:
         return result
 
 
-class IncrementAssignmentNode:
+class IncrementAssignmentNode(Node):
+    child_fields = ("identifier",)
+
     def __init__(self, identifier, operator):
         self.identifier = identifier
         self.operator = operator
@@ -694,10 +823,14 @@ class IncrementAssignmentNode:
 
     def format(self, indent=0, semicolon=True):
 
-        return f"{indent_str(indent)}{self.identifier.format()}{self.operator}" + (";" if semicolon else "")
+        return f"{indent_str(indent)}{self.identifier.format()}{self.operator}" + (
+            ";" if semicolon else ""
+        )
 
 
-class CompoundAssignmentNode:
+class CompoundAssignmentNode(Node):
+    child_fields = ("identifier", "value")
+
     def __init__(self, identifier, operator, value):
         self.identifier = identifier
         self.operator = operator
@@ -707,10 +840,15 @@ class CompoundAssignmentNode:
         return f"{indent_str(indent)}CompundAssignmentNode(identifier={self.identifier}, operator={self.operator}, value={self.value})"
 
     def format(self, indent=0, semicolon=True):
-        return f"{indent_str(indent)}{self.identifier.format()} {self.operator} {self.value.format()}" + (";" if semicolon else "")
+        return (
+            f"{indent_str(indent)}{self.identifier.format()} {self.operator} {self.value.format()}"
+            + (";" if semicolon else "")
+        )
+
 
+class LogicalOrNode(Node):
+    child_fields = ("left", "right")
 
-class LogicalOrNode:
     def __init__(self, left, right):
         self.left = left
         self.right = right
@@ -727,7 +865,9 @@ class LogicalOrNode:
         return result
 
 
-class LogicalAndNode:
+class LogicalAndNode(Node):
+    child_fields = ("left", "right")
+
     def __init__(self, left, right):
         self.left = left
         self.right = right
@@ -744,7 +884,9 @@ class LogicalAndNode:
         return result
 
 
-class NegationNode:
+class NegationNode(Node):
+    child_fields = ("expression",)
+
     def __init__(self, operator, expression):
         self.operator = operator
         self.expression = expression
@@ -755,7 +897,10 @@ class NegationNode:
     def format(self, indent=0):
         return f"{self.operator}{self.expression.format()}"
 
-class RelationalNode:
+
+class RelationalNode(Node):
+    child_fields = ("left", "right")
+
     def __init__(self, left, operator, right):
         self.left = left
         self.operator = operator
@@ -767,7 +912,10 @@ class RelationalNode:
     def format(self, indent=0):
         return f"{indent_str(indent)}{self.left.format()} {self.operator} {self.right.format()}"
 
-class EnumDeclarationNode:
+
+class EnumDeclarationNode(Node):
+    child_fields = ("values",)
+
     def __init__(self, identifier, values):
         self.identifier = identifier
         self.values = values
@@ -789,7 +937,7 @@ class EnumDeclarationNode:
         return result
 
 
-class EnumValueNode:
+class EnumValueNode(Node):
     def __init__(self, identifier, value):
         self.identifier = identifier
         self.value = value
@@ -804,7 +952,8 @@ class EnumValueNode:
             else f"{self.identifier}"
         )
 
-class EnumAccessNode:
+
+class EnumAccessNode(Node):
     def __init__(self, identifier, value):
         self.identifier = identifier
         self.value = value
@@ -816,7 +965,9 @@ class EnumAccessNode:
         return f"{self.identifier}::{self.value}"
 
 
-class CaseStatementNode:
+class CaseStatementNode(Node):
+    child_fields = ("value", "block")
+
     def __init__(self, value, block, is_default=False):
         self.value = value
         self.block: BlockNode = block
@@ -831,7 +982,9 @@ class CaseStatementNode:
         return f"{indent_str(indent)}case {self.value.format()}:\n{self.block.format(indent + 1)}"
 
 
-class SwitchStatementNode:
+class SwitchStatementNode(Node):
+    child_fields = ("expression", "statements")
+
     def __init__(self, expression, statements):
         self.expression = expression
         self.statements = statements
@@ -855,7 +1008,9 @@ class SwitchStatementNode:
         return result
 
 
-class BitwiseOrNode:
+class BitwiseOrNode(Node):
+    child_fields = ("left", "right")
+
     def __init__(self, left, right):
         self.left = left
         self.right = right
@@ -873,7 +1028,9 @@ class BitwiseOrNode:
         return result
 
 
-class BitwiseXorNode:
+class BitwiseXorNode(Node):
+    child_fields = ("left", "right")
+
     def __init__(self, left, right):
         self.left = left
         self.right = right
@@ -891,7 +1048,9 @@ class BitwiseXorNode:
         return result
 
 
-class BitwiseAndNode:
+class BitwiseAndNode(Node):
+    child_fields = ("left", "right")
+
     def __init__(self, left, right):
         self.left = left
         self.right = right
@@ -909,7 +1068,9 @@ class BitwiseAndNode:
         return result
 
 
-class ShiftNode:
+class ShiftNode(Node):
+    child_fields = ("left", "right")
+
     def __init__(self, left, operator, right):
         self.left = left
         self.operator = operator
@@ -925,7 +1086,9 @@ class ShiftNode:
             result += f" {self.operator} {self.right.format()}"
 
 
-class StructDeclarationNode:
+class StructDeclarationNode(Node):
+    child_fields = ("inheritance", "block")
+
     def __init__(self, identifier, block, inheritance=None):
         self.identifier = identifier
         self.block = block
@@ -944,7 +1107,9 @@ class StructDeclarationNode:
         return result
 
 
-class ClassDeclarationNode:
+class ClassDeclarationNode(Node):
+    child_fields = ("inheritance", "block")
+
     def __init__(self, identifier, block, inheritance=None):
         self.identifier = identifier
         self.block = block
@@ -967,7 +1132,9 @@ class ClassDeclarationNode:
         return result
 
 
-class InheritanceNode:
+class InheritanceNode(Node):
+    child_fields = ("identifier",)
+
     def __init__(self, identifier):
         self.identifier = identifier
 
@@ -979,7 +1146,9 @@ class InheritanceNode:
         return f"{self.identifier}"
 
 
-class TypeCastNode:
+class TypeCastNode(Node):
+    child_fields = ("type_", "expression")
+
     def __init__(self, type_, expression):
         self.type_ = type_
         self.expression = expression
@@ -992,7 +1161,9 @@ class TypeCastNode:
         return f"{indent_str(indent)}({self.type_.format()}){self.expression.format()}"
 
 
-class ClassStaticAccessNode:
+class ClassStaticAccessNode(Node):
+    child_fields = ("attribute",)
+
     def __init__(self, identifier, attribute):
         self.identifier = identifier
         self.attribute = attribute
@@ -1005,7 +1176,9 @@ class ClassStaticAccessNode:
         return f"{self.identifier}::{self.attribute}"
 
 
-class ClassInitializationNode:
+class ClassInitializationNode(Node):
+    child_fields = ("identifier", "arguments")
+
     def __init__(self, identifier, arguments, new=False):
         self.identifier = identifier
         self.arguments = arguments
@@ -1028,7 +1201,7 @@ class ClassInitializationNode:
         return result
 
 
-class ContinueNode:
+class ContinueNode(Node):
     def __repr__(self, indent=0):
         return f"{indent_str(indent)}ContinueNode()"
 
@@ -1037,7 +1210,9 @@ class ContinueNode:
         return f"{indent_str(indent)}continue;"
 
 
-class TryCatchNode:
+class TryCatchNode(Node):
+    child_fields = ("try_block", "catch_block", "finally_block")
+
     def __init__(self, try_block, catch_block, finally_block=None):
         self.try_block = try_block
         self.catch_block = catch_block
@@ -1062,7 +1237,9 @@ class TryCatchNode:
         return result
 
 
-class DoWhileLoopNode:
+class DoWhileLoopNode(Node):
+    child_fields = ("block", "condition")
+
     def __init__(self, block, condition):
         self.block = block
         self.condition = condition
@@ -1080,7 +1257,7 @@ class DoWhileLoopNode:
         return result
 
 
-class NewLineNode:
+class NewLineNode(Node):
     def __repr__(self, indent=0):
         return f"{indent_str(indent)}NewLineNode()"
 
@@ -1089,7 +1266,9 @@ class NewLineNode:
         return ""
 
 
-class PropertySetterNode:
+class PropertySetterNode(Node):
+    child_fields = ("type",)
+
     def __init__(self, type, identifier):
         self.type = type
         self.identifier = identifier
@@ -1102,7 +1281,9 @@ class PropertySetterNode:
         return f"#property {self.type.format()} {self.identifier}"
 
 
-class EventNode:
+class EventNode(Node):
+    child_fields = ("identifier", "parameters")
+
     def __init__(self, identifier, parameters):
         self.identifier: IdentifierNode = identifier
         self.parameters: List[ParameterNode] = parameters
@@ -1115,7 +1296,9 @@ class EventNode:
         return f"#event {self.identifier.format()}({', '.join([param.format() for param in self.parameters])})"
 
 
-class FactorNode:
+class FactorNode(Node):
+    child_fields = ("left_comment", "primary", "right_comment")
+
     def __init__(self, primary, left_comment=None, right_comment=None):
         self.primary = primary
         self.left_comment = left_comment
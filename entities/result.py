@@ -0,0 +1,84 @@
+OK = "ok"
+ERROR = "error"
+BUDGET_EXCEEDED = "budget-exceeded"  # Stopped for running out of time or memory
+
+
+class FileResult:
+    """Outcome of processing one file, small enough to send between processes."""
+
+    __slots__ = (
+        "path",
+        "status",
+        "changed",
+        "error",
+        "diagnostics",
+        "messages",
+        "rule_stats",
+        "size",
+        "mtime_ns",
+        "digest",
+        "tokens",
+        "nodes",
+        "timings",
+        "cpu_timings",
+        "peak_memory",
+        "memory_sites",
+        "cached",
+    )
+
+    def __init__(self, path, status=OK, changed=False, error=None):
+        """
+        :param path: The processed file
+        :param status: OK, ERROR when the file could not be processed, or
+            BUDGET_EXCEEDED
+        :param changed: Whether the formatted output differs from the file on disk
+        :param error: Description of the error, when status is ERROR
+        """
+        self.path = path
+        self.status = status
+        self.changed = changed
+        self.error = error
+        self.diagnostics = []  # Lint diagnostics reported for the file
+        self.messages = []  # Output lines, printed by the parent in file order
+        self.rule_stats = None  # Rule id -> RuleStats of this file, when rules ran
+        self.size = 0  # Bytes read
+        self.mtime_ns = None  # Modification time of the file when it was read
+        self.digest = None  # Content hash of the file when it was read
+        self.tokens = None  # None when the file was not tokenized (e.g. cached AST)
+        self.nodes = None
+        self.timings = {}  # Stage name -> seconds, in the order the stages ran
+        self.cpu_timings = {}  # Stage name -> CPU seconds, only measured with --timings
+        # Peak bytes above the memory in use before the file, measured with --memory
+        self.peak_memory = 0
+        # (file:line, bytes, blocks) allocating the most, traced after the run for
+        # the files --memory reports
+        self.memory_sites = []
+        self.cached = False  # Replayed from the results cache
+
+    @property
+    def seconds(self) -> float:
+        return sum(self.timings.values())
+
+    def __repr__(self) -> str:
+        return (
+            f"FileResult(path={self.path}, status={self.status}, "
+            f"changed={self.changed}, error={self.error})"
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "path": self.path,
+            "status": self.status,
+            "changed": self.changed,
+            "cached": self.cached,
+            "error": self.error,
+            "size": self.size,
+            "tokens": self.tokens,
+            "nodes": self.nodes,
+            "seconds": self.seconds,
+            "timings": self.timings,
+            "cpu_timings": self.cpu_timings,
+            "peak_memory": self.peak_memory,
+            "memory_sites": self.memory_sites,
+            "diagnostics": [diagnostic.to_dict() for diagnostic in self.diagnostics],
+        }
@@ -2,11 +2,14 @@ from enum import Enum
 
 
 class Token:
-    def __init__(self, kind, value, line, column):
+    def __init__(self, kind, value, line, column, start=None, end=None):
         self.kind = kind
         self.value = value
         self.line = line
         self.column = column
+        # Character offsets of the token in the source, end is exclusive
+        self.start = start
+        self.end = end
 
     def __str__(self) -> str:
         value = (
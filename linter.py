@@ -1,99 +1,996 @@
 import argparse
+import functools
+import json
 import os
+import sys
+import time
+from collections import deque
+
+from entities.result import ERROR, OK, FileResult
+from entities.token_ import TokenError
+from services.config import (
+    AST_FORMATS,
+    CPROFILE,
+    DEFAULT_CACHE_SIZE,
+    DEFAULT_CONFIG_FILE,
+    DEFAULT_DIAGNOSTICS_FILE,
+    DIAGNOSTICS_FORMATS,
+    DIAGNOSTICS_TEXT,
+    PROFILERS,
+    diagnostics_format_for_path,
+    find_config,
+    load_config,
+    parse_line_range,
+)
+from services.files import read_text, write_atomic
 from services.formatter_ import Formatter
 from services.parser_ import Parser
-from entities.token_ import TokenError
+from services.report import RunReport
+from services.rules import RuleEngine
 from services.tokenizer import Tokenizer
 
-# Global statistics counters
-files_with_errors = 0
-files_successful = 0
-total_files = 0
-error_log_file = "lint_errors.txt"
+# Modules only needed by some commands and options (the caches, the worker
+# pool, git, folder walking, the AST export, the diagnostics file, the daemon,
+# the language server, watching, diffs) are imported where they are used, so
+# that formatting a single file starts quickly.
+
+# How diagnostics are printed to standard error when formatting standard input
+STDIN_DIAGNOSTICS_FORMATS = ("text", "json")
+
+# Follows a diff line lacking the newline at the end of the file, as in git diff
+NO_NEWLINE_MARKER = "\n\\ No newline at end of file\n"
+
+# Files per worker task when the number of files is not known in advance
+STREAM_CHUNK_SIZE = 8
+
+# Results of the run, aggregated in the main process
+run_report = RunReport()
+diagnostic_sink = None
+# (path, format, flush interval) of the diagnostics file, whose sink is only
+# created when there is something to write
+diagnostics_settings = None
+
+# Outcomes of earlier runs, used by the main process only
+result_cache = None
+
+# Time and memory limits of each file, enforced in isolated worker processes
+file_budget = None
+
+# Per-process settings, set by configure() in the main process and in every worker
+rule_engine = None
+ast_cache = None
+memoize_formatting = False
+check_mode = False  # Report files that would change instead of writing them
+diff_mode = False  # Print the changes as a unified diff instead of writing them
+measure_cpu = False  # Record the CPU time of each stage besides its wall time
+measure_memory = False  # Record the peak memory of each file with tracemalloc
+
+# Allocation sites traced per reported file with --memory
+MEMORY_SITES = 5
+
+
+def configure(
+    config,
+    cache_dir=None,
+    cache_size=DEFAULT_CACHE_SIZE,
+    check=False,
+    diff=False,
+    timings=False,
+    memory=False,
+):
+    """Set up the rule engine, the AST cache and the output mode of this process.
+
+    Worker processes run it as their initializer, so they need nothing but
+    picklable arguments.
+    """
+    global rule_engine, ast_cache, memoize_formatting, check_mode, diff_mode
+    global measure_cpu, measure_memory
+    rule_engine = RuleEngine.from_config(config)
+    memoize_formatting = config["memoize_formatting"]
+    ast_cache = None
+    if cache_dir:
+        from services.cache import ASTCache
+
+        ast_cache = ASTCache(cache_dir, cache_size)
+    check_mode = check
+    diff_mode = diff
+    measure_cpu = timings
+    measure_memory = memory
+    if memory:
+        import tracemalloc
+
+        tracemalloc.start()
+
+
+def allocation_sites(snapshot, baseline, count=MEMORY_SITES):
+    """The count source lines that allocated the most memory since the baseline.
 
+    Only the memory still in use counts.
+    """
+    import tracemalloc
 
-def process_file(input_file, output_file=None, ast_file=None):
-    """Process a single file: tokenize, parse, format, and save output."""
-    global files_with_errors, files_successful, total_files
-    total_files += 1
+    # Leave out the allocations of tracemalloc itself
+    exclude = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    snapshot = snapshot.filter_traces(exclude)
+    baseline = baseline.filter_traces(exclude)
+    sites = []
+    # Sorted by the size of the change, freed memory included
+    grown = [
+        difference
+        for difference in snapshot.compare_to(baseline, "lineno")
+        if difference.size_diff > 0
+    ]
+    for difference in grown[:count]:
+        frame = difference.traceback[0]
+        sites.append(
+            (
+                f"{frame.filename}:{frame.lineno}",
+                difference.size_diff,
+                difference.count_diff,
+            )
+        )
+    return sites
+
+
+def trace_allocations(path, count=MEMORY_SITES):
+    """The count source lines allocating the most memory to process a file.
+
+    The file is tokenized, parsed, linted and formatted again between two
+    tracemalloc snapshots. Snapshots are slow, so this only runs after the
+    run, for the few files that are reported, and adds to no timings.
+    """
+    import tracemalloc
+
+    baseline = tracemalloc.take_snapshot()
+    with open(path, "r") as file:
+        code = file.read()
+    tokens = Tokenizer(code=code).tokenize()
+    ast = Parser(tokens=tokens).parse()
+    diagnostics = rule_engine.run(ast, code) if rule_engine is not None else []
+    formatted_code = Formatter(ast, memoize=memoize_formatting).format()
+    # The tokens, the AST and the output are all still alive
+    sites = allocation_sites(tracemalloc.take_snapshot(), baseline, count)
+    del tokens, ast, diagnostics, formatted_code
+    return sites
+
+
+def process_file(
+    input_file,
+    output_file=None,
+    ast_file=None,
+    ast_format=None,
+    line_ranges=None,
+    diff_against=None,
+    staged=False,
+    on_lap=None,
+) -> FileResult:
+    """Process a single file: tokenize, parse, format, and save output.
+
+    The output is only written when its content changes. In check or diff
+    mode nothing is written; the files that would change are reported.
+
+    With line_ranges (or diff_against, a git ref whose changed hunks are used
+    as line ranges) only the top-level statements overlapping those lines are
+    reformatted.
+
+    With staged the content staged in the git index is processed instead of
+    the working tree file, and nothing is written.
+
+    Nothing is printed: the output and statistics of the file are returned in
+    a FileResult, which record_result() reports. Isolated workers follow the
+    progress of a file with on_lap, called with the name and the seconds of
+    each completed stage.
+    """
+    result = FileResult(input_file)
+    messages = result.messages
+    timings = result.timings
+    cpu_timings = result.cpu_timings if measure_cpu else None
+    last = time.perf_counter()
+    last_cpu = time.process_time() if measure_cpu else 0.0
+    if measure_memory:
+        import tracemalloc
+
+        # The peak is measured from the memory in use before the file is read
+        tracemalloc.reset_peak()
+        memory_baseline = tracemalloc.get_traced_memory()[0]
+
+    def lap(stage):
+        # Charge the time since the previous lap to a stage
+        nonlocal last, last_cpu
+        now = time.perf_counter()
+        timings[stage] = timings.get(stage, 0.0) + now - last
+        if on_lap is not None:
+            on_lap(stage, now - last)
+        last = now
+        if cpu_timings is not None:
+            now_cpu = time.process_time()
+            cpu_timings[stage] = cpu_timings.get(stage, 0.0) + now_cpu - last_cpu
+            last_cpu = now_cpu
+
+    # Errors reported as a failed file, git ones only when git is read
+    failures = (SyntaxError, TokenError)
+    if staged or diff_against is not None:
+        from services.git_ import GitError
+
+        failures += (GitError,)
 
     try:
         # Read the input file
-        with open(input_file, "r") as file:
-            code = file.read()
+        if staged:
+            from services.git_ import read_staged
+
+            code = read_staged(input_file)
+            result.size = len(code.encode("utf-8", "surrogatepass"))
+        else:
+            with open(input_file, "r") as file:
+                stat = os.fstat(file.fileno())
+                code = file.read()
+            result.size = stat.st_size
+            result.mtime_ns = stat.st_mtime_ns
+        if ast_cache is not None:
+            # Only needed by the results cache, enabled along with the AST cache
+            from services.result_cache import content_digest
+
+            result.digest = content_digest(code)
+        lap("read")
+
+        if diff_against is not None:
+            from services.git_ import changed_line_ranges
 
-        # Initialize tokenizer
-        tokenizer = Tokenizer(code=code)
+            line_ranges = changed_line_ranges(input_file, diff_against)
+            lap("git")
+            if not line_ranges:
+                messages.append(f"No changes against {diff_against} in {input_file}")
+                return result
 
-        # Tokenize the input code
-        tokens = tokenizer.tokenize()
+        # Reuse the AST of an unchanged file from the cache
+        ast = ast_cache.load(code) if ast_cache is not None else None
+        if ast_cache is not None:
+            lap("cache")
+        if ast is None:
+            # Initialize tokenizer
+            tokenizer = Tokenizer(code=code)
 
-        # Initialize parser with tokens
-        parser = Parser(tokens=tokens)
-        ast = parser.parse()
+            # Tokenize the input code
+            tokens = tokenizer.tokenize()
+            result.tokens = len(tokens)
+            lap("tokenize")
+
+            # Initialize parser with tokens
+            parser = Parser(tokens=tokens)
+            ast = parser.parse()
+            lap("parse")
+
+            # Store the AST before the formatter modifies it
+            if ast_cache is not None:
+                ast_cache.store(code, ast)
+                lap("cache")
+
+        # Run the lint rules in a single traversal of the AST
+        if rule_engine is not None:
+            result.diagnostics = rule_engine.run(ast, code)
+            result.rule_stats = rule_engine.take_stats()
+            result.nodes = rule_engine.nodes
+        lap("lint")
 
         # Format the code
-        formatter = Formatter(ast)
-        formatted_code = formatter.format()
+        formatter = Formatter(ast, memoize=memoize_formatting)
+        if line_ranges is not None:
+            formatted_code = formatter.format_ranges(code, line_ranges)
+        else:
+            formatted_code = formatter.format()
+        lap("format")
 
         # Determine output file path for formatted code
         output_file_path = output_file if output_file else input_file
 
         # Save the AST file if provided
         if ast_file:
+            from services.ast_export import export_ast, format_for_path
+
             with open(ast_file, "w") as file:
-                file.write(str(ast))
-            print(f"AST saved to {ast_file}")
+                export_ast(ast, file, ast_format or format_for_path(ast_file))
+            messages.append(f"AST saved to {ast_file}")
+            lap("export")
+
+        # Compare with what is on disk, so unchanged files are not touched
+        current_code = (
+            code if output_file_path == input_file else read_text(output_file_path)
+        )
+        if current_code != formatted_code:
+            result.changed = True
+            if diff_mode:
+                # Printed with a newline of its own
+                diff = unified_diff_text(
+                    current_code or "", formatted_code, output_file_path
+                )
+                messages.append(diff[:-1])
+            elif check_mode or staged:
+                messages.append(f"Would reformat {output_file_path}")
+            else:
+                write_atomic(output_file_path, formatted_code)
+                messages.append(f"Formatted code saved to {output_file_path}")
+        elif not (check_mode or diff_mode or staged):
+            messages.append(f"{output_file_path} is already formatted")
+        lap("write")
+
+    except failures as e:
+        lap("failed")
+        result.status = ERROR
+        result.error = str(e)
+        messages.append(f"Error in {input_file}: {e}")
+
+    if measure_memory:
+        result.peak_memory = tracemalloc.get_traced_memory()[1] - memory_baseline
+    return result
+
+
+def _diff_lines(text: str) -> list:
+    # Lines as git sees them: only "\n" ends a line
+    lines = [line + "\n" for line in text.split("\n")]
+    lines[-1] = lines[-1][:-1]
+    if not lines[-1]:
+        lines.pop()
+    return lines
 
-        # Save the formatted output
-        with open(output_file_path, "w") as file:
-            file.write(formatted_code)
-        print(f"Formatted code saved to {output_file_path}")
 
-        files_successful += 1  # File processed successfully
+def unified_diff_text(old: str, new: str, path: str) -> str:
+    """A unified diff of two versions of a file, which patch and git apply accept.
 
+    As in git diff, a last line without a newline is followed by a
+    "\\ No newline at end of file" marker. The diff is empty when the texts are
+    equal, and ends with a newline otherwise.
+    """
+    from difflib import unified_diff
+
+    lines = []
+    for line in unified_diff(
+        _diff_lines(old), _diff_lines(new), fromfile=path, tofile=path
+    ):
+        lines.append(line)
+        if not line.endswith("\n"):
+            lines.append(NO_NEWLINE_MARKER)
+    return "".join(lines)
+
+
+def process_stdin(filename=None, line_ranges=None, diagnostics_format="text") -> int:
+    """Format standard input to standard output, printing diagnostics to standard error.
+
+    With check mode nothing is printed to standard output, and with diff mode
+    the changes are printed as a unified diff. The AST cache is used, being
+    keyed by content; the results cache is not, as it is keyed by file.
+
+    Args:
+        filename (str, optional): Path of the source, used in messages
+        line_ranges (list, optional): Only format the top-level statements overlapping
+            these lines
+        diagnostics_format (str, optional): "text" for one line per diagnostic, "json"
+            for one object
+
+    Returns:
+        int: The exit status, 1 on errors and, in check mode, when the code would change
+    """
+    name = filename or "<stdin>"
+    code = sys.stdin.read()
+    diagnostics = []
+    error = None
+    formatted_code = None
+    try:
+        ast = ast_cache.load(code) if ast_cache is not None else None
+        if ast is None:
+            ast = Parser(Tokenizer(code).tokenize()).parse()
+            if ast_cache is not None:
+                ast_cache.store(code, ast)
+        if rule_engine is not None:
+            diagnostics = rule_engine.run(ast, code)
+        formatter = Formatter(ast, memoize=memoize_formatting)
+        if line_ranges is not None:
+            formatted_code = formatter.format_ranges(code, line_ranges)
+        else:
+            formatted_code = formatter.format()
     except (SyntaxError, TokenError) as e:
-        print(f"Error in {input_file}: {e}")
-        log_error(input_file, e)  # Log the error
-        files_with_errors += 1
+        error = str(e)
+    except Exception as e:
+        # Editors send incomplete code, on which the parser may fail with
+        # IndexError or AttributeError (see process_file_or_fail)
+        error = f"{type(e).__name__}: {e}"
+
+    if diagnostics_format == "json":
+        document = {
+            "path": name,
+            "error": error,
+            "changed": formatted_code is not None and formatted_code != code,
+            "diagnostics": [diagnostic.to_dict() for diagnostic in diagnostics],
+        }
+        print(json.dumps(document), file=sys.stderr)
+    else:
+        for diagnostic in diagnostics:
+            print(f"{name}: {diagnostic}", file=sys.stderr)
+        if error is not None:
+            print(f"Error in {name}: {error}", file=sys.stderr)
+    if error is not None:
+        return 1
+
+    if diff_mode:
+        sys.stdout.write(unified_diff_text(code, formatted_code, name))
+    elif not check_mode:
+        sys.stdout.write(formatted_code)
+    sys.stdout.flush()
+    return 1 if check_mode and formatted_code != code else 0
+
+
+def record_result(result: FileResult):
+    """Print the output of a processed file and add it to the statistics."""
+    run_report.add(result)
+    for diagnostic in result.diagnostics:
+        print(f"{result.path}: {diagnostic}")
+    for message in result.messages:
+        print(message)
+    if diagnostics_settings is None:
+        return
+    # Once created, the sink also sees the clean files, whose records it replaces
+    if diagnostic_sink is not None or result.diagnostics or result.status != OK:
+        open_diagnostic_sink().add(result)
+
+
+def open_diagnostic_sink():
+    """The sink of the diagnostics file, created on first use."""
+    global diagnostic_sink
+    if diagnostic_sink is None:
+        from services.diagnostic_sink import DiagnosticSink
+
+        diagnostic_sink = DiagnosticSink(*diagnostics_settings)
+    return diagnostic_sink
+
+
+def close_diagnostic_sink():
+    """Write the diagnostics file, unless it would be an empty text file."""
+    path, format, _ = diagnostics_settings
+    if diagnostic_sink is not None or (
+        (format or diagnostics_format_for_path(path)) != DIAGNOSTICS_TEXT
+    ):
+        open_diagnostic_sink().close()
+
+
+def cached_result(path) -> FileResult | None:
+    """Replay the stored result of an unchanged file, None when it must be processed."""
+    if result_cache is None:
+        return None
+    started = time.perf_counter()
+    result = result_cache.lookup(path)
+    if result is None:
+        return None
+    if result.changed and not check_mode:
+        # The formatted output has to be written or diffed again
+        return None
+
+    result.cached = True
+    if result.status == ERROR:
+        result.messages.append(f"Error in {path}: {result.error}")
+    elif result.changed:
+        result.messages.append(f"Would reformat {path}")
+    elif not (check_mode or diff_mode):
+        result.messages.append(f"{path} is already formatted")
+    result.timings["cache"] = time.perf_counter() - started
+    return result
+
+
+def process_directory(
+    input_dir, diff_against=None, jobs=None, settings=None, walk_threads=1
+):
+    """Recursively process all .ctl files in a directory that are not ignored.
+
+    The files are processed while the directory is still being walked.
+    """
+    from services.walker import walk_ctl_files
+
+    process_paths(walk_ctl_files(input_dir, walk_threads), diff_against, jobs, settings)
 
 
-def log_error(file_path, error):
-    """Log errors to lint_errors.txt."""
-    with open(error_log_file, "a") as log_file:
-        log_file.write(f"File: {file_path}\nError: {error}\n\n")
+def failed_result(path, error) -> FileResult:
+    """The result of a file whose processing raised an unexpected exception."""
+    result = FileResult(path, ERROR, error=f"{type(error).__name__}: {error}")
+    result.messages.append(f"Error in {path}: {result.error}")
+    return result
 
 
-def process_directory(input_dir):
-    """Recursively process all .ctl files in a directory."""
-    for root, _, files in os.walk(input_dir):
-        for file in files:
-            if file.endswith(".ctl"):
-                input_file_path = os.path.join(root, file)
-                print(f"Processing file: {input_file_path}")
-                process_file(input_file_path)
+def process_file_or_fail(path, diff_against=None, staged=False) -> FileResult:
+    """Process a file, turning any exception into an error result for it.
+
+    The parser fails on some malformed code with IndexError or AttributeError
+    rather than SyntaxError; such a file must not end the run or take the
+    other files of its chunk with it.
+    """
+    try:
+        return process_file(path, diff_against=diff_against, staged=staged)
+    except Exception as e:
+        return failed_result(path, e)
+
+
+def process_chunk(paths, diff_against=None, staged=False):
+    """Process several files in a worker process, to cut the messaging overhead."""
+    return [
+        process_file_or_fail(path, diff_against=diff_against, staged=staged)
+        for path in paths
+    ]
+
+
+def process_paths(paths, diff_against=None, jobs=None, settings=None, staged=False):
+    """Process the given .ctl files, a list or a stream of paths.
+
+    Unchanged files are replayed from the results cache, when there is one.
+    With more than one job the other files are sent in chunks to a pool of
+    worker processes, each set up by configure(**settings), as soon as the
+    paths arrive. Results are reported in the order of paths either way, so
+    the output does not depend on scheduling.
+
+    With a file_budget every file is processed on its own in an isolated
+    worker, which is killed and replaced when the file runs out of time or
+    memory, even with a single job.
+    """
+    cacheable = diff_against is None and not staged
+    jobs = jobs or os.cpu_count() or 1
+    if isinstance(paths, list):
+        # Small chunks balance uneven file sizes, larger ones cut the messaging overhead
+        chunksize = max(1, min(16, len(paths) // (jobs * 4)))
+    else:
+        chunksize = STREAM_CHUNK_SIZE
+
+    # [path, FileResult or Future of its chunk, index in the chunk], in path order
+    entries = deque()
+    chunk = []
+    executor = None
+    isolated_pool = None
+
+    def submit_isolated(path):
+        nonlocal isolated_pool
+        if isolated_pool is None:
+            from services.isolation import IsolatedPool
+
+            isolated_pool = IsolatedPool(
+                jobs,
+                file_budget,
+                functools.partial(configure, **(settings or {})),
+                functools.partial(
+                    process_file, diff_against=diff_against, staged=staged
+                ),
+            )
+        # A Future of the result itself, not of a chunk
+        return isolated_pool.submit(path)
+
+    def submit():
+        nonlocal executor, chunk
+        if executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+
+            executor = ProcessPoolExecutor(
+                max_workers=jobs,
+                initializer=functools.partial(configure, **(settings or {})),
+            )
+        future = executor.submit(
+            process_chunk, [entry[0] for entry in chunk], diff_against, staged
+        )
+        for index, entry in enumerate(chunk):
+            entry[1] = future
+            entry[2] = index
+        chunk = []
+
+    try:
+        for path in paths:
+            entry = [path, cached_result(path) if cacheable else None, None]
+            entries.append(entry)
+            if entry[1] is None:
+                if file_budget is not None:
+                    entry[1] = submit_isolated(path)
+                elif jobs == 1:
+                    entry[1] = process_file_or_fail(
+                        path, diff_against=diff_against, staged=staged
+                    )
+                else:
+                    chunk.append(entry)
+                    # A single file is not worth starting the pool for
+                    if len(chunk) >= max(chunksize, 1 if executor else 2):
+                        submit()
+            report_results(entries, cacheable, wait=False)
+
+        if chunk:
+            if executor is None and len(chunk) < 2:
+                chunk[0][1] = process_file_or_fail(
+                    chunk[0][0], diff_against=diff_against, staged=staged
+                )
+            else:
+                submit()
+        report_results(entries, cacheable, wait=True)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if isolated_pool is not None:
+            isolated_pool.shutdown()
+
+
+def report_results(entries, cacheable, wait):
+    """Record the available results at the front of entries, all of them with wait."""
+    while entries:
+        path, outcome, index = entries[0]
+        if outcome is None:
+            # Waiting for its chunk to fill up
+            return
+        if isinstance(outcome, FileResult):
+            result = outcome
+        elif wait or outcome.done():
+            try:
+                result = outcome.result() if index is None else outcome.result()[index]
+            except Exception as e:
+                # A worker that died takes its whole chunk with it
+                result = failed_result(path, e)
+        else:
+            return
+        entries.popleft()
+        print(f"Processing file: {path}")
+        if cacheable and not result.cached and result_cache is not None:
+            result_cache.store(result)
+        record_result(result)
+
+
+def watch_directory(directory, diff_against=None, jobs=None, settings=None):
+    """Process a directory, then re-process its .ctl files whenever they change.
+
+    Runs until interrupted. Changes are handled in this process, so the rule
+    engine, the caches and the tokenizer tables stay warm between passes.
+    Events caused by the formatted output being written back are ignored.
+    """
+    from services.walker import is_ignored
+    from services.watch import DEFAULT_DEBOUNCE as WATCH_DEBOUNCE
+    from services.watch import watch
+
+    # Path -> (size, mtime_ns) after the file was last processed
+    seen = {}
+
+    def remember(paths):
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                seen.pop(path, None)
+                continue
+            seen[path] = (stat.st_size, stat.st_mtime_ns)
+
+    def finish_pass(paths):
+        remember(paths)
+        run_report.finish()
+        if diagnostic_sink is not None:
+            diagnostic_sink.flush()
+        if result_cache is not None:
+            result_cache.save()
+
+    print(f"Processing all .ctl files in directory: {directory}")
+    paths = find_ctl_files(directory)
+    process_paths(paths, diff_against, jobs, settings)
+    finish_pass(paths)
+    display_statistics()
+
+    def on_change(changed):
+        paths = []
+        for path in sorted(changed):
+            if is_ignored(path, directory):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                if seen.pop(path, None) is not None:
+                    print(f"Removed: {path}")
+                continue
+            if seen.get(path) != (stat.st_size, stat.st_mtime_ns):
+                paths.append(path)
+        if not paths:
+            return
+        run_report.reset()
+        process_paths(paths, diff_against, 1, settings)
+        finish_pass(paths)
+        print(
+            f"Processed {run_report.total} changed files in "
+            f"{run_report.wall_seconds:.3f}s: "
+            f"{run_report.errors} with errors, {run_report.changed} changed"
+        )
+        sys.stdout.flush()
+
+    print(f"Watching {directory} for changes (Ctrl+C to stop)")
+    sys.stdout.flush()
+    try:
+        watch(directory, on_change, WATCH_DEBOUNCE)
+    except KeyboardInterrupt:
+        pass
+
+
+def find_ctl_files(input_path):
+    """List the .ctl files of a folder tree that are not ignored, or the file itself."""
+    from services.walker import walk_ctl_files
+
+    return list(walk_ctl_files(input_path))
+
+
+def dupes_main(argv):
+    """The ``dupes`` command: report code duplicated across .ctl files."""
+    from services.duplicates import (
+        DEFAULT_INDEX_FILE,
+        DEFAULT_MIN_SIZE,
+        DEFAULT_WINDOW,
+        DuplicateIndex,
+    )
+
+    parser = argparse.ArgumentParser(
+        prog="ctllint dupes",
+        description=(
+            "Report duplicated functions and statement sequences in .ctl files."
+        ),
+    )
+    parser.add_argument("input_paths", nargs="+", help="Files or folders to search")
+    parser.add_argument(
+        "--index",
+        help=f"Path of the incremental duplicate index (default: {DEFAULT_INDEX_FILE})",
+        default=DEFAULT_INDEX_FILE,
+    )
+    parser.add_argument(
+        "--min-size",
+        help="Smallest duplicate reported, in AST nodes",
+        type=int,
+        default=DEFAULT_MIN_SIZE,
+    )
+    parser.add_argument(
+        "--window",
+        help="Number of consecutive statements hashed together",
+        type=int,
+        default=DEFAULT_WINDOW,
+    )
+    args = parser.parse_args(argv)
+    if args.window < 1:
+        parser.error("--window must be at least 1")
+
+    paths = []
+    for input_path in args.input_paths:
+        if not os.path.exists(input_path):
+            parser.error(f"{input_path} is not a valid file or directory.")
+        paths.extend(find_ctl_files(input_path))
+
+    index = DuplicateIndex(args.index, args.min_size, args.window)
+    index.update(paths)
+    index.save()
+    for path, error in index.errors:
+        print(f"Error in {path}: {error}")
+
+    groups = index.clone_groups()
+    for group in groups:
+        print(group)
+        print()
+    print(
+        f"{len(groups)} clone groups in {len(paths)} files "
+        f"({index.hashed} hashed, {len(index.errors)} errors)"
+    )
 
 
 def display_statistics():
     """Display statistics about linting results."""
+    total_files = run_report.total
     if total_files == 0:
         print("No files were processed.")
         return
 
-    success_percentage = (files_successful / total_files) * 100
-    error_percentage = (files_with_errors / total_files) * 100
+    success_percentage = (run_report.successful / total_files) * 100
+    error_percentage = (run_report.errors / total_files) * 100
 
     print("\n--- Linting Results ---")
     print(f"Total files processed: {total_files}")
-    print(f"Files successful: {files_successful}")
-    print(f"Files with errors: {files_with_errors}")
+    print(f"Files successful: {run_report.successful}")
+    print(f"Files with errors: {run_report.errors}")
+    if run_report.budget_exceeded:
+        print(f"Files over budget: {run_report.budget_exceeded}")
     print(f"Success rate: {success_percentage:.2f}%")
     print(f"Error rate: {error_percentage:.2f}%")
+    if check_mode or diff_mode:
+        print(f"Files that would change: {run_report.changed}")
+    else:
+        print(f"Files changed: {run_report.changed}")
+
+
+def display_rule_statistics():
+    """Display the time spent in and the nodes inspected by each lint rule."""
+    print("\n--- Rule Statistics ---")
+    for rule_id, stats in run_report.rule_stats.items():
+        print(
+            f"{rule_id}: {stats.hits} nodes, {stats.diagnostics} diagnostics, "
+            f"{stats.seconds * 1000:.2f} ms"
+        )
+
+
+def display_timings(count):
+    """Display the wall and CPU time of each stage and the count slowest files."""
+    totals = run_report.stage_totals()
+    total_wall = sum(wall for wall, _ in totals.values())
+    print("\n--- Timings ---")
+    print(f"{'Stage':<10} {'Wall ms':>10} {'CPU ms':>10} {'Share':>7}")
+    for stage, (wall, cpu) in totals.items():
+        share = wall / total_wall * 100 if total_wall else 0.0
+        print(f"{stage:<10} {wall * 1000:>10.2f} {cpu * 1000:>10.2f} {share:>6.1f}%")
+    print(f"{'total':<10} {total_wall * 1000:>10.2f}")
+
+    print(f"\nSlowest {count} files:")
+    for result in run_report.slowest(count):
+        stages = ", ".join(
+            f"{stage} {seconds * 1000:.1f}" for stage, seconds in result.timings.items()
+        )
+        print(
+            f"{result.seconds * 1000:10.2f} ms {result.size:>10} bytes  "
+            f"{result.path} ({stages})"
+        )
+
+
+def trace_reported_allocations(count):
+    """Trace the allocation sites of the files display_memory reports.
+
+    Those are the count files peaking highest and the files over the
+    threshold. Files read from git or changed since are traced as they are
+    now on disk.
+    """
+    traced = set()
+    for result in run_report.largest(count) + run_report.memory_flagged:
+        if result.path in traced or not result.peak_memory:
+            continue
+        traced.add(result.path)
+        try:
+            result.memory_sites = trace_allocations(result.path)
+        except (Exception, TokenError):
+            # Gone or no longer parsing; its peak is still reported
+            pass
+
+
+def display_memory(count):
+    """Display the count files peaking highest and the files over the threshold."""
+
+    def display_sites(result):
+        for site, size, blocks in result.memory_sites:
+            print(f"{'':14}{size / 1024:10.1f} KB {blocks:>8} blocks  {site}")
+
+    print("\n--- Memory ---")
+    print(f"Largest {count} files by peak memory:")
+    for result in run_report.largest(count):
+        print(
+            f"{result.peak_memory / (1024 * 1024):10.2f} MB {result.size:>10} bytes  "
+            f"{result.path}"
+        )
+        display_sites(result)
+
+    if run_report.memory_threshold is not None:
+        flagged = run_report.memory_flagged
+        threshold = run_report.memory_threshold / (1024 * 1024)
+        print(f"\nFiles over {threshold:.2f} MB: {len(flagged)}")
+        for result in flagged:
+            print(f"{result.peak_memory / (1024 * 1024):10.2f} MB  {result.path}")
+            display_sites(result)
+
+
+def daemon_main(argv):
+    """The ``daemon`` command: serve lint requests on a Unix socket."""
+    from services.daemon import DEFAULT_TIMEOUT, LintDaemon
+    from services.daemon_client import default_socket_path
+
+    parser = argparse.ArgumentParser(
+        prog="ctllint daemon",
+        description=(
+            "Keep the linter warm and serve format and lint requests on a Unix "
+            "socket."
+        ),
+    )
+    parser.add_argument(
+        "--socket",
+        help=f"Path of the socket (default: {default_socket_path()})",
+        default=None,
+    )
+    parser.add_argument(
+        "-c",
+        "--config",
+        help="Path to the configuration file",
+        default=DEFAULT_CONFIG_FILE,
+    )
+    parser.add_argument(
+        "--timeout",
+        help=(
+            "Seconds a request may take to be formatted and linted before its worker "
+            "is killed"
+        ),
+        type=float,
+        default=DEFAULT_TIMEOUT,
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        daemon = LintDaemon(load_config(args.config), args.socket, timeout=args.timeout)
+    except (OSError, ValueError) as e:
+        parser.error(f"{args.config}: {e}")
+    print(f"Listening on {daemon.socket_path}")
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+def lsp_main(argv):
+    """The ``lsp`` command: Language Server Protocol server on stdin and stdout."""
+    from services.lsp import DEFAULT_DEBOUNCE, DEFAULT_TIMEOUT, LanguageServer
+
+    parser = argparse.ArgumentParser(
+        prog="ctllint lsp",
+        description=(
+            "Serve diagnostics, formatting and document symbols over the Language "
+            "Server Protocol on stdio."
+        ),
+    )
+    parser.add_argument(
+        "-c",
+        "--config",
+        help="Path to the configuration file",
+        default=DEFAULT_CONFIG_FILE,
+    )
+    parser.add_argument(
+        "--debounce",
+        help="Seconds without changes before a document is parsed for diagnostics",
+        type=float,
+        default=DEFAULT_DEBOUNCE,
+    )
+    parser.add_argument(
+        "--timeout",
+        help=(
+            "Seconds a document may take to be parsed, linted or formatted before its "
+            "worker is killed"
+        ),
+        type=float,
+        default=DEFAULT_TIMEOUT,
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        server = LanguageServer(
+            load_config(args.config),
+            sys.stdin.buffer,
+            sys.stdout.buffer,
+            args.debounce,
+            args.timeout,
+        )
+    except (OSError, ValueError) as e:
+        parser.error(f"{args.config}: {e}")
+    code = server.run()
+    sys.stdout.flush()
+    # The reader thread may still be blocked on stdin, which a normal exit would wait
+    # for
+    os._exit(code)
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "lsp":
+        lsp_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == "dupes":
+        dupes_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "daemon":
+        daemon_main(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "client":
+        from services.daemon_client import main as client_main
+
+        sys.exit(client_main(sys.argv[2:]))
+
     parser = argparse.ArgumentParser(description="Custom formatter for .ctl files.")
-    parser.add_argument("input_path", help="Path to the input file or folder")
+    parser.add_argument(
+        "input_path",
+        help=(
+            "Path to the input file or folder, - to format standard input to standard "
+            "output (default: the current folder)"
+        ),
+        nargs="?",
+        default=".",
+    )
     parser.add_argument(
         "-o",
         "--output_file",
@@ -107,29 +1004,492 @@ def main():
         default=None,
     )
 
+    parser.add_argument(
+        "--ast_format",
+        help=(
+            "Format of the AST file: one JSON document, or JSON Lines with one "
+            "top-level statement per line (default: from the file extension)"
+        ),
+        choices=AST_FORMATS,
+        default=None,
+    )
+    parser.add_argument(
+        "-c",
+        "--config",
+        help=(
+            f"Path to the configuration file (default: {DEFAULT_CONFIG_FILE}, searched "
+            "upwards from --stdin-filename)"
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--rule-stats",
+        help="Print the time spent in each lint rule",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--lines",
+        help=(
+            "Only format the top-level statements overlapping lines START:END (only "
+            "for single file, repeatable)"
+        ),
+        type=parse_line_range,
+        action="append",
+        default=None,
+    )
+    parser.add_argument(
+        "--diff-against",
+        help=(
+            "Only format the top-level statements overlapping hunks changed relative "
+            "to this git ref"
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help=(
+            "Directory of the persistent AST and results caches (disabled when not "
+            "given)"
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--cache-size",
+        help="Maximum size of the AST cache in megabytes",
+        type=int,
+        default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+    )
+
+    parser.add_argument(
+        "--check",
+        help=(
+            "Do not write files, exit with status 1 when any file would be "
+            "reformatted"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--diff",
+        help="Do not write files, print the changes as a unified diff instead",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help=(
+            "Number of files processed in parallel when processing a folder (default: "
+            "number of CPUs)"
+        ),
+        type=int,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--file-timeout",
+        metavar="SECONDS",
+        help=(
+            "Process every file in an isolated worker, killed when the file takes "
+            "longer than SECONDS; the file is reported as over budget"
+        ),
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "--file-memory",
+        metavar="MB",
+        help=(
+            "Process every file in an isolated worker, killed when its resident "
+            "memory grows by more than MB megabytes; the file is reported as over "
+            "budget (Linux only)"
+        ),
+        type=float,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--timings",
+        metavar="N",
+        help=(
+            "Print the wall and CPU time of each stage and the N slowest files "
+            "(default N: 10)"
+        ),
+        type=int,
+        nargs="?",
+        const=10,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--memory",
+        metavar="N",
+        help=(
+            "Trace memory with tracemalloc: print the N files with the highest peak, "
+            "with their top allocation sites, traced again after the run (default N: "
+            "10)"
+        ),
+        type=int,
+        nargs="?",
+        const=10,
+        default=None,
+    )
+    parser.add_argument(
+        "--memory-threshold",
+        metavar="MB",
+        help="With --memory, flag the files whose peak memory exceeds MB megabytes",
+        type=float,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--profile",
+        metavar="FILE.prof",
+        help=(
+            "Profile the run in a single process and write the pstats file and "
+            "FILE.prof.folded collapsed stacks (with cprofile, estimated from the "
+            "callers of each function)"
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--profile-top",
+        metavar="N",
+        help=(
+            "Profile the run in a single process and print the time per subsystem and "
+            "the N functions with the most own time"
+        ),
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--profiler",
+        help=(
+            "cprofile is exact but slows the code down, sampling is approximate but "
+            "barely slows it (default: cprofile)"
+        ),
+        choices=PROFILERS,
+        default=CPROFILE,
+    )
+
+    parser.add_argument(
+        "--walk-threads",
+        help="Number of threads listing folders ahead of processing (default: 1)",
+        type=int,
+        default=1,
+    )
+
+    parser.add_argument(
+        "--report",
+        help=(
+            "Write a JSON report with a record per file and the throughput and "
+            "latency of the run"
+        ),
+        default=None,
+    )
+
+    parser.add_argument(
+        "--diagnostics",
+        metavar="FILE",
+        help=(
+            "File receiving the errors and lint diagnostics of the run (default: "
+            f"{DEFAULT_DIAGNOSTICS_FILE})"
+        ),
+        default=DEFAULT_DIAGNOSTICS_FILE,
+    )
+    parser.add_argument(
+        "--diagnostics-format",
+        help=(
+            "Format of the diagnostics file (default: from the file extension, .jsonl "
+            "or .sarif, text otherwise)"
+        ),
+        choices=DIAGNOSTICS_FORMATS,
+        default=None,
+    )
+    parser.add_argument(
+        "--diagnostics-flush",
+        metavar="SECONDS",
+        help=(
+            "Write the diagnostics file every SECONDS while the run progresses "
+            "instead of once at the end"
+        ),
+        type=float,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--stdin-filename",
+        metavar="PATH",
+        help=(
+            "Path of the file read from standard input, used in messages and to find "
+            "its configuration"
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--stdin-diagnostics",
+        help=(
+            "How standard input mode prints diagnostics to standard error: text lines "
+            "or one JSON object (default: text)"
+        ),
+        choices=STDIN_DIAGNOSTICS_FORMATS,
+        default="text",
+    )
+
+    parser.add_argument(
+        "--watch",
+        metavar="DIR",
+        help=(
+            "Process the folder, then keep re-processing its .ctl files as they "
+            "change"
+        ),
+        default=None,
+    )
+
+    changed = parser.add_mutually_exclusive_group()
+    changed.add_argument(
+        "--changed-since",
+        metavar="REF",
+        help=(
+            "Only process the .ctl files that differ from this git ref, untracked "
+            "ones included"
+        ),
+        default=None,
+    )
+    changed.add_argument(
+        "--staged",
+        help=(
+            "Only process the .ctl files staged in git, reading their staged content; "
+            "nothing is written"
+        ),
+        action="store_true",
+    )
+
     args = parser.parse_args()
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.staged and args.diff_against is not None:
+        # The staged content is compared with HEAD, not with another revision
+        parser.error("--staged is not allowed with --diff-against")
+    if args.memory_threshold is not None:
+        if args.memory is None:
+            parser.error("--memory-threshold requires --memory")
+        run_report.memory_threshold = int(args.memory_threshold * 1024 * 1024)
+    profiling = args.profile is not None or args.profile_top is not None
+    if profiling:
+        if args.watch:
+            parser.error("--profile and --profile-top are not allowed with --watch")
+        # Worker processes would escape the profiler
+        args.jobs = 1
+    if args.file_timeout is not None or args.file_memory is not None:
+        if profiling or args.input_path == "-":
+            parser.error(
+                "--file-timeout and --file-memory are not allowed with -, --profile "
+                "and --profile-top"
+            )
+        if (args.file_timeout or 1) <= 0 or (args.file_memory or 1) <= 0:
+            parser.error("--file-timeout and --file-memory must be positive")
+        from services.isolation import Budget, resident_memory
+
+        if args.file_memory is not None and resident_memory(os.getpid()) is None:
+            parser.error(
+                "--file-memory needs /proc to measure the memory of the workers"
+            )
+        global file_budget
+        file_budget = Budget(
+            args.file_timeout,
+            (
+                int(args.file_memory * 1024 * 1024)
+                if args.file_memory is not None
+                else None
+            ),
+        )
+
+    config_file = args.config or DEFAULT_CONFIG_FILE
+    if args.input_path == "-" and args.stdin_filename and not args.config:
+        config_file = find_config(args.stdin_filename)
+
+    if args.cache_dir:
+        from services.cache import private_directory
+
+        try:
+            private_directory(args.cache_dir)
+        except OSError as e:
+            parser.error(str(e))
+
+    settings = {
+        "cache_dir": args.cache_dir,
+        "cache_size": args.cache_size * 1024 * 1024,
+        # Staged content cannot be written back, only checked
+        "check": args.check or (args.staged and not args.diff),
+        "diff": args.diff,
+        "timings": args.timings is not None,
+        "memory": args.memory is not None,
+    }
+    try:
+        settings["config"] = load_config(config_file)
+        configure(**settings)
+    except (OSError, ValueError) as e:
+        # An unreadable or malformed configuration, or an unknown rule id in it
+        parser.error(f"{config_file}: {e}")
 
-    # Clear previous error log
-    if os.path.exists(error_log_file):
-        os.remove(error_log_file)
+    if args.input_path == "-":
+        if (
+            args.output_file
+            or args.ast_file
+            or args.diff_against
+            or args.changed_since
+            or args.staged
+            or args.watch
+        ):
+            parser.error(
+                "-o, -a, --diff-against, --changed-since, --staged and --watch are "
+                "not allowed with -"
+            )
+        sys.exit(process_stdin(args.stdin_filename, args.lines, args.stdin_diagnostics))
+
+    global result_cache, diagnostics_settings
+    if args.cache_dir:
+        from services.result_cache import RESULTS_FILE, ResultCache, results_fingerprint
+
+        result_cache = ResultCache(
+            os.path.join(args.cache_dir, RESULTS_FILE),
+            results_fingerprint(settings["config"]),
+        )
+
+    # Clear previous diagnostics
+    if os.path.exists(args.diagnostics):
+        os.remove(args.diagnostics)
+    diagnostics_settings = (
+        args.diagnostics,
+        args.diagnostics_format,
+        args.diagnostics_flush,
+    )
+
+    profiler = None
+    if profiling:
+        from services.profiling import create_profiler
+
+        profiler = create_profiler(args.profiler)
+        profiler.enable()
 
     # Check if input_path is a file or a directory
-    if os.path.isfile(args.input_path):
+    if args.watch:
+        if (
+            args.output_file
+            or args.ast_file
+            or args.lines
+            or args.changed_since
+            or args.staged
+        ):
+            print(
+                "Error: -o, -a, --lines, --changed-since and --staged flags are not "
+                "allowed with --watch."
+            )
+            return
+        if not os.path.isdir(args.watch):
+            print(f"Error: {args.watch} is not a valid directory.")
+            return
+        watch_directory(args.watch, args.diff_against, args.jobs, settings)
+        return
+    elif args.changed_since or args.staged:
+        if args.output_file or args.ast_file or args.lines:
+            print(
+                "Error: -o, -a and --lines flags are not allowed with --changed-since "
+                "or --staged."
+            )
+            return
+        if not os.path.exists(args.input_path):
+            print(f"Error: {args.input_path} is not a valid file or directory.")
+            return
+        from services.git_ import GitError, changed_files, staged_files
+
+        directory = args.input_path
+        if os.path.isfile(args.input_path):
+            directory = os.path.dirname(args.input_path) or "."
+        try:
+            if args.staged:
+                paths = staged_files(directory)
+            else:
+                paths = changed_files(args.changed_since, directory)
+        except GitError as e:
+            print(f"Error: {e}")
+            return
+        if os.path.isfile(args.input_path):
+            paths = [path for path in paths if os.path.samefile(path, args.input_path)]
+        print(f"Processing {len(paths)} changed .ctl files in: {args.input_path}")
+        process_paths(paths, args.diff_against, args.jobs, settings, args.staged)
+    elif os.path.isfile(args.input_path):
         if args.output_file or args.ast_file:
             print("Processing a single file with optional -o and -a flags.")
-        process_file(args.input_path, args.output_file, args.ast_file)
+        whole_file = not (
+            args.output_file or args.ast_file or args.lines or args.diff_against
+        )
+        if whole_file and file_budget is not None:
+            # In an isolated worker, where the budget can be enforced
+            process_paths([args.input_path], jobs=1, settings=settings)
+        else:
+            result = cached_result(args.input_path) if whole_file else None
+            if result is None:
+                try:
+                    result = process_file(
+                        args.input_path,
+                        args.output_file,
+                        args.ast_file,
+                        args.ast_format,
+                        args.lines,
+                        args.diff_against,
+                    )
+                except Exception as e:
+                    result = failed_result(args.input_path, e)
+                if whole_file and result_cache is not None:
+                    result_cache.store(result)
+            record_result(result)
     elif os.path.isdir(args.input_path):
-        if args.output_file or args.ast_file:
-            print("Error: -o and -a flags are not allowed when processing a folder.")
+        if args.output_file or args.ast_file or args.lines:
+            print(
+                "Error: -o, -a and --lines flags are not allowed when processing a "
+                "folder."
+            )
             return
         print(f"Processing all .ctl files in directory: {args.input_path}")
-        process_directory(args.input_path)
+        process_directory(
+            args.input_path, args.diff_against, args.jobs, settings, args.walk_threads
+        )
     else:
         print(f"Error: {args.input_path} is not a valid file or directory.")
         return
 
+    if profiler is not None:
+        profiler.disable()
+    run_report.finish()
+    if args.memory is not None:
+        # After the run, so that the snapshots are not part of its timings
+        trace_reported_allocations(args.memory)
+    close_diagnostic_sink()
+    if result_cache is not None:
+        result_cache.save()
+    if args.report:
+        run_report.write(args.report)
+        print(f"Report saved to {args.report}")
+
     # Display linting statistics
     display_statistics()
+    if args.rule_stats:
+        display_rule_statistics()
+    if args.timings is not None:
+        display_timings(args.timings)
+    if args.memory is not None:
+        display_memory(args.memory)
+    if profiler is not None:
+        from services.profiling import print_summary
+
+        if args.profile:
+            print(f"Profile saved to {', '.join(profiler.write(args.profile))}")
+        print_summary(profiler.stats(), args.profile_top or 20)
+
+    if check_mode and run_report.changed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
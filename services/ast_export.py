@@ -0,0 +1,121 @@
+import json
+from enum import Enum
+from typing import Iterator, TextIO
+
+from entities.nodes import Node, ProgramNode
+from entities.token_ import Token
+from services.config import AST_FORMATS as FORMATS
+from services.config import AST_JSON as JSON
+from services.config import AST_JSON_LINES as JSON_LINES
+
+# Number of characters collected before they are handed to the file
+WRITE_BUFFER_SIZE = 64 * 1024
+
+
+class _Chunk(str):
+    """Already encoded JSON text, as opposed to a value still to be encoded."""
+
+
+_OPEN_OBJECT = _Chunk("{")
+_CLOSE_OBJECT = _Chunk("}")
+_OPEN_ARRAY = _Chunk("[")
+_CLOSE_ARRAY = _Chunk("]")
+_SEPARATOR = _Chunk(", ")
+
+
+def _fields(node: Node):
+    """Yield the (name, value) pairs exported for a node, skipping private ones."""
+    yield "node", type(node).__name__
+    for name, value in vars(node).items():
+        if not name.startswith("_"):
+            yield name, value
+
+
+def iter_json(root) -> Iterator[str]:
+    """Encode an AST (or any value found in one) as JSON, piece by piece.
+
+    The encoder keeps an explicit stack of pending values instead of
+    recursing, so arbitrarily deep trees can be exported and no string larger
+    than a single scalar is ever built.
+
+    Args:
+        root: The node to encode
+
+    Yields:
+        str: Consecutive pieces of the JSON document
+    """
+    stack = [root]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, _Chunk):
+            yield item
+        elif isinstance(item, Node):
+            pending = []
+            for name, value in _fields(item):
+                if pending:
+                    pending.append(_SEPARATOR)
+                pending.append(_Chunk(json.dumps(name) + ": "))
+                pending.append(value)
+            yield _OPEN_OBJECT
+            stack.append(_CLOSE_OBJECT)
+            stack.extend(reversed(pending))
+        elif isinstance(item, (list, tuple)):
+            yield _OPEN_ARRAY
+            stack.append(_CLOSE_ARRAY)
+            for index in range(len(item) - 1, -1, -1):
+                stack.append(item[index])
+                if index > 0:
+                    stack.append(_SEPARATOR)
+        elif isinstance(item, Token):
+            yield json.dumps(
+                {
+                    "token": item.kind.value,
+                    "value": item.value,
+                    "line": item.line,
+                    "column": item.column,
+                }
+            )
+        elif isinstance(item, Enum):
+            yield json.dumps(item.value)
+        elif item is None or isinstance(item, (str, int, float, bool)):
+            yield json.dumps(item)
+        else:
+            yield json.dumps(str(item))
+
+
+def export_ast(ast: ProgramNode, file: TextIO, fmt: str = JSON):
+    """Write the AST to an open text file.
+
+    Args:
+        ast (ProgramNode): The parsed program
+        file (TextIO): The destination
+        fmt (str, optional): JSON writes the whole program as one document,
+            JSON_LINES writes one top-level statement per line. Defaults to JSON.
+
+    Raises:
+        ValueError: When the format is unknown
+    """
+    if fmt == JSON:
+        documents = [ast]
+    elif fmt == JSON_LINES:
+        documents = ast.statements
+    else:
+        raise ValueError(f"Unknown AST export format '{fmt}'")
+
+    buffer = []
+    buffered = 0
+    for document in documents:
+        for piece in iter_json(document):
+            buffer.append(piece)
+            buffered += len(piece)
+            if buffered >= WRITE_BUFFER_SIZE:
+                file.write("".join(buffer))
+                buffer.clear()
+                buffered = 0
+        buffer.append("\n")
+    file.write("".join(buffer))
+
+
+def format_for_path(path: str) -> str:
+    """Guess the export format from the file extension."""
+    return JSON_LINES if path.endswith(".jsonl") else JSON
@@ -0,0 +1,187 @@
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+from functools import lru_cache
+
+from entities.nodes import ProgramNode
+from services.config import DEFAULT_CACHE_SIZE
+
+TOOL_VERSION = "0.1.0"
+
+# Modules whose source defines how text turns into an AST. Any change to them
+# changes the fingerprint and therefore invalidates every cached entry.
+GRAMMAR_MODULES = [
+    os.path.join("entities", "token_.py"),
+    os.path.join("entities", "nodes.py"),
+    os.path.join("services", "tokenizer.py"),
+    os.path.join("services", "parser_.py"),
+]
+
+
+@lru_cache(maxsize=None)
+def sources_fingerprint(modules: tuple) -> str:
+    """Hash of the tool version and the sources of the given modules.
+
+    The module paths are relative to the repository.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    digest = hashlib.sha256(TOOL_VERSION.encode())
+    for module in modules:
+        with open(os.path.join(root, module), "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def grammar_fingerprint() -> str:
+    """Hash of the tool version and the sources of the tokenizer, parser and nodes."""
+    return sources_fingerprint(tuple(GRAMMAR_MODULES))
+
+
+def private_directory(path):
+    """Create the directory for the current user only, or check an existing one is.
+
+    Cache entries are unpickled, so nobody else may be able to plant them.
+
+    Raises:
+        PermissionError: When the directory belongs to another user or others
+            can write to it
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if not hasattr(os, "getuid"):
+        return
+    info = os.stat(path)
+    if info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(
+            f"Cache directory {path} must belong to the current user and must not "
+            "be writable by others"
+        )
+
+
+class ASTCache:
+    """On-disk cache of parsed programs, addressed by the hash of their source.
+
+    Entries are pickled ProgramNodes stored under ``<cache_dir>/<2 hex>/<hash>.ast``.
+    The file modification time doubles as the last-use time: hits touch the
+    entry, and when the cache grows over ``max_bytes`` the least recently used
+    entries are removed.
+
+    Args:
+        cache_dir (str): Directory holding the cache, created when missing
+        max_bytes (int, optional): Size limit of the cache. Defaults to 256 MiB.
+
+    Raises:
+        PermissionError: When the cache directory is not private to the user
+    """
+
+    SUFFIX = ".ast"
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.__size = None  # Total size of the entries, computed on first store
+        private_directory(cache_dir)
+
+    def key(self, code: str) -> str:
+        """Cache key of a source text: its hash and the grammar fingerprint."""
+        digest = hashlib.sha256(grammar_fingerprint().encode())
+        digest.update(code.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + self.SUFFIX)
+
+    def load(self, code: str) -> ProgramNode | None:
+        """Return the cached AST of the source text, or None on a miss."""
+        path = self.__path(self.key(code))
+        try:
+            with open(path, "rb") as file:
+                ast = pickle.load(file)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (
+            pickle.UnpicklingError,
+            EOFError,
+            AttributeError,
+            ImportError,
+            ValueError,
+            TypeError,
+        ):
+            # Truncated or stale entry, drop it and parse again
+            self.__remove(path)
+            self.misses += 1
+            return None
+
+        # Mark the entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return ast
+
+    def store(self, code: str, ast: ProgramNode):
+        """Store the AST of the source text, evicting old entries over the limit."""
+        path = self.__path(self.key(code))
+        try:
+            data = pickle.dumps(ast, protocol=pickle.HIGHEST_PROTOCOL)
+        except (RecursionError, pickle.PicklingError):
+            # Extremely deep trees are not worth caching
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            # An entry stored again replaces the old one rather than adding to it
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            self.__remove(temp_path)
+            return
+
+        if self.__size is None:
+            self.__size = sum(size for _, size, _ in self.__entries())
+        else:
+            self.__size += len(data) - replaced
+        if self.__size > self.max_bytes:
+            self.evict()
+
+    def evict(self, target_ratio=0.9):
+        """Remove least recently used entries until below target_ratio of the limit."""
+        entries = sorted(self.__entries(), key=lambda entry: entry[2])
+        size = sum(entry_size for _, entry_size, _ in entries)
+        target = self.max_bytes * target_ratio
+        for path, entry_size, _ in entries:
+            if size <= target:
+                break
+            self.__remove(path)
+            size -= entry_size
+        self.__size = size
+
+    def __entries(self):
+        """Yield (path, size, mtime) of every cache entry."""
+        with os.scandir(self.cache_dir) as buckets:
+            for bucket in buckets:
+                if not bucket.is_dir():
+                    continue
+                with os.scandir(bucket.path) as files:
+                    for entry in files:
+                        if entry.name.endswith(self.SUFFIX):
+                            info = entry.stat()
+                            yield entry.path, info.st_size, info.st_mtime
+
+    @staticmethod
+    def __remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+
+DEFAULT_CONFIG_FILE = "config.json"
+
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024  # Maximum size of the AST cache, 256 MiB
+
+# The choices and defaults of some options are defined here, so that parsing
+# the options does not load the modules implementing them
+
+# Profilers of --profiler (see services.profiling)
+CPROFILE = "cprofile"
+SAMPLING = "sampling"
+PROFILERS = (CPROFILE, SAMPLING)
+
+# Formats of the AST file (see services.ast_export)
+AST_JSON = "json"
+AST_JSON_LINES = "jsonl"
+AST_FORMATS = [AST_JSON, AST_JSON_LINES]
+
+# Formats of the diagnostics file (see services.diagnostic_sink)
+DEFAULT_DIAGNOSTICS_FILE = "lint_errors.txt"
+DIAGNOSTICS_TEXT = "text"
+DIAGNOSTICS_JSONL = "jsonl"
+DIAGNOSTICS_SARIF = "sarif"
+DIAGNOSTICS_FORMATS = (DIAGNOSTICS_TEXT, DIAGNOSTICS_JSONL, DIAGNOSTICS_SARIF)
+
+
+def diagnostics_format_for_path(path: str) -> str:
+    """The diagnostics format matching the extension of a file name."""
+    if path.endswith(".jsonl"):
+        return DIAGNOSTICS_JSONL
+    if path.endswith((".sarif", ".sarif.json")):
+        return DIAGNOSTICS_SARIF
+    return DIAGNOSTICS_TEXT
+
+
+def parse_line_range(value):
+    """Parse a START:END argument into an inclusive (start, end) line number tuple."""
+    try:
+        start, end = (int(part) for part in value.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected START:END, got '{value}'")
+    if start < 1 or end < start:
+        raise argparse.ArgumentTypeError(f"Invalid line range '{value}'")
+    return start, end
+
+
+DEFAULT_CONFIG = {
+    "indent": 2,
+    # Reuse the formatted output of structurally equal subtrees (see Formatter)
+    "memoize_formatting": False,
+    # Maps rule ids to whether they are enabled. Rules missing here use their own
+    # default.
+    "rules": {},
+}
+
+
+def load_config(path=DEFAULT_CONFIG_FILE) -> dict:
+    """Load the linter configuration, filling in defaults for missing keys.
+
+    Args:
+        path (str, optional): Path to the JSON configuration file. Defaults to
+            config.json.
+
+    Raises:
+        ValueError: When the file exists but is not a JSON object
+
+    Returns:
+        dict: The configuration
+    """
+    config = {key: value for key, value in DEFAULT_CONFIG.items()}
+    if path is None or not os.path.exists(path):
+        return config
+
+    with open(path, "r") as file:
+        data = json.load(file)
+    if not isinstance(data, dict):
+        raise ValueError("The configuration must be a JSON object")
+
+    config.update(data)
+    return config
+
+
+def find_config(path: str) -> str:
+    """The configuration of a source file: the nearest config.json at or above it.
+
+    Args:
+        path (str): A source file, which does not have to exist
+
+    Returns:
+        str: The configuration file, DEFAULT_CONFIG_FILE (relative to the current
+            folder) when none is found
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    while True:
+        candidate = os.path.join(directory, DEFAULT_CONFIG_FILE)
+        if os.path.isfile(candidate):
+            return candidate
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return DEFAULT_CONFIG_FILE
+        directory = parent
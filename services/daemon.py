@@ -0,0 +1,248 @@
+import functools
+import hashlib
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+
+from entities.result import FileResult
+from entities.token_ import TokenError
+from services.config import load_config
+from services.daemon_client import default_socket_path, receive_message, send_message
+from services.formatter_ import Formatter
+from services.isolation import Budget, IsolatedPool
+from services.parser_ import Parser
+from services.rules import RuleEngine
+from services.tokenizer import Tokenizer
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TIMEOUT = 5.0  # Seconds a request may take to be formatted and linted
+
+
+def _line_ranges(value) -> list | None:
+    """Validate the lines of a lint request, a list of [start, end] pairs.
+
+    Raises:
+        ValueError: When a range is not two line numbers in order
+    """
+    if value is None:
+        return None
+    if not isinstance(value, list):
+        raise ValueError("The lines must be a list of [start, end] pairs")
+    line_ranges = []
+    for line_range in value:
+        if not (
+            isinstance(line_range, list)
+            and len(line_range) == 2
+            and all(type(line) is int for line in line_range)
+        ):
+            raise ValueError(
+                f"Invalid line range {line_range!r}, expected [start, end]"
+            )
+        start, end = line_range
+        if start < 1 or end < start:
+            raise ValueError(f"Invalid line range {start}:{end}")
+        line_ranges.append((start, end))
+    return line_ranges or None
+
+
+# State of the worker process, set by _start_worker
+_config = None
+_rule_engine = None
+
+
+def _start_worker(config: dict):
+    global _config, _rule_engine
+    _config = config
+    _rule_engine = RuleEngine.from_config(config)
+
+
+def _lint_in_worker(work: tuple, on_lap=None) -> dict:
+    """Format and lint (code, line ranges) in the worker process."""
+    code, line_ranges = work
+    try:
+        ast = Parser(Tokenizer(code).tokenize()).parse()
+        diagnostics = _rule_engine.run(ast, code)
+        formatter = Formatter(ast, memoize=_config["memoize_formatting"])
+        if line_ranges:
+            formatted = formatter.format_ranges(code, line_ranges)
+        else:
+            formatted = formatter.format()
+        return {
+            "formatted": formatted,
+            "diagnostics": [diagnostic.to_dict() for diagnostic in diagnostics],
+            "error": None,
+        }
+    except (SyntaxError, TokenError, RecursionError) as error:
+        return {"formatted": None, "diagnostics": [], "error": str(error)}
+    except Exception as error:
+        # The parser is not hardened against every malformed input: answer
+        # instead of dropping the connection
+        error = f"{type(error).__name__}: {error}"
+        return {"formatted": None, "diagnostics": [], "error": error}
+
+
+class LintDaemon:
+    """Formats and lints code sent over a Unix socket, keeping its state warm.
+
+    The rule engine and the tokenizer tables are built once, and the responses
+    for the most recent inputs are kept in an LRU, so formatting a file that
+    did not change since the last save costs a dictionary lookup.
+
+    Requests are served one at a time. The work runs in a warm worker process,
+    killed and replaced when a request takes more than ``timeout`` seconds, so
+    that a pathological input fails its request instead of blocking every
+    client behind it.
+
+    Requests and responses are the length-prefixed JSON messages of
+    services/daemon_client.py:
+
+    - ``{"command": "lint", "code": ..., "lines": [[start, end], ...]}`` answers
+      ``{"formatted": ..., "diagnostics": [...], "error": None}``
+    - ``{"command": "shutdown"}`` stops the daemon
+
+    Args:
+        config (dict): The linter configuration
+        socket_path (str, optional): Where to listen, see default_socket_path()
+        max_entries (int, optional): Number of responses kept in the LRU
+        timeout (float, optional): Time limit of one request
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        socket_path: str = None,
+        max_entries=DEFAULT_MAX_ENTRIES,
+        timeout=DEFAULT_TIMEOUT,
+    ):
+        self.config = config
+        self.socket_path = socket_path or default_socket_path()
+        self.max_entries = max_entries
+        self.timeout = timeout
+        # Checks the rule names, the worker builds its own engine
+        RuleEngine.from_config(config)
+        self.responses = OrderedDict()  # Key of the request -> response
+        self.requests = 0
+        self.hits = 0
+        self.__server = None
+        self.__pool = None
+
+    def lint(self, code: str, line_ranges=None) -> dict:
+        """Format and lint a source text, reusing the response to an identical one."""
+        key = hashlib.sha256(code.encode("utf-8", "surrogatepass"))
+        if line_ranges:
+            key.update(repr(line_ranges).encode())
+        key = key.digest()
+        response = self.responses.get(key)
+        if response is not None:
+            self.responses.move_to_end(key)
+            self.hits += 1
+            return response
+
+        response = self.__worker_pool().submit((code, line_ranges)).result()
+        if isinstance(response, FileResult):
+            # What the pool returns when the worker ran out of time or died; not
+            # kept, so the same input gets another chance later
+            return {"formatted": None, "diagnostics": [], "error": response.error}
+
+        self.responses[key] = response
+        if len(self.responses) > self.max_entries:
+            self.responses.popitem(last=False)
+        return response
+
+    def __worker_pool(self) -> IsolatedPool:
+        if self.__pool is None:
+            # Not forked: a fork could copy a lock held by another thread
+            self.__pool = IsolatedPool(
+                1,
+                Budget(seconds=self.timeout),
+                functools.partial(_start_worker, self.config),
+                _lint_in_worker,
+                start_method="spawn",
+            )
+        return self.__pool
+
+    def close(self):
+        """Stop the worker process."""
+        if self.__pool is not None:
+            self.__pool.shutdown()
+            self.__pool = None
+
+    def handle(self, message: dict) -> dict:
+        """Answer one request."""
+        self.requests += 1
+        command = message.get("command", "lint")
+        if command == "lint":
+            code = message.get("code")
+            if not isinstance(code, str):
+                return {"error": "A lint request needs the code as a string"}
+            try:
+                line_ranges = _line_ranges(message.get("lines"))
+            except ValueError as error:
+                return {"error": str(error)}
+            started = time.perf_counter()
+            response = dict(self.lint(code, line_ranges))
+            response["seconds"] = time.perf_counter() - started
+            return response
+        if command == "shutdown":
+            self.shutdown()
+            return {"error": None}
+        if command == "status":
+            return {
+                "error": None,
+                "requests": self.requests,
+                "hits": self.hits,
+                "entries": len(self.responses),
+            }
+        return {"error": f"Unknown command '{command}'"}
+
+    def __remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                os.unlink(self.socket_path)  # Left over by a daemon that died
+                return
+        raise OSError(f"A daemon is already listening on {self.socket_path}")
+
+    def serve_forever(self):
+        """Listen until a shutdown request or an interrupt."""
+        daemon = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                while True:
+                    try:
+                        message = receive_message(self.request)
+                    except (ValueError, OSError) as error:
+                        send_message(self.request, {"error": str(error)})
+                        return
+                    if message is None:
+                        return
+                    try:
+                        response = daemon.handle(message)
+                    except Exception as error:
+                        response = {"error": f"{type(error).__name__}: {error}"}
+                    send_message(self.request, response)
+
+        self.__remove_stale_socket()
+        self.__server = socketserver.UnixStreamServer(self.socket_path, Handler)
+        try:
+            os.chmod(self.socket_path, 0o600)
+            # Started before the first request, which should not wait for it
+            self.__worker_pool()
+            self.__server.serve_forever()
+        finally:
+            self.close()
+            self.__server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self):
+        # shutdown() waits for serve_forever(), which is running this request: stop
+        # from another thread
+        threading.Thread(target=self.__server.shutdown).start()
@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import socket
+import struct
+import sys
+
+from services.config import parse_line_range
+from services.files import write_atomic
+
+# Thin client of the lint daemon (services/daemon.py). Besides the standard
+# library it only imports services.config and services.files, which need
+# nothing else, so a call costs little more than the interpreter startup: run
+# it as `python -m services.daemon_client FILE` for the lowest latency.
+
+# Every message is a JSON object preceded by its length as a 4-byte big endian integer
+HEADER = struct.Struct(">I")
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+
+def default_socket_path() -> str:
+    directory = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(directory, f"ctllint-{os.getuid()}.sock")
+
+
+def _receive_exactly(connection: socket.socket, size: int) -> bytes | None:
+    chunks = []
+    while size:
+        chunk = connection.recv(min(size, 1024 * 1024))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def send_message(connection: socket.socket, message: dict):
+    data = json.dumps(message).encode("utf-8")
+    connection.sendall(HEADER.pack(len(data)) + data)
+
+
+def receive_message(connection: socket.socket) -> dict | None:
+    """Read one message, None when the peer closed the connection.
+
+    Raises:
+        ValueError: When the message is too large or not a JSON object
+    """
+    header = _receive_exactly(connection, HEADER.size)
+    if header is None:
+        return None
+    (size,) = HEADER.unpack(header)
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message of {size} bytes exceeds the limit")
+    data = _receive_exactly(connection, size)
+    if data is None:
+        return None
+    message = json.loads(data)
+    if not isinstance(message, dict):
+        raise ValueError("Message must be a JSON object")
+    return message
+
+
+def request(message: dict, socket_path: str = None) -> dict:
+    """Send a request to the daemon and return its response.
+
+    Raises:
+        OSError: When the daemon is not running
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path or default_socket_path())
+        send_message(connection, message)
+        response = receive_message(connection)
+    if response is None:
+        raise ConnectionError("The daemon closed the connection")
+    return response
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="ctllint client",
+        description=(
+            "Format a .ctl file and report its diagnostics through the lint daemon."
+        ),
+    )
+    parser.add_argument(
+        "input_file",
+        help="The file to format, - for standard input",
+        nargs="?",
+        default=None,
+    )
+    parser.add_argument("--socket", help="Path of the daemon socket", default=None)
+    parser.add_argument(
+        "--lines",
+        help=(
+            "Only format the top-level statements overlapping lines START:END "
+            "(repeatable)"
+        ),
+        action="append",
+        type=parse_line_range,
+        default=None,
+    )
+    parser.add_argument(
+        "-i",
+        "--in-place",
+        help="Write the formatted code back to the file instead of printing it",
+        action="store_true",
+    )
+    parser.add_argument("--shutdown", help="Stop the daemon", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.shutdown:
+        try:
+            request({"command": "shutdown"}, args.socket)
+        except OSError as error:
+            print(f"Error: cannot reach the lint daemon: {error}", file=sys.stderr)
+            return 2
+        return 0
+    if args.input_file is None:
+        parser.error("the following arguments are required: input_file")
+
+    if args.input_file == "-":
+        code = sys.stdin.read()
+    else:
+        with open(args.input_file, "r") as file:
+            code = file.read()
+    message = {"command": "lint", "path": args.input_file, "code": code}
+    if args.lines:
+        message["lines"] = [list(line_range) for line_range in args.lines]
+
+    try:
+        response = request(message, args.socket)
+    except OSError as error:
+        print(f"Error: cannot reach the lint daemon: {error}", file=sys.stderr)
+        return 2
+
+    for diagnostic in response.get("diagnostics", []):
+        location = (
+            f"{diagnostic['line']}:{diagnostic['column']}: "
+            if diagnostic.get("line")
+            else ""
+        )
+        rule, message = diagnostic["rule"], diagnostic["message"]
+        print(f"{args.input_file}:{location}[{rule}] {message}", file=sys.stderr)
+    if response.get("error"):
+        print(f"Error in {args.input_file}: {response['error']}", file=sys.stderr)
+        return 1
+
+    formatted = response["formatted"]
+    if args.in_place and args.input_file != "-":
+        if formatted != code:
+            write_atomic(args.input_file, formatted)
+    else:
+        sys.stdout.write(formatted)
+        if formatted and not formatted.endswith("\n"):
+            sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
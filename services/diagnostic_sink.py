@@ -0,0 +1,197 @@
+import json
+import os
+import re
+import time
+from typing import Dict, Iterator, List, Tuple
+
+from entities.diagnostic import Diagnostic
+from entities.result import BUDGET_EXCEEDED, ERROR, FileResult
+from services.config import DEFAULT_DIAGNOSTICS_FILE
+from services.config import DIAGNOSTICS_FORMATS as FORMATS
+from services.config import DIAGNOSTICS_JSONL as JSONL
+from services.config import DIAGNOSTICS_SARIF as SARIF
+from services.config import DIAGNOSTICS_TEXT as TEXT
+from services.config import diagnostics_format_for_path as format_for_path
+from services.files import write_atomic
+from services.rules import RULES
+
+SARIF_VERSION = "2.1.0"
+SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+SARIF_LEVELS = {"error": "error", "warning": "warning", "info": "note"}
+
+# Rule ids of the diagnostics reported for files that could not be parsed,
+# and for files stopped for running out of time or memory
+PARSE_ERROR_RULE = "parse-error"
+BUDGET_RULE = "budget-exceeded"
+
+# Descriptions of the rule ids that are not lint rules
+BUILTIN_RULES = {
+    PARSE_ERROR_RULE: "File could not be parsed",
+    BUDGET_RULE: "File exceeded its time or memory budget",
+}
+
+# Location in the message of a tokenizer or parser error
+ERROR_LOCATION = re.compile(r"line (\d+), column (\d+)")
+
+
+def error_diagnostic(message: str) -> Diagnostic:
+    """The diagnostic of a file that could not be processed."""
+    match = ERROR_LOCATION.search(message)
+    line, column = (int(match.group(1)), int(match.group(2))) if match else (None, None)
+    return Diagnostic(PARSE_ERROR_RULE, message.strip(), "error", line, column)
+
+
+def _flatten(records: Dict[str, List[Diagnostic]]) -> Iterator[Tuple[str, Diagnostic]]:
+    for path, diagnostics in records.items():
+        for diagnostic in diagnostics:
+            yield path, diagnostic
+
+
+class DiagnosticSink:
+    """Buffers the diagnostics and errors of a run and writes them to one file.
+
+    The results are added by the main process in path order, so the output
+    of parallel runs is never interleaved. The file is written once by
+    close(), or every flush_interval seconds in streaming mode. Text and JSON
+    Lines records are appended by each flush, while a SARIF log is a single
+    document that is rewritten as a whole. Adding a file again, as watch mode
+    does when it changes, replaces its records: the next flush then rewrites
+    the whole file in every format.
+
+    Args:
+        path (str): The output file
+        format (str, optional): TEXT, JSONL or SARIF, from the extension of path by
+            default
+        flush_interval (float, optional): Seconds between two flushes, None to write
+            once at the end
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_DIAGNOSTICS_FILE,
+        format: str = None,
+        flush_interval: float = None,
+    ):
+        self.path = path
+        self.format = format or format_for_path(path)
+        self.flush_interval = flush_interval
+        self.count = 0  # Records in the file after the last flush
+        # Path -> its records, in the order the paths were first added
+        self.__records: Dict[str, List[Diagnostic]] = {}
+        self.__pending: Dict[str, List[Diagnostic]] = {}  # Added since the last flush
+        self.__rewrite = False  # Records already written were replaced
+        self.__started = False
+        self.__last_flush = time.monotonic()
+
+    def add(self, result: FileResult):
+        records = []
+        if result.status == ERROR:
+            records.append(error_diagnostic(result.error or ""))
+        elif result.status == BUDGET_EXCEEDED:
+            records.append(Diagnostic(BUDGET_RULE, result.error or "", "error"))
+        records.extend(result.diagnostics)
+
+        path = result.path
+        if path in self.__records:
+            # Flushed records change: rewrite, keeping the file in path order
+            if path not in self.__pending and (records or self.__records[path]):
+                self.__rewrite = True
+        elif not records:
+            return  # Nothing to report or to replace
+        self.__records[path] = records
+        self.__pending[path] = records
+        if (
+            self.flush_interval is not None
+            and time.monotonic() - self.__last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """Write the records added since the last flush."""
+        self.__last_flush = time.monotonic()
+        pending = self.__pending
+        self.__pending = {}
+        self.count = sum(len(records) for records in self.__records.values())
+
+        if self.format == SARIF or self.__rewrite or not self.__started:
+            # A text log is only created when there is something to report
+            if self.format == TEXT and not self.__started and not self.count:
+                return
+            self.__rewrite = False
+            self.__started = True
+            write_atomic(self.path, self.__document(self.__records))
+            return
+        if any(pending.values()):
+            with open(self.path, "a") as file:
+                file.write(self.__document(pending))
+
+    def __document(self, records: Dict[str, List[Diagnostic]]) -> str:
+        if self.format == SARIF:
+            return json.dumps(self.__sarif(records), indent=1) + "\n"
+        if self.format == JSONL:
+            lines = [
+                json.dumps(dict(diagnostic.to_dict(), path=path))
+                for path, diagnostic in _flatten(records)
+            ]
+        else:
+            lines = [
+                self.__text(path, diagnostic) for path, diagnostic in _flatten(records)
+            ]
+        return "".join(line + "\n" for line in lines)
+
+    def close(self):
+        self.flush()
+
+    @staticmethod
+    def __text(path: str, diagnostic: Diagnostic) -> str:
+        location = f"{diagnostic.line}:{diagnostic.column}:" if diagnostic.line else ""
+        return (
+            f"{path}:{location} {diagnostic.severity}: "
+            f"[{diagnostic.rule}] {diagnostic.message}"
+        )
+
+    @staticmethod
+    def __sarif(records: Dict[str, List[Diagnostic]]) -> dict:
+        rule_ids = sorted({diagnostic.rule for _, diagnostic in _flatten(records)})
+        rule_indices = {rule_id: index for index, rule_id in enumerate(rule_ids)}
+        rules = []
+        for rule_id in rule_ids:
+            rule_class = RULES.get(rule_id)
+            description = (
+                rule_class.description
+                if rule_class
+                else BUILTIN_RULES.get(rule_id, rule_id)
+            )
+            rules.append({"id": rule_id, "shortDescription": {"text": description}})
+
+        results = []
+        for path, diagnostic in _flatten(records):
+            physical_location = {
+                "artifactLocation": {"uri": os.path.relpath(path).replace(os.sep, "/")}
+            }
+            if diagnostic.line:
+                physical_location["region"] = {
+                    "startLine": diagnostic.line,
+                    "startColumn": diagnostic.column or 1,
+                }
+            results.append(
+                {
+                    "ruleId": diagnostic.rule,
+                    "ruleIndex": rule_indices[diagnostic.rule],
+                    "level": SARIF_LEVELS.get(diagnostic.severity, "warning"),
+                    "message": {"text": diagnostic.message},
+                    "locations": [{"physicalLocation": physical_location}],
+                }
+            )
+
+        return {
+            "$schema": SARIF_SCHEMA,
+            "version": SARIF_VERSION,
+            "runs": [
+                {
+                    "tool": {"driver": {"name": "ctllint", "rules": rules}},
+                    "columnKind": "unicodeCodePoints",
+                    "results": results,
+                }
+            ],
+        }
@@ -0,0 +1,334 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+from entities.nodes import (
+    BlockNode,
+    CommentNode,
+    DividerNode,
+    FunctionDeclarationNode,
+    MultilineCommentNode,
+    NewLineNode,
+    ProgramNode,
+)
+from entities.token_ import TokenError
+from services.cache import grammar_fingerprint
+from services.hashing import compute_digests
+from services.parser_ import Parser
+from services.spans import LineIndex
+from services.tokenizer import Tokenizer
+from services.visitor import walk
+
+DEFAULT_INDEX_FILE = ".ctllint-dupes"
+INDEX_VERSION = 1
+
+DEFAULT_MIN_SIZE = 40  # Nodes
+DEFAULT_WINDOW = 4  # Statements
+
+FUNCTION = "function"
+WINDOW = "window"
+
+# Left out of the digests: copies differing only in comments and blank lines are clones
+IGNORED_TYPES = (CommentNode, MultilineCommentNode, DividerNode, NewLineNode)
+IGNORED_ATTRIBUTES = frozenset({"comment", "left_comment", "right_comment"})
+
+
+class Fragment(NamedTuple):
+    """A hashed piece of a file: a function body or a window of statements."""
+
+    digest: str
+    kind: str
+    size: int  # Nodes
+    first_line: int
+    last_line: int
+    name: str  # Function name, empty for windows
+    block: int  # Windows: number of the statement list in the file
+    index: int  # Windows: position of the first statement in that list
+    lead: int  # Windows: nodes in the first statement
+
+
+def find_fragments(
+    ast: ProgramNode, code: str, min_size=DEFAULT_MIN_SIZE, window=DEFAULT_WINDOW
+) -> List[Fragment]:
+    """Hash the function bodies and statement windows of a program.
+
+    Args:
+        ast (ProgramNode): The parsed program
+        code (str): Its source, used to compute line numbers
+        min_size (int, optional): Fragments with fewer nodes are not kept
+        window (int, optional): Number of consecutive statements in a window
+
+    Returns:
+        List[Fragment]: The fragments of at least min_size nodes
+    """
+    digests = compute_digests(ast, IGNORED_TYPES, IGNORED_ATTRIBUTES)
+    line_index = LineIndex(code)
+
+    def lines(first, last):
+        if first.span is None or last.span is None:
+            return 0, 0
+        first_line = line_index.position(first.span[0])[0]
+        last_line = line_index.position(max(last.span[1] - 1, last.span[0]))[0]
+        return first_line, last_line
+
+    fragments = []
+    block_number = 0
+    for node in walk(ast):
+        if isinstance(node, FunctionDeclarationNode):
+            if isinstance(node.block, BlockNode):
+                digest, size = digests[id(node.block)]
+                if size >= min_size:
+                    fragments.append(
+                        Fragment(
+                            digest,
+                            FUNCTION,
+                            size,
+                            *lines(node, node),
+                            node.identifier,
+                            0,
+                            0,
+                            0,
+                        )
+                    )
+        elif isinstance(node, (ProgramNode, BlockNode)):
+            statements = [
+                statement
+                for statement in node.statements
+                if not isinstance(statement, IGNORED_TYPES)
+            ]
+            for index in range(len(statements) - window + 1):
+                members = statements[index : index + window]
+                size = sum(digests[id(statement)][1] for statement in members)
+                if size < min_size:
+                    continue
+                digest = hashlib.blake2b(
+                    "".join(
+                        digests[id(statement)][0] for statement in members
+                    ).encode(),
+                    digest_size=16,
+                ).hexdigest()
+                lead = digests[id(members[0])][1]
+                fragments.append(
+                    Fragment(
+                        digest,
+                        WINDOW,
+                        size,
+                        *lines(members[0], members[-1]),
+                        "",
+                        block_number,
+                        index,
+                        lead,
+                    )
+                )
+            block_number += 1
+    return fragments
+
+
+class CloneGroup:
+    """Fragments with the same digest, found in several places."""
+
+    def __init__(self, kind: str, size: int, occurrences: List[Tuple[str, Fragment]]):
+        self.kind = kind
+        self.size = size
+        self.occurrences = occurrences  # (path, fragment), sorted
+
+    def __str__(self) -> str:
+        lines = [
+            f"{len(self.occurrences)} copies of a {self.kind} of {self.size} nodes:"
+        ]
+        for path, fragment in self.occurrences:
+            name = f" ({fragment.name})" if fragment.name else ""
+            lines.append(f"  {path}:{fragment.first_line}-{fragment.last_line}{name}")
+        return "\n".join(lines)
+
+
+class DuplicateIndex:
+    """On-disk index of the fragment digests of a set of files.
+
+    Every file is stored with the size and modification time it had when it
+    was hashed, so updating the index only reads and parses the files that
+    changed since. The index is tied to the grammar and to the fragment
+    settings; when either changes it starts over.
+
+    Args:
+        path (str): Location of the index file
+        min_size (int, optional): Smallest fragment kept, in nodes
+        window (int, optional): Number of consecutive statements in a window
+    """
+
+    def __init__(
+        self, path=DEFAULT_INDEX_FILE, min_size=DEFAULT_MIN_SIZE, window=DEFAULT_WINDOW
+    ):
+        self.path = path
+        self.min_size = min_size
+        self.window = window
+        # path -> (size, mtime_ns, fragments)
+        self.files: Dict[str, Tuple[int, int, List[Fragment]]] = {}
+        self.hashed = 0  # Files (re)hashed by the last update
+        self.errors: List[Tuple[str, Exception]] = []
+        self.__load()
+
+    def __header(self) -> tuple:
+        return (INDEX_VERSION, grammar_fingerprint(), self.min_size, self.window)
+
+    def __load(self):
+        try:
+            with open(self.path, "rb") as file:
+                header, files = pickle.load(file)
+        except FileNotFoundError:
+            return
+        except (
+            OSError,
+            pickle.UnpicklingError,
+            EOFError,
+            ValueError,
+            TypeError,
+            AttributeError,
+            ImportError,
+        ):
+            # Unreadable index, or one referring to classes that moved, rebuild it
+            return
+        if header == self.__header():
+            self.files = files
+
+    def save(self):
+        """Write the index atomically."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                pickle.dump(
+                    (self.__header(), self.files), file, pickle.HIGHEST_PROTOCOL
+                )
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def update(self, paths: Iterable[str]):
+        """Bring the index in line with the given files.
+
+        Files whose size and modification time are unchanged keep their
+        fragments, others are parsed again, and files no longer listed are
+        dropped. Files that fail to parse are recorded in ``errors`` and keep
+        no fragments.
+        """
+        self.hashed = 0
+        self.errors = []
+        files = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError as error:
+                self.errors.append((path, error))
+                continue
+            entry = self.files.get(path)
+            if (
+                entry is not None
+                and entry[0] == stat.st_size
+                and entry[1] == stat.st_mtime_ns
+            ):
+                files[path] = entry
+                continue
+
+            self.hashed += 1
+            fragments = []
+            try:
+                with open(path, "r") as file:
+                    code = file.read()
+                ast = Parser(Tokenizer(code).tokenize()).parse()
+                fragments = find_fragments(ast, code, self.min_size, self.window)
+            except (Exception, TokenError) as error:
+                # Besides SyntaxError, the parser fails on truncated code with
+                # IndexError or AttributeError; one bad file must not cost the
+                # index of the others
+                self.errors.append((path, error))
+            files[path] = (stat.st_size, stat.st_mtime_ns, fragments)
+        self.files = files
+
+    def clone_groups(self) -> List[CloneGroup]:
+        """Group identical fragments, largest first.
+
+        Consecutive windows found at the same positions in the same statement
+        lists are merged into one group spanning all of them, and windows
+        lying inside cloned functions are not reported again.
+
+        Returns:
+            List[CloneGroup]: Groups of at least two occurrences
+        """
+        by_digest: Dict[Tuple[str, str], List[Tuple[str, Fragment]]] = {}
+        for path, (_, _, fragments) in self.files.items():
+            for fragment in fragments:
+                by_digest.setdefault((fragment.kind, fragment.digest), []).append(
+                    (path, fragment)
+                )
+
+        groups = []
+        cloned_functions: Dict[str, List[Tuple[int, int]]] = {}
+        windows = {}  # occurrence positions -> occurrences
+        for (kind, _), occurrences in by_digest.items():
+            if len(occurrences) < 2:
+                continue
+            occurrences.sort()
+            if kind == FUNCTION:
+                groups.append(CloneGroup(FUNCTION, occurrences[0][1].size, occurrences))
+                for path, fragment in occurrences:
+                    cloned_functions.setdefault(path, []).append(
+                        (fragment.first_line, fragment.last_line)
+                    )
+            else:
+                positions = frozenset(
+                    (path, f.block, f.index) for path, f in occurrences
+                )
+                windows[positions] = occurrences
+
+        def shifted(positions, offset):
+            return frozenset(
+                (path, block, index + offset) for path, block, index in positions
+            )
+
+        def inside_cloned_function(path, fragment):
+            return any(
+                first <= fragment.first_line and fragment.last_line <= last
+                for first, last in cloned_functions.get(path, ())
+            )
+
+        for positions, occurrences in windows.items():
+            if shifted(positions, -1) in windows:
+                continue  # Continuation of a run starting earlier
+            # Follow the run: each further window adds its last statement
+            size = 0
+            # (path, block, index of the first window) -> last line of the run
+            last_lines = {}
+            run, step = positions, 0
+            while run in windows:
+                for path, fragment in windows[run]:
+                    last_lines[(path, fragment.block, fragment.index - step)] = (
+                        fragment.last_line
+                    )
+                final = windows[run][0][1]
+                size += final.lead
+                run, step = shifted(run, 1), step + 1
+            size += final.size - final.lead
+            merged = [
+                (
+                    path,
+                    fragment._replace(
+                        last_line=last_lines[(path, fragment.block, fragment.index)]
+                    ),
+                )
+                for path, fragment in occurrences
+            ]
+            if all(inside_cloned_function(path, fragment) for path, fragment in merged):
+                continue
+            groups.append(CloneGroup(WINDOW, size, merged))
+
+        groups.sort(
+            key=lambda group: (
+                -group.size * len(group.occurrences),
+                group.occurrences[0],
+            )
+        )
+        return groups
@@ -0,0 +1,62 @@
+import os
+import stat
+
+
+def write_atomic(path: str, text: str | bytes):
+    """Replace the content of a file without ever exposing a partial write.
+
+    The text goes to a temporary file in the same directory, which is then
+    renamed over the destination. The permissions of an existing file are kept.
+    A symbolic link is followed, so its target is written and the link is kept.
+    A file with several hard links is rewritten in place instead, as a rename
+    would detach it from its other names; that write is not atomic.
+
+    Args:
+        path (str): The file to write
+        text (str | bytes): Its new content, bytes are written as they are
+    """
+    # Imported here as runs that write nothing do not need it
+    import tempfile
+
+    mode = "wb" if isinstance(text, bytes) else "w"
+    path = os.path.realpath(path)
+    try:
+        existing = os.stat(path)
+    except FileNotFoundError:
+        existing = None
+    if existing is not None and existing.st_nlink > 1:
+        with open(path, mode) as file:
+            file.write(text)
+        return
+
+    directory = os.path.dirname(path)
+    descriptor, temporary = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(descriptor, mode) as file:
+            file.write(text)
+        if existing is not None:
+            os.chmod(temporary, stat.S_IMODE(existing.st_mode))
+        else:
+            os.chmod(temporary, 0o666 & ~_umask())
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+        raise
+
+
+def _umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+def read_text(path: str) -> str | None:
+    """Return the content of a file, or None when it does not exist."""
+    try:
+        with open(path, "r") as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
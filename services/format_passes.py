@@ -0,0 +1,130 @@
+from typing import Dict, Iterable, List
+
+from entities.nodes import (
+    BlockNode,
+    ClassDeclarationNode,
+    FunctionDeclarationNode,
+    NewLineNode,
+    Node,
+    ProgramNode,
+    StructDeclarationNode,
+)
+from services.visitor import walk
+
+# Nodes owning a list of statements, rebuilt by the pipeline
+STATEMENT_CONTAINERS = (ProgramNode, BlockNode)
+
+
+class FormatPass:
+    """Base class of AST-to-AST formatting passes.
+
+    A pass subscribes to the statement classes listed in ``node_types``. For
+    every such statement of every statement list in the tree, ``rewrite``
+    yields the nodes replacing it (the statement itself, more nodes, or
+    nothing). The nodes yielded by a pass go through the passes after it.
+    """
+
+    node_types = ()
+
+    def rewrite(self, statement: Node, output: List[Node]) -> Iterable[Node]:
+        """Yield the replacement of a statement.
+
+        Args:
+            statement (Node): The statement to rewrite
+            output (List[Node]): The new statement list built so far
+        """
+        yield statement
+
+    def finish(self, container: Node, output: List[Node]):
+        """Called with the complete new statement list of a container."""
+
+
+class BlankLinesAroundDeclarations(FormatPass):
+    """Surround function, class and struct declarations with blank lines."""
+
+    node_types = (FunctionDeclarationNode, ClassDeclarationNode, StructDeclarationNode)
+
+    def __init__(self):
+        self.trailing = None
+
+    def rewrite(self, statement, output):
+        if output and not isinstance(output[-1], NewLineNode):
+            yield NewLineNode()
+        yield statement
+        self.trailing = NewLineNode()
+        yield self.trailing
+
+    def finish(self, container, output):
+        # A blank line before the closing brace of a block is not wanted
+        if isinstance(container, BlockNode) and output and output[-1] is self.trailing:
+            output.pop()
+        self.trailing = None
+
+
+class CollapseBlankLines(FormatPass):
+    """Keep at most one blank line between statements."""
+
+    node_types = (NewLineNode,)
+
+    def rewrite(self, statement, output):
+        if not (output and isinstance(output[-1], NewLineNode)):
+            yield statement
+
+
+DEFAULT_PASSES = (BlankLinesAroundDeclarations, CollapseBlankLines)
+
+
+class PassPipeline:
+    """Runs formatting passes over a tree in a single traversal.
+
+    Each statement list is rebuilt once, with every statement routed through
+    the passes subscribed to its class, in pipeline order. Statement classes
+    are mapped to their passes once, so statements no pass subscribes to are
+    copied with a single dictionary lookup.
+
+    Args:
+        passes (List[FormatPass]): The pass instances, in the order they apply
+    """
+
+    def __init__(self, passes: List[FormatPass]):
+        self.passes = passes
+        self.__dispatch: Dict[type, List[int]] = {}
+
+    @classmethod
+    def default(cls) -> "PassPipeline":
+        return cls([pass_class() for pass_class in DEFAULT_PASSES])
+
+    def __positions(self, node_class: type) -> List[int]:
+        positions = self.__dispatch.get(node_class)
+        if positions is None:
+            positions = [
+                position
+                for position, format_pass in enumerate(self.passes)
+                if issubclass(node_class, format_pass.node_types)
+            ]
+            self.__dispatch[node_class] = positions
+        return positions
+
+    def __emit(self, statement: Node, first: int, output: List[Node]):
+        for position in self.__positions(type(statement)):
+            if position < first:
+                continue
+            for produced in self.passes[position].rewrite(statement, output):
+                self.__emit(produced, position + 1, output)
+            return
+        output.append(statement)
+
+    def run(self, root: Node):
+        """Rewrite the statement lists of the tree, nested blocks included.
+
+        The lists are replaced by new ones; the statements themselves are kept.
+        """
+        for node in walk(root):
+            if not isinstance(node, STATEMENT_CONTAINERS):
+                continue
+            output = []
+            for statement in node.statements:
+                self.__emit(statement, 0, output)
+            for format_pass in self.passes:
+                format_pass.finish(node, output)
+            node.statements = output
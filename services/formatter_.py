@@ -1,31 +1,91 @@
-from entities.nodes import (
-    ClassDeclarationNode,
-    FunctionCallNode,
-    FunctionDeclarationNode,
-    NewLineNode,
-    ProgramNode,
-    StructDeclarationNode,
-)
+from typing import List, Tuple
+
+from entities.nodes import NewLineNode, ProgramNode, format_memo
+from services.format_passes import PassPipeline
+from services.hashing import compute_hashes, interned_count, reset_hashes
+from services.spans import LineIndex
+
+# Number of memoized format() results (and interned hashes) kept before both are reset
+FORMAT_MEMO_LIMIT = 100_000
 
 
 class Formatter:
-    def __init__(self, programNode: ProgramNode):
+    # Shared by all formatters of a run, so code copied between files is formatted once
+    memo = {}
+
+    def __init__(
+        self,
+        programNode: ProgramNode,
+        memoize: bool = False,
+        pipeline: PassPipeline = None,
+    ):
+        """
+        :param programNode: The program to format
+        :param memoize: Reuse the output of structurally equal subtrees. Hashing
+                        the tree costs more than formatting small nodes, so this
+                        only pays off for large duplicated subtrees.
+        :param pipeline: The passes rewriting the tree before it is printed,
+                         defaults to PassPipeline.default()
+        """
         self.programNode = programNode
+        self.memoize = memoize
+        self.pipeline = pipeline if pipeline is not None else PassPipeline.default()
 
     def format(self):
-        self.__add_empty_lines_before_and_after()
-        return self.programNode.format()
-
-    def __add_empty_lines_before_and_after(self):
-        nodes = [FunctionDeclarationNode, ClassDeclarationNode, StructDeclarationNode]
-
-        # Go trhoug all nodes, and add NewLineNodes before and after each node in the list above
-        i = 0
-        while i < len(self.programNode.statements):
-            if type(self.programNode.statements[i]) in nodes:
-                self.programNode.statements.insert(i, NewLineNode())
-                i += 1  # Skip the newly added NewLineNode
-                self.programNode.statements.insert(i + 1, NewLineNode())
-                i += 1  # Skip the newly added NewLineNode
-                i += 1
-            i += 1
+        self.pipeline.run(self.programNode)
+        if not self.memoize:
+            return self.programNode.format()
+        return self.__format_memoized(self.programNode)
+
+    def __format_memoized(self, node):
+        if (
+            len(Formatter.memo) > FORMAT_MEMO_LIMIT
+            or interned_count() > FORMAT_MEMO_LIMIT
+        ):
+            Formatter.memo.clear()
+            reset_hashes()
+        # Hash after the tree is modified, the hashes key the format() memo
+        compute_hashes(node)
+        with format_memo(Formatter.memo):
+            return node.format()
+
+    def format_ranges(self, code: str, line_ranges: List[Tuple[int, int]]) -> str:
+        """Format only the top-level statements overlapping the given lines.
+
+        Every character outside the reformatted statements is kept as it is
+        in the source, including the whitespace between statements.
+
+        Args:
+            code (str): The source the program was parsed from
+            line_ranges (List[Tuple[int, int]]): Inclusive, 1-based (start, end) line
+                ranges
+
+        Returns:
+            str: The source with the selected statements reformatted
+        """
+        line_index = LineIndex(code)
+        offset_ranges = [
+            (line_index.offset(start), line_index.offset(end + 1))
+            for start, end in line_ranges
+        ]
+
+        pieces = []
+        position = 0
+        for statement in self.programNode.statements:
+            if isinstance(statement, NewLineNode) or statement.span is None:
+                continue
+            start, end = statement.span
+            if not any(
+                start < range_end and range_start < end
+                for range_start, range_end in offset_ranges
+            ):
+                continue
+            pieces.append(code[position:start])
+            self.pipeline.run(statement)
+            if self.memoize:
+                pieces.append(self.__format_memoized(statement))
+            else:
+                pieces.append(statement.format())
+            position = end
+        pieces.append(code[position:])
+        return "".join(pieces)
@@ -0,0 +1,150 @@
+import os
+import re
+from typing import List, Tuple
+
+# Header of a hunk in a unified diff:
+# @@ -old_start[,old_count] +new_start[,new_count] @@
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@", re.M)
+
+
+class GitError(Exception):
+    pass
+
+
+def run_git(args: List[str], cwd: str = None) -> str:
+    """Run a git command and return its standard output.
+
+    Raises:
+        GitError: When git is missing or the command fails
+    """
+    # Imported here as most runs never call git
+    import subprocess
+
+    try:
+        result = subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True)
+    except FileNotFoundError:
+        raise GitError("git executable not found")
+    if result.returncode != 0:
+        raise GitError(result.stderr.strip() or f"git {' '.join(args)} failed")
+    return result.stdout
+
+
+def is_tracked(path: str) -> bool:
+    directory, name = os.path.split(os.path.abspath(path))
+    try:
+        run_git(["ls-files", "--error-unmatch", "--", name], cwd=directory)
+    except GitError:
+        return False
+    return True
+
+
+def changed_line_ranges(path: str, ref: str) -> List[Tuple[int, int]]:
+    """Lines of the working tree file that differ from the given git ref.
+
+    Files unknown to git are considered changed as a whole.
+
+    Args:
+        path (str): The file to compare
+        ref (str): Any git revision (branch, tag, commit)
+
+    Raises:
+        GitError: When git fails, e.g. because the ref does not exist
+
+    Returns:
+        List[Tuple[int, int]]: Inclusive, 1-based (start, end) line ranges
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    if not is_tracked(path):
+        with open(path, "r") as file:
+            line_count = file.read().count("\n") + 1
+        return [(1, line_count)]
+
+    diff = run_git(
+        ["diff", "--no-color", "--no-ext-diff", "-U0", ref, "--", name], cwd=directory
+    )
+    ranges = []
+    for match in HUNK_HEADER.finditer(diff):
+        start = int(match.group(1))
+        count = int(match.group(2)) if match.group(2) is not None else 1
+        if count == 0:
+            # Pure deletion after line `start`, touch the statement around it
+            ranges.append((max(start, 1), max(start, 1)))
+        else:
+            ranges.append((start, start + count - 1))
+    return ranges
+
+
+def _ctl_paths(output: str, top_level: str, directory: str) -> List[str]:
+    # git prints paths relative to the top level, NUL separated with -z. The top
+    # level has its symbolic links resolved, so the directory is compared resolved
+    # too, and the paths are given back under the directory as it was spelled.
+    top_level = os.path.realpath(top_level)
+    under = os.path.realpath(directory)
+    paths = set()
+    for name in output.split("\0"):
+        if not name.endswith(".ctl"):
+            continue
+        path = os.path.join(top_level, os.path.normpath(name))
+        if os.path.commonpath([under, path]) == under:
+            paths.add(
+                os.path.relpath(os.path.join(directory, os.path.relpath(path, under)))
+            )
+    return sorted(paths)
+
+
+def changed_files(ref: str, directory: str = ".") -> List[str]:
+    """The .ctl files under a directory that differ from a git ref.
+
+    Modified, added, renamed and untracked (but not ignored) files are
+    listed; deleted files are not.
+
+    Raises:
+        GitError: When git fails, e.g. because the ref does not exist
+
+    Returns:
+        List[str]: Sorted paths relative to the current directory
+    """
+    top_level = run_git(["rev-parse", "--show-toplevel"], cwd=directory).strip()
+    changed = run_git(
+        ["diff", "--name-only", "-z", "--no-renames", "--diff-filter=d", ref, "--"],
+        cwd=top_level,
+    )
+    untracked = run_git(
+        ["ls-files", "-z", "--others", "--exclude-standard", "--"], cwd=top_level
+    )
+    return _ctl_paths(changed + "\0" + untracked, top_level, directory)
+
+
+def staged_files(directory: str = ".") -> List[str]:
+    """The .ctl files under a directory whose staged content differs from HEAD.
+
+    Raises:
+        GitError: When git fails
+
+    Returns:
+        List[str]: Sorted paths relative to the current directory
+    """
+    top_level = run_git(["rev-parse", "--show-toplevel"], cwd=directory).strip()
+    staged = run_git(
+        [
+            "diff",
+            "--cached",
+            "--name-only",
+            "-z",
+            "--no-renames",
+            "--diff-filter=d",
+            "--",
+        ],
+        cwd=top_level,
+    )
+    return _ctl_paths(staged, top_level, directory)
+
+
+def read_staged(path: str) -> str:
+    """Return the content of a file as staged in the index.
+
+    Raises:
+        GitError: When the file is not in the index
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    return run_git(["show", f":./{name}"], cwd=directory)
@@ -0,0 +1,146 @@
+from enum import Enum
+
+from entities.nodes import Node
+from entities.token_ import Token
+from services.visitor import POST_ORDER, iter_child_nodes, walk
+
+HASH_ATTRIBUTE = "_structural_hash"
+
+# Size in bytes of the stable digests computed by compute_digests
+DIGEST_SIZE = 16
+
+# Attributes that describe where a node is, not what it is
+LOCATION_ATTRIBUTES = frozenset({"span"})
+
+# Interning table: structural key of a node -> its id. Structurally equal
+# nodes map to the same key, so ids are exact (no collisions) for the lifetime
+# of the table.
+_interned = {}
+
+
+def _key(value):
+    if isinstance(value, Node):
+        return value.__dict__[HASH_ATTRIBUTE]
+    if isinstance(value, (list, tuple)):
+        return tuple(_key(item) for item in value)
+    if isinstance(value, Token):
+        return value.value
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def compute_hashes(root: Node):
+    """Compute the structural hash of every node of a tree, bottom-up.
+
+    Two nodes get the same hash when they have the same class, the same
+    attribute values and structurally equal children; source spans are not
+    taken into account. Hashes are small integers interned for the whole run,
+    stored on each node under HASH_ATTRIBUTE, and must be recomputed after the
+    tree is modified.
+
+    Args:
+        root (Node): The root of the tree
+    """
+    interned = _interned
+    for node in walk(root, POST_ORDER):
+        key = [type(node)]
+        for name, value in node.__dict__.items():
+            if name[0] == "_" or name in LOCATION_ATTRIBUTES:
+                continue
+            if isinstance(value, (Node, list, tuple, Token, Enum)):
+                value = _key(value)
+            key.append(value)
+        key = tuple(key)
+        structural_hash = interned.get(key)
+        if structural_hash is None:
+            structural_hash = interned[key] = len(interned)
+        node.__dict__[HASH_ATTRIBUTE] = structural_hash
+
+
+def reset_hashes():
+    """Forget all interned hashes. Hashes computed before are no longer comparable."""
+    _interned.clear()
+
+
+def interned_count() -> int:
+    return len(_interned)
+
+
+def structural_hash(node: Node) -> int:
+    """Return the structural hash of a node, hashing its subtree first if needed."""
+    value = node.__dict__.get(HASH_ATTRIBUTE)
+    if value is None:
+        compute_hashes(node)
+        value = node.__dict__[HASH_ATTRIBUTE]
+    return value
+
+
+def structurally_equal(first: Node, second: Node) -> bool:
+    """Whether two subtrees are the same code, regardless of where they appear."""
+    return structural_hash(first) == structural_hash(second)
+
+
+def _digest_part(value, digests, ignore_types) -> str:
+    if isinstance(value, Node):
+        if isinstance(value, ignore_types):
+            return "-"
+        return digests[id(value)][0]
+    if isinstance(value, (list, tuple)):
+        parts = [
+            _digest_part(item, digests, ignore_types)
+            for item in value
+            if not isinstance(item, ignore_types)
+        ]
+        return "[" + ",".join(parts) + "]"
+    if isinstance(value, Token):
+        return repr(value.value)
+    if isinstance(value, Enum):
+        return repr(value.value)
+    return repr(value)
+
+
+def compute_digests(
+    root: Node, ignore_types: tuple = (), ignore_attributes=frozenset()
+) -> dict:
+    """Compute stable content digests of every node of a tree, bottom-up.
+
+    Unlike compute_hashes, the digests only depend on the code, so they can be
+    stored and compared between runs. Nodes of the ignored types are left out
+    of their parents (as if they were not in the source), and so are the
+    ignored attributes, which allows digests that disregard comments or blank
+    lines.
+
+    Args:
+        root (Node): The root of the tree
+        ignore_types (tuple, optional): Node classes to leave out
+        ignore_attributes (set, optional): Attribute names to leave out
+
+    Returns:
+        dict: id(node) -> (hex digest, size), where size counts the nodes of the
+            subtree that are not ignored
+    """
+    # Imported here as only the duplicate finder needs digests
+    import hashlib
+
+    digests = {}
+    for node in walk(root, POST_ORDER):
+        parts = [type(node).__name__]
+        size = 1
+        for name, value in node.__dict__.items():
+            if (
+                name[0] == "_"
+                or name in LOCATION_ATTRIBUTES
+                or name in ignore_attributes
+            ):
+                continue
+            parts.append(name)
+            parts.append(_digest_part(value, digests, ignore_types))
+        for child in iter_child_nodes(node):
+            if not isinstance(child, ignore_types):
+                size += digests[id(child)][1]
+        digest = hashlib.blake2b(
+            "\0".join(parts).encode("utf-8", "surrogatepass"), digest_size=DIGEST_SIZE
+        )
+        digests[id(node)] = (digest.hexdigest(), size)
+    return digests
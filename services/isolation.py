@@ -0,0 +1,291 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+from typing import Callable, Dict, List
+
+from entities.result import BUDGET_EXCEEDED, ERROR, FileResult
+
+POLL_INTERVAL = 0.02  # Seconds between two checks of the files being processed
+STOP_TIMEOUT = 1.0  # Seconds an idle worker is given to exit at shutdown
+
+# Stage charged with the time between the last completed stage and the kill
+UNFINISHED_STAGE = "unfinished"
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def resident_memory(pid: int) -> int | None:
+    """Resident set size of a process in bytes, None where /proc is not available."""
+    try:
+        with open(f"/proc/{pid}/statm", "rb") as file:
+            return int(file.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Budget:
+    """Limits on the processing of one file.
+
+    Args:
+        seconds (float, optional): Wall time limit
+        memory (int, optional): Limit in bytes on the growth of the worker's resident
+            memory
+    """
+
+    def __init__(self, seconds: float = None, memory: int = None):
+        self.seconds = seconds
+        self.memory = memory
+
+    def __repr__(self) -> str:
+        return f"Budget(seconds={self.seconds}, memory={self.memory})"
+
+
+def _work(connection, initializer: Callable, process: Callable):
+    """Main loop of a worker: process the paths received one at a time."""
+    initializer()
+
+    def on_lap(stage, seconds):
+        connection.send(("lap", stage, seconds))
+
+    connection.send(("ready",))
+    while True:
+        try:
+            path = connection.recv()
+        except EOFError:
+            return  # The parent exited without stopping the worker
+        if path is None:
+            return
+        try:
+            result = process(path, on_lap=on_lap)
+        except Exception as e:
+            connection.send(("failed", f"{type(e).__name__}: {e}"))
+            continue
+        connection.send(("done", result))
+
+
+class _Worker:
+    """A worker process and the file it is processing."""
+
+    def __init__(self, context, initializer: Callable, process: Callable):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(
+            target=_work, args=(child, initializer, process), daemon=True
+        )
+        self.process.start()
+        # Only the worker holds the other end, so its exit is seen as the end of the
+        # pipe
+        child.close()
+        self.ready = False
+        self.path = None
+        self.future = None
+        self.started = 0.0
+        self.last_lap = 0.0
+        self.timings: Dict[str, float] = {}
+        self.memory_start = 0
+
+    def start(self, path: str, future: Future):
+        self.path = path
+        self.future = future
+        self.started = self.last_lap = time.perf_counter()
+        self.timings = {}
+        self.memory_start = resident_memory(self.process.pid) or 0
+        self.connection.send(path)
+
+    def finish(self, result: FileResult):
+        future = self.future
+        self.path = None
+        self.future = None
+        future.set_result(result)
+
+    def partial_result(self, status: str, error: str) -> FileResult:
+        """The result of the file being processed, timing its completed stages."""
+        result = FileResult(self.path, status, error=error)
+        result.timings = dict(self.timings)
+        result.timings[UNFINISHED_STAGE] = time.perf_counter() - self.last_lap
+        return result
+
+    def stop(self):
+        """Let an idle worker exit, kill a busy or unresponsive one."""
+        if self.future is None:
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+            self.process.join(STOP_TIMEOUT)
+        self.kill()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+class IsolatedPool:
+    """Processes files in worker processes, killed when a file exceeds its budget.
+
+    Unlike in a ProcessPoolExecutor, a worker only ever holds one file, so
+    killing it loses nothing but that file. A supervising thread hands the
+    files to idle workers, follows their stages as they complete and enforces
+    the budget: the worker of a file that runs out of time or memory is
+    killed and replaced, and the file gets a BUDGET_EXCEEDED result with the
+    timings of the stages it completed. Memory is checked every
+    POLL_INTERVAL, so a file can briefly go over its memory budget.
+
+    Args:
+        workers (int): Number of worker processes
+        budget (Budget): The limits of each file
+        initializer (Callable): Run once by every worker before its first file
+        process (Callable): Called by the workers with a path and an on_lap keyword
+            argument, the callback of each completed stage; returns a FileResult.
+            Any picklable item can be submitted in place of a path, the pool
+            only gives it to process: failed items then still get a FileResult
+        start_method (str, optional): How the workers are started, see
+            multiprocessing.get_context(); "spawn" for a process with threads that
+            hold locks, like a reader of standard input
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        budget: Budget,
+        initializer: Callable,
+        process: Callable,
+        start_method: str = None,
+    ):
+        self.budget = budget
+        self.__initializer = initializer
+        self.__process = process
+        self.__context = multiprocessing.get_context(start_method)
+        self.__workers: List[_Worker] = [self.__spawn() for _ in range(workers)]
+        self.__pending = deque()  # (path, Future) not handed to a worker yet
+        self.__lock = threading.Lock()
+        self.__closed = False
+        self.__error = None  # Why the pool stopped by itself
+        self.__thread = threading.Thread(target=self.__supervise, daemon=True)
+        self.__thread.start()
+
+    def __spawn(self) -> _Worker:
+        return _Worker(self.__context, self.__initializer, self.__process)
+
+    def submit(self, path: str) -> Future:
+        """Queue a file, return the Future of its FileResult."""
+        future = Future()
+        with self.__lock:
+            if self.__error is not None:
+                future.set_exception(self.__error)
+            elif self.__closed:
+                raise RuntimeError("The pool is shut down")
+            else:
+                self.__pending.append((path, future))
+        return future
+
+    def shutdown(self):
+        """Stop the workers, cancelling the files without a result yet."""
+        with self.__lock:
+            self.__closed = True
+            while self.__pending:
+                self.__pending.popleft()[1].cancel()
+        self.__thread.join()
+
+    def __supervise(self):
+        try:
+            while True:
+                with self.__lock:
+                    if self.__closed:
+                        break
+                    for worker in self.__workers:
+                        if self.__pending and worker.ready and worker.future is None:
+                            worker.start(*self.__pending.popleft())
+
+                for connection in wait(
+                    [worker.connection for worker in self.__workers], POLL_INTERVAL
+                ):
+                    worker = next(
+                        worker
+                        for worker in self.__workers
+                        if worker.connection is connection
+                    )
+                    self.__receive(worker)
+                self.__enforce()
+        except Exception as e:
+            # Fail the files instead of leaving their results waited for forever
+            with self.__lock:
+                self.__closed = True
+                self.__error = e
+                futures = [future for _, future in self.__pending]
+                self.__pending.clear()
+            futures.extend(
+                worker.future for worker in self.__workers if worker.future is not None
+            )
+            for future in futures:
+                future.set_exception(e)
+        finally:
+            for worker in self.__workers:
+                if worker.future is not None:
+                    worker.future.cancel()
+                worker.stop()
+
+    def __receive(self, worker: _Worker):
+        try:
+            message = worker.connection.recv()
+        except (EOFError, OSError):
+            self.__replace(worker)
+            if worker.future is not None:
+                error = f"The worker exited with code {worker.process.exitcode}"
+                result = worker.partial_result(ERROR, error)
+                result.messages.append(f"Error in {worker.path}: {error}")
+                worker.finish(result)
+            elif not worker.ready:
+                # Its replacement would fail the same way
+                code = worker.process.exitcode
+                raise RuntimeError(f"A worker exited with code {code} during its setup")
+            return
+
+        kind = message[0]
+        if kind == "ready":
+            worker.ready = True
+        elif kind == "lap":
+            _, stage, seconds = message
+            worker.timings[stage] = worker.timings.get(stage, 0.0) + seconds
+            worker.last_lap = time.perf_counter()
+        elif kind == "done":
+            worker.finish(message[1])
+        elif kind == "failed":
+            result = worker.partial_result(ERROR, message[1])
+            result.messages.append(f"Error in {worker.path}: {message[1]}")
+            worker.finish(result)
+
+    def __enforce(self):
+        now = time.perf_counter()
+        for worker in list(self.__workers):
+            if worker.future is None:
+                continue
+            error = None
+            if (
+                self.budget.seconds is not None
+                and now - worker.started > self.budget.seconds
+            ):
+                error = f"exceeded the time budget of {self.budget.seconds:g} s"
+            elif self.budget.memory is not None:
+                resident = resident_memory(worker.process.pid)
+                if (
+                    resident is not None
+                    and resident - worker.memory_start > self.budget.memory
+                ):
+                    megabytes = self.budget.memory / (1024 * 1024)
+                    error = f"exceeded the memory budget of {megabytes:g} MB"
+            if error is None:
+                continue
+            self.__replace(worker)
+            result = worker.partial_result(BUDGET_EXCEEDED, error)
+            result.messages.append(f"Budget exceeded in {worker.path}: {error}")
+            worker.finish(result)
+
+    def __replace(self, worker: _Worker):
+        """Kill a worker and start another one in its place."""
+        worker.kill()
+        self.__workers[self.__workers.index(worker)] = self.__spawn()
@@ -0,0 +1,593 @@
+import functools
+import json
+import queue
+import threading
+import time
+from concurrent import futures
+from typing import BinaryIO, Dict, List
+
+from entities.nodes import (
+    BlockNode,
+    ClassDeclarationNode,
+    DeclarationNode,
+    EnumDeclarationNode,
+    FunctionDeclarationNode,
+    StructDeclarationNode,
+)
+from entities.result import FileResult
+from entities.token_ import TokenError
+from services.diagnostic_sink import ERROR_LOCATION
+from services.formatter_ import Formatter
+from services.isolation import Budget, IsolatedPool
+from services.parser_ import Parser
+from services.rules import RuleEngine
+from services.spans import LineIndex
+from services.tokenizer import Tokenizer
+
+DEFAULT_DEBOUNCE = 0.25  # Seconds without changes before a document is parsed
+DEFAULT_TIMEOUT = 5.0  # Seconds a document may take to be parsed, linted or formatted
+CANCEL_POLL_INTERVAL = 0.05  # Seconds between two checks for the cancellation of work
+
+# Text document sync kinds
+SYNC_INCREMENTAL = 2
+
+# Diagnostic severities
+SEVERITIES = {"error": 1, "warning": 2, "info": 3}
+
+# Symbol kinds
+SYMBOL_CLASS = 5
+SYMBOL_METHOD = 6
+SYMBOL_ENUM = 10
+SYMBOL_FUNCTION = 12
+SYMBOL_VARIABLE = 13
+SYMBOL_STRUCT = 23
+
+# JSON-RPC error codes
+METHOD_NOT_FOUND = -32601
+REQUEST_FAILED = -32803
+REQUEST_CANCELLED = -32800
+
+# Message types of window/logMessage
+LOG_ERROR = 1
+
+# Work done by the worker process on the text of a document
+LINT = "lint"
+FORMAT = "format"
+SYMBOLS = "symbols"
+
+
+def read_message(stream: BinaryIO) -> dict | None:
+    """Read one JSON-RPC message framed by a Content-Length header.
+
+    Returns None at the end of the input.
+    """
+    length = None
+    while True:
+        line = stream.readline()
+        if not line:
+            return None
+        line = line.strip()
+        if not line:
+            break
+        name, _, value = line.decode("ascii").partition(":")
+        if name.lower() == "content-length":
+            length = int(value.strip())
+    if length is None:
+        return None
+    return json.loads(stream.read(length).decode("utf-8"))
+
+
+def write_message(stream: BinaryIO, message: dict):
+    data = json.dumps(message).encode("utf-8")
+    stream.write(b"Content-Length: %d\r\n\r\n" % len(data) + data)
+    stream.flush()
+
+
+class Document:
+    def __init__(self, uri: str, text: str, version: int):
+        self.uri = uri
+        self.text = text
+        self.version = version
+        self.linted_version = None  # Version the published diagnostics belong to
+
+    def apply_change(self, change: dict):
+        """Apply a full or incremental content change of didChange."""
+        if "range" not in change:
+            self.text = change["text"]
+            return
+        line_index = LineIndex(self.text)
+        start = _offset(line_index, change["range"]["start"])
+        end = _offset(line_index, change["range"]["end"])
+        self.text = self.text[:start] + change["text"] + self.text[end:]
+
+
+def _offset(line_index: LineIndex, position: dict) -> int:
+    """Offset of a position; a character past the end of its line means the end."""
+    line = position["line"] + 1
+    return min(
+        line_index.offset(line, max(position["character"], 0) + 1),
+        line_index.line_end(line),
+    )
+
+
+def _range(line_index: LineIndex, start: int, end: int) -> dict:
+    start_line, start_column = line_index.position(start)
+    end_line, end_column = line_index.position(end)
+    return {
+        "start": {"line": start_line - 1, "character": start_column - 1},
+        "end": {"line": end_line - 1, "character": end_column - 1},
+    }
+
+
+def _whole_document(text: str) -> dict:
+    line_index = LineIndex(text)
+    return _range(line_index, 0, len(text))
+
+
+def _error_diagnostic(message: str) -> dict:
+    """A diagnostic at the location of an error message, the start if it has none."""
+    message = message.strip()
+    match = ERROR_LOCATION.search(message)
+    line, column = (int(match.group(1)), int(match.group(2))) if match else (1, 1)
+    position = {"line": line - 1, "character": max(column - 1, 0)}
+    return {
+        "range": {"start": position, "end": position},
+        "severity": SEVERITIES["error"],
+        "source": "ctllint",
+        "message": message,
+    }
+
+
+def _diagnostics(rule_engine: RuleEngine, text: str) -> List[dict]:
+    try:
+        ast = Parser(Tokenizer(text).tokenize()).parse()
+    except (SyntaxError, TokenError, RecursionError) as error:
+        return [_error_diagnostic(str(error))]
+
+    line_index = LineIndex(text)
+    diagnostics = []
+    for diagnostic in rule_engine.run(ast, text):
+        line, column = (diagnostic.line or 1), (diagnostic.column or 1)
+        position = {"line": line - 1, "character": column - 1}
+        start = line_index.offset(line, column)
+        node = ast.node_at(start)
+        diagnostics.append(
+            {
+                "range": (
+                    _range(line_index, *node.span)
+                    if node is not None and node.span[0] == start
+                    else {"start": position, "end": position}
+                ),
+                "severity": SEVERITIES.get(diagnostic.severity, SEVERITIES["warning"]),
+                "code": diagnostic.rule,
+                "source": "ctllint",
+                "message": diagnostic.message,
+            }
+        )
+    return diagnostics
+
+
+def _text_edits(config: dict, text: str, line_ranges=None) -> List[dict]:
+    ast = Parser(Tokenizer(text).tokenize()).parse()
+    formatter = Formatter(ast, memoize=config["memoize_formatting"])
+    formatted = (
+        formatter.format_ranges(text, line_ranges)
+        if line_ranges
+        else formatter.format()
+    )
+    if formatted == text:
+        return []
+    return [{"range": _whole_document(text), "newText": formatted}]
+
+
+def _symbols(statements, line_index: LineIndex, in_class: bool) -> List[dict]:
+    symbols = []
+    for statement in statements:
+        if statement.span is None:
+            continue
+        if isinstance(statement, FunctionDeclarationNode):
+            kind = SYMBOL_METHOD if in_class else SYMBOL_FUNCTION
+            names, children = [statement.identifier], []
+        elif isinstance(statement, (ClassDeclarationNode, StructDeclarationNode)):
+            kind = (
+                SYMBOL_CLASS
+                if isinstance(statement, ClassDeclarationNode)
+                else SYMBOL_STRUCT
+            )
+            names = [statement.identifier]
+            block = statement.block
+            children = (
+                _symbols(block.statements, line_index, in_class=True)
+                if isinstance(block, BlockNode)
+                else []
+            )
+        elif isinstance(statement, EnumDeclarationNode):
+            kind, names, children = SYMBOL_ENUM, [statement.identifier], []
+        elif isinstance(statement, DeclarationNode):
+            kind, children = SYMBOL_VARIABLE, []
+            names = [
+                getattr(identifier, "value", identifier)
+                for identifier, _, _ in statement.identifiers
+            ]
+        else:
+            continue
+        symbol_range = _range(line_index, *statement.span)
+        for name in names:
+            symbols.append(
+                {
+                    "name": str(name),
+                    "kind": kind,
+                    "range": symbol_range,
+                    "selectionRange": symbol_range,
+                    "children": children,
+                }
+            )
+    return symbols
+
+
+# State of the worker process, set by _start_worker
+_config = None
+_rule_engine = None
+
+
+def _start_worker(config: dict):
+    global _config, _rule_engine
+    _config = config
+    _rule_engine = RuleEngine.from_config(config)
+
+
+def _run_in_worker(work: tuple, on_lap=None):
+    """Do one piece of (kind, text, line ranges) work in the worker process."""
+    kind, text, line_ranges = work
+    if kind == LINT:
+        return _diagnostics(_rule_engine, text)
+    try:
+        if kind == FORMAT:
+            return _text_edits(_config, text, line_ranges)
+        ast = Parser(Tokenizer(text).tokenize()).parse()
+        return _symbols(ast.statements, LineIndex(text), in_class=False)
+    except TokenError as error:
+        # Not an Exception: the worker would exit instead of failing the work
+        raise SyntaxError(str(error)) from None
+
+
+class RequestCancelled(Exception):
+    """The client cancelled the request being handled."""
+
+
+class LanguageServer:
+    """Language Server Protocol server over a pair of byte streams (stdio).
+
+    Supports incremental document sync, published diagnostics (syntax errors
+    and lint rules), formatting, range formatting and document symbols.
+
+    Documents are parsed for diagnostics only once their changes have settled
+    for ``debounce`` seconds, and always at their latest version: changes
+    received in the meantime are applied first, and results that became
+    stale while parsing are dropped instead of published.
+
+    Parsing, linting and formatting run in a worker process, killed and
+    replaced when a document takes more than ``timeout`` seconds, so that a
+    pathological input fails its request instead of freezing the session.
+
+    A request cancelled by ``$/cancelRequest`` before or while it is handled
+    gets a RequestCancelled error. Work already handed to the worker process
+    is not interrupted: it runs to its end or to the time limit, and its result
+    is dropped.
+
+    Positions are counted in code points. The server asks for the utf-32
+    position encoding; with clients that only speak utf-16, characters outside
+    the Basic Multilingual Plane shift the columns on their line.
+
+    Args:
+        config (dict): The linter configuration
+        input_stream (BinaryIO): Where messages are read from
+        output_stream (BinaryIO): Where messages are written to
+        debounce (float, optional): Quiet period before diagnostics are computed
+        timeout (float, optional): Time limit of the work on one document
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        input_stream: BinaryIO,
+        output_stream: BinaryIO,
+        debounce=DEFAULT_DEBOUNCE,
+        timeout=DEFAULT_TIMEOUT,
+    ):
+        self.config = config
+        self.input_stream = input_stream
+        self.output_stream = output_stream
+        self.debounce = debounce
+        self.timeout = timeout
+        # Checks the rule names, the worker builds its own engine
+        RuleEngine.from_config(config)
+        self.__pool = None
+        self.documents: Dict[str, Document] = {}
+        self.deadlines: Dict[str, float] = {}  # uri -> when its diagnostics are due
+        self.messages = queue.Queue()
+        # Ids of the requests cancelled by the client, added by the reader thread as
+        # soon as the cancellation arrives
+        self.cancelled = set()
+        self.__request_id = None  # Id of the request being handled
+        self.shutdown_requested = False
+        self.running = True
+        self.handlers = {
+            "initialize": self.initialize,
+            "initialized": lambda params: None,
+            "shutdown": self.shutdown,
+            "exit": self.exit,
+            "textDocument/didOpen": self.did_open,
+            "textDocument/didChange": self.did_change,
+            "textDocument/didClose": self.did_close,
+            "textDocument/didSave": lambda params: None,
+            "textDocument/formatting": self.formatting,
+            "textDocument/rangeFormatting": self.range_formatting,
+            "textDocument/documentSymbol": self.document_symbol,
+            "$/cancelRequest": self.cancel_request,
+            "$/setTrace": lambda params: None,
+        }
+
+    # Main loop
+
+    def __read_messages(self):
+        while True:
+            message = read_message(self.input_stream)
+            if isinstance(message, dict) and message.get("method") == "$/cancelRequest":
+                # Seen here, the main loop may be busy with the cancelled request
+                self.cancelled.add((message.get("params") or {}).get("id"))
+            self.messages.put(message)
+            if message is None:
+                return
+
+    def run(self) -> int:
+        """Serve until the exit notification or the end of the input.
+
+        Returns:
+            int: The process exit code, 0 when shutdown was requested before exit
+        """
+        # Not forked: a fork could copy the lock of standard input held by the
+        # reader thread, which the new process takes to close it
+        self.__pool = IsolatedPool(
+            1,
+            Budget(seconds=self.timeout),
+            functools.partial(_start_worker, self.config),
+            _run_in_worker,
+            start_method="spawn",
+        )
+        try:
+            threading.Thread(target=self.__read_messages, daemon=True).start()
+            while self.running:
+                timeout = None
+                if self.deadlines:
+                    timeout = max(0.0, min(self.deadlines.values()) - time.monotonic())
+                try:
+                    message = self.messages.get(timeout=timeout)
+                except queue.Empty:
+                    self.__lint_due_documents()
+                    continue
+                if message is None:
+                    break
+                self.__dispatch(message)
+        finally:
+            self.__pool.shutdown()
+        return 0 if self.shutdown_requested else 1
+
+    def __drain(self):
+        # Apply every message already received, so work is done on the latest versions
+        while self.running:
+            try:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                return
+            if message is None:
+                self.running = False
+                return
+            self.__dispatch(message)
+
+    def __dispatch(self, message: dict):
+        method = message.get("method")
+        handler = self.handlers.get(method)
+        if "id" not in message:
+            if handler is not None:
+                try:
+                    handler(message.get("params") or {})
+                except Exception as error:
+                    self.__log(f"{method} failed: {type(error).__name__}: {error}")
+            return
+        if handler is None:
+            self.__send(
+                {
+                    "jsonrpc": "2.0",
+                    "id": message["id"],
+                    "error": {
+                        "code": METHOD_NOT_FOUND,
+                        "message": f"Unknown method {method}",
+                    },
+                }
+            )
+            return
+        outer_request_id = self.__request_id
+        self.__request_id = message["id"]
+        try:
+            if message["id"] in self.cancelled:
+                raise RequestCancelled("Request cancelled")
+            result = handler(message.get("params") or {})
+        except RequestCancelled as error:
+            self.cancelled.discard(message["id"])
+            self.__send(
+                {
+                    "jsonrpc": "2.0",
+                    "id": message["id"],
+                    "error": {"code": REQUEST_CANCELLED, "message": str(error)},
+                }
+            )
+            return
+        except Exception as error:
+            self.__send(
+                {
+                    "jsonrpc": "2.0",
+                    "id": message["id"],
+                    "error": {"code": REQUEST_FAILED, "message": str(error)},
+                }
+            )
+            return
+        finally:
+            self.__request_id = outer_request_id
+        self.__send({"jsonrpc": "2.0", "id": message["id"], "result": result})
+
+    def __send(self, message: dict):
+        write_message(self.output_stream, message)
+
+    def __log(self, message: str):
+        self.__send(
+            {
+                "jsonrpc": "2.0",
+                "method": "window/logMessage",
+                "params": {"type": LOG_ERROR, "message": message},
+            }
+        )
+
+    def __work(self, kind: str, text: str, line_ranges=None):
+        """Have the worker process do some work on a text and return its result.
+
+        Raises:
+            RuntimeError: When the work failed or ran out of time
+            RequestCancelled: When the request it is done for was cancelled
+        """
+        future = self.__pool.submit((kind, text, line_ranges))
+        request_id = self.__request_id
+        while True:
+            try:
+                result = future.result(
+                    None if request_id is None else CANCEL_POLL_INTERVAL
+                )
+                break
+            except futures.TimeoutError:
+                if request_id in self.cancelled:
+                    raise RequestCancelled("Request cancelled")
+        if isinstance(result, FileResult):
+            # What the pool returns instead of the result of failed work
+            raise RuntimeError(result.error)
+        return result
+
+    # Lifecycle
+
+    def initialize(self, params):
+        encodings = (
+            params.get("capabilities", {})
+            .get("general", {})
+            .get("positionEncodings", [])
+        )
+        return {
+            "capabilities": {
+                "positionEncoding": "utf-32" if "utf-32" in encodings else "utf-16",
+                "textDocumentSync": {
+                    "openClose": True,
+                    "change": SYNC_INCREMENTAL,
+                    "save": True,
+                },
+                "documentFormattingProvider": True,
+                "documentRangeFormattingProvider": True,
+                "documentSymbolProvider": True,
+            },
+            "serverInfo": {"name": "ctllint"},
+        }
+
+    def shutdown(self, params):
+        self.shutdown_requested = True
+        return None
+
+    def exit(self, params):
+        self.running = False
+
+    def cancel_request(self, params):
+        # Requests are handled in order, so this one was answered already
+        self.cancelled.discard(params.get("id"))
+
+    # Document sync
+
+    def did_open(self, params):
+        item = params["textDocument"]
+        self.documents[item["uri"]] = Document(
+            item["uri"], item["text"], item.get("version", 0)
+        )
+        # Lint a freshly opened document right away
+        self.deadlines[item["uri"]] = time.monotonic()
+
+    def did_change(self, params):
+        document = self.documents.get(params["textDocument"]["uri"])
+        if document is None:
+            return
+        for change in params["contentChanges"]:
+            document.apply_change(change)
+        document.version = params["textDocument"].get("version", document.version + 1)
+        self.deadlines[document.uri] = time.monotonic() + self.debounce
+
+    def did_close(self, params):
+        uri = params["textDocument"]["uri"]
+        self.documents.pop(uri, None)
+        self.deadlines.pop(uri, None)
+        self.__publish(uri, [], None)
+
+    # Diagnostics
+
+    def __lint_due_documents(self):
+        self.__drain()
+        now = time.monotonic()
+        for uri in [uri for uri, deadline in self.deadlines.items() if deadline <= now]:
+            del self.deadlines[uri]
+            document = self.documents.get(uri)
+            if document is None:
+                continue
+            version = document.version
+            diagnostics = self.__diagnostics(document.text)
+            # Changes that arrived during the parse make the result stale
+            self.__drain()
+            if uri in self.documents and document.version == version:
+                document.linted_version = version
+                self.__publish(uri, diagnostics, version)
+
+    def __diagnostics(self, text: str) -> List[dict]:
+        try:
+            return self.__work(LINT, text)
+        except Exception as error:
+            return [_error_diagnostic(f"Could not lint the document: {error}")]
+
+    def __publish(self, uri: str, diagnostics: List[dict], version):
+        params = {"uri": uri, "diagnostics": diagnostics}
+        if version is not None:
+            params["version"] = version
+        self.__send(
+            {
+                "jsonrpc": "2.0",
+                "method": "textDocument/publishDiagnostics",
+                "params": params,
+            }
+        )
+
+    # Formatting
+
+    def formatting(self, params):
+        document = self.documents.get(params["textDocument"]["uri"])
+        if document is None:
+            return None
+        return self.__work(FORMAT, document.text)
+
+    def range_formatting(self, params):
+        document = self.documents.get(params["textDocument"]["uri"])
+        if document is None:
+            return None
+        start = params["range"]["start"]["line"] + 1
+        end = params["range"]["end"]["line"] + 1
+        if params["range"]["end"]["character"] == 0 and end > start:
+            end -= 1  # A range ending at the start of a line does not include it
+        return self.__work(FORMAT, document.text, [(start, end)])
+
+    # Symbols
+
+    def document_symbol(self, params):
+        document = self.documents.get(params["textDocument"]["uri"])
+        if document is None:
+            return None
+        return self.__work(SYMBOLS, document.text)
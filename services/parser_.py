@@ -1,3 +1,4 @@
+import functools
 from typing import Any, List, Tuple
 
 from entities.nodes import (
@@ -27,6 +28,7 @@ from entities.nodes import (
     EnumDeclarationNode,
     EnumValueNode,
     EventNode,
+    FactorNode,
     ForLoopNode,
     FunctionCallNode,
     FunctionDeclarationNode,
@@ -42,6 +44,7 @@ from entities.nodes import (
     MultilineCommentNode,
     NegationNode,
     NewLineNode,
+    Node,
     NumberNode,
     ParameterNode,
     PointerNode,
@@ -59,9 +62,28 @@ from entities.nodes import (
     TypeCastNode,
     TypeNode,
     WhileLoopNode,
-    FactorNode,
 )
 from entities.token_ import Token, TokenError, TokenKind
+from services.spans import fill_spans
+
+
+def spanned(parse_function):
+    """Decorator recording the source span of the node returned by a parse function.
+
+    The span runs from the first significant token at the time of the call to
+    the end of the last consumed token. Nodes that already carry a span (set
+    by a nested parse function) keep it.
+    """
+
+    @functools.wraps(parse_function)
+    def wrapper(parser, *args, **kwargs):
+        start = parser.current_offset()
+        node = parse_function(parser, *args, **kwargs)
+        if isinstance(node, Node) and node.span is None and parser.last_token:
+            node.span = (start, max(start, parser.last_token.end))
+        return node
+
+    return wrapper
 
 
 class Parser:
@@ -74,6 +96,11 @@ class Parser:
             "classes": {},  # Maps class names to their fields
         }
         self.statements = []
+        self.last_token = None  # Last consumed token, marks the end of node spans
+
+    def current_offset(self) -> int:
+        """Source offset of the current significant token."""
+        return self.__current().start
 
     def __current(self):
         while (
@@ -131,6 +158,7 @@ class Parser:
     def __consume(self, kind, ignore_newline=True) -> Token:
         if self.__match(kind):
             token = self.__current()
+            self.last_token = token
             self.__advance(ignore_newline)
             return token
         raise TokenError(
@@ -147,10 +175,16 @@ class Parser:
             statement = self.__parse_statement()
             if statement:
                 self.statements.append(statement)
-        return ProgramNode(self.statements)
+        program = ProgramNode(self.statements)
+        program.span = (0, self.tokens[-1].end or 0)
+        # Nodes built from already parsed parts (e.g. chained binary expressions) get
+        # the span of their children
+        fill_spans(program)
+        return program
 
     # Non-terminal parsing functions
 
+    @spanned
     def __parse_statement(self):
         if self.__match(TokenKind.NEWLINE):
             self.__consume(TokenKind.NEWLINE, ignore_newline=False)
@@ -333,8 +367,10 @@ class Parser:
         if self.__peek(peek_index).value == "(":
             peek_index += 1
 
-            # Find the closing parenthesis ')'
+            # Find the closing parenthesis ')', an unclosed one is no declaration
             while self.__peek(peek_index).value != ")":
+                if self.__peek(peek_index).kind == TokenKind.EOF:
+                    return False
                 peek_index += 1
             peek_index += 1  # Move past the closing parenthesis
 
@@ -362,6 +398,7 @@ class Parser:
 
         return False
 
+    @spanned
     def __parse_function_declaration(self) -> FunctionDeclarationNode:
         """FunctionDeclaration -> AccessModifier? Modifier? Type? (identifier | "main") "(" ParameterList? ")" Block_summary_
 
@@ -526,6 +563,7 @@ class Parser:
 
     # Non-terminal parsing functions
 
+    @spanned
     def __parse_conditional_expression(self):
         """
         ConditionalExpression -> TernaryExpression | Comparison | DoubleColonAccess
@@ -557,6 +595,7 @@ class Parser:
         # Return a TernaryExpressionNode representing the full ternary expression
         return TernaryExpressionNode(condition, true_branch, false_branch)
 
+    @spanned
     def __parse_assignment(self, parse_semicolon=True):
         # Check if the assignment is a increment or decrement operation of kind ++i or --i
         if self.__match(TokenKind.ARITHMETIC_OPERATOR) and self.__current().value in [
@@ -646,6 +685,7 @@ class Parser:
 
         raise TokenError("Invalid assignment statement", self.__current())
 
+    @spanned
     def __parse_expression(self) -> Any:
         """Expression -> Term ( ("+" | "-") Term )*
 
@@ -664,6 +704,7 @@ class Parser:
 
         return left
 
+    @spanned
     def __parse_term(self):
         """Term -> Factor ( ("*" | "/" | "%") Factor )*
 
@@ -683,6 +724,7 @@ class Parser:
 
         return left
 
+    @spanned
     def __parse_factor(self) -> FactorNode:
         """Factor -> Comment? Primary Comment?
 
@@ -734,6 +776,7 @@ class Parser:
 
         return FactorNode(node, comment1, comment2)
 
+    @spanned
     def __parse_primary(self):
         if self.__match(TokenKind.NUMBER) or (
             self.__match(TokenKind.ARITHMETIC_OPERATOR)
@@ -774,7 +817,7 @@ class Parser:
         elif self.__detect_type(self.__current()) and self.__peek().value == "::":
             return self.__parse_double_colon_access()
         elif self.__match(TokenKind.IDENTIFIER):
-            return IdentifierNode(self.__consume(TokenKind.IDENTIFIER).value)
+            return self.__parse_identifier()
         elif self.__match(TokenKind.SYMBOL) and self.__current().value == "$":
             # Consume the "$" symbol
             self.__consume(TokenKind.SYMBOL)
@@ -823,6 +866,7 @@ class Parser:
                 "Expected a primary expression. Token: " + str(self.__current())
             )
 
+    @spanned
     def __parse_type(self):
         # If the current token is a type keyword, consume it and return the value
         if self.__match(TokenKind.TYPE_KEYWORD):
@@ -839,6 +883,7 @@ class Parser:
             "Expected a type keyword or identifier. Token: " + str(self.__current())
         )
 
+    @spanned
     def __parse_dynamic_type(self) -> TypeNode:
         """Parse a dynamically created type (enum, struct, class)
 
@@ -865,6 +910,7 @@ class Parser:
 
         return TypeNode(identifier, dyn_type)
 
+    @spanned
     def __parse_template_type(self):
         # Consume the template type keyword
         keyword = self.__consume(TokenKind.TEMPLATE_TYPE_KEYWORD)
@@ -896,6 +942,7 @@ class Parser:
         # Return the template node
         return TemplateTypeNode(keyword, inner_types)
 
+    @spanned
     def __parse_declaration(self, parse_semicolon: bool = True) -> DeclarationNode:
         """
         Declaration -> AccessModifier? Modifier? ("const" (Type | ε) | Type) identifier ("=" ConditionalExpression)? (Comment | MultiLineComment)? ("," identifier ("=" ConditionalExpression)*)? (Comment | MultiLineComment)? ";"
@@ -937,7 +984,7 @@ class Parser:
             type_ = self.__parse_type()
 
         # Parse the first identifier
-        identifier = IdentifierNode(self.__consume(TokenKind.IDENTIFIER).value)
+        identifier = self.__parse_identifier()
         identifiers = []  # Start a list to hold identifiers and their initial values
 
         comment = [None, None]
@@ -951,7 +998,7 @@ class Parser:
             # Check for a comment before the first identifier
             comment1 = None
             if self.__match(TokenKind.COMMENT):
-                comment1 = CommentNode(self.__consume(TokenKind.COMMENT).value)
+                comment1 = self.__parse_line_comment()
             elif self.__match(TokenKind.MULTI_LINE_COMMENT):
                 comment1 = self.__parse_multiline_comment()
             comment[0] = comment1
@@ -962,7 +1009,7 @@ class Parser:
         # Check for a comment after the first identifier
         comment2 = None
         if self.__match(TokenKind.COMMENT):
-            comment2 = CommentNode(self.__consume(TokenKind.COMMENT).value)
+            comment2 = self.__parse_line_comment()
         elif self.__match(TokenKind.MULTI_LINE_COMMENT):
             comment2 = self.__parse_multiline_comment()
         comment[1] = comment2
@@ -975,7 +1022,7 @@ class Parser:
             self.__consume(TokenKind.SYMBOL)
 
             # Expect and consume the next identifier
-            identifier = IdentifierNode(self.__consume(TokenKind.IDENTIFIER).value)
+            identifier = self.__parse_identifier()
 
             comment = [None, None]
 
@@ -988,7 +1035,7 @@ class Parser:
                 # Check for a comment before the first identifier
                 comment1 = None
                 if self.__match(TokenKind.COMMENT):
-                    comment1 = CommentNode(self.__consume(TokenKind.COMMENT).value)
+                    comment1 = self.__parse_line_comment()
                 elif self.__match(TokenKind.MULTI_LINE_COMMENT):
                     comment1 = self.__parse_multiline_comment()
                 comment[0] = comment1
@@ -998,7 +1045,7 @@ class Parser:
 
             comment2 = None
             if self.__match(TokenKind.COMMENT):
-                comment2 = CommentNode(self.__consume(TokenKind.COMMENT).value)
+                comment2 = self.__parse_line_comment()
             elif self.__match(TokenKind.MULTI_LINE_COMMENT):
                 comment2 = self.__parse_multiline_comment()
             comment[1] = comment2
@@ -1022,6 +1069,7 @@ class Parser:
             type_, identifiers, is_const, access_modifier, modifiers, comment
         )
 
+    @spanned
     def __parse_parameter_list(self):
         # Start with an empty list of parameters
         parameters = []
@@ -1045,6 +1093,7 @@ class Parser:
 
         return parameters
 
+    @spanned
     def __parse_parameter(self):
         # Check if there is a 'const' keyword
         is_const = False
@@ -1077,13 +1126,12 @@ class Parser:
             type_, parameter_name.value, default_value, is_pointer, is_const
         )
 
+    @spanned
     def __parse_function_call(self, function_expression=None):
         # If no function expression is provided, assume a standalone function call with an identifier
         if function_expression is None:
             # Expect and consume the function name (identifier)
-            function_expression = IdentifierNode(
-                self.__consume(TokenKind.IDENTIFIER).value
-            )
+            function_expression = self.__parse_identifier()
 
         # Expect and consume the opening parenthesis
         self.__consume(TokenKind.SYMBOL)
@@ -1096,6 +1144,7 @@ class Parser:
 
         return FunctionCallNode(function_expression, arguments)
 
+    @spanned
     def __parse_argument_list(self):
         """ArgumentList -> ConditionalExpression Comment? ("," Comment? ConditionalExpression)*
 
@@ -1115,7 +1164,7 @@ class Parser:
         # Check for a comment after the argument
         comment = None
         if self.__match(TokenKind.COMMENT):
-            comment = CommentNode(self.__consume(TokenKind.COMMENT).value)
+            comment = self.__parse_line_comment()
             argument.set_comment(comment.value)
 
         arguments.append(argument)
@@ -1128,7 +1177,7 @@ class Parser:
             # Check for a comment after the argument
             comment = None
             if self.__match(TokenKind.COMMENT):
-                comment = CommentNode(self.__consume(TokenKind.COMMENT).value)
+                comment = self.__parse_line_comment()
 
             # Parse the next argument
             argument = self.__parse_conditional_expression()
@@ -1138,6 +1187,7 @@ class Parser:
 
         return arguments
 
+    @spanned
     def __parse_if_statement(self) -> IfStatementNode:
         """IfStatement -> "if" Comment? "(" Comparison ")" (InlineStatement | Block) (ElseIfClause)* (ElseClause)?
 
@@ -1150,7 +1200,7 @@ class Parser:
         # Check for a comment after the "if" keyword
         comment = None
         if self.__match(TokenKind.COMMENT):
-            comment = CommentNode(self.__consume(TokenKind.COMMENT).value)
+            comment = self.__parse_line_comment()
 
         # Parse the condition within parentheses
         self.__consume(TokenKind.SYMBOL)
@@ -1184,6 +1234,7 @@ class Parser:
 
         return node
 
+    @spanned
     def __parse_else_clause(self):
         """ElseClause -> "else" Comment? (InlineStatement | Block)
 
@@ -1195,7 +1246,7 @@ class Parser:
         # Check for a comment after the "else" keyword
         comment = None
         if self.__match(TokenKind.COMMENT):
-            comment = CommentNode(self.__consume(TokenKind.COMMENT).value)
+            comment = self.__parse_line_comment()
 
         # Check if there is a block, or a single statement
         if self.__match(TokenKind.SYMBOL) and self.__current().value == "{":
@@ -1210,6 +1261,7 @@ class Parser:
             node.set_comment(comment.value)
         return node
 
+    @spanned
     def __parse_else_if_clause(self) -> ElseIfClauseNode:
         """ "else" "if" Comment? "(" Comparison ")" (InlineStatement | Block)
 
@@ -1221,7 +1273,7 @@ class Parser:
         # Check for a comment after the "else if" keyword
         comment = None
         if self.__match(TokenKind.COMMENT):
-            comment = CommentNode(self.__consume(TokenKind.COMMENT).value)
+            comment = self.__parse_line_comment()
 
         self.__consume(TokenKind.SYMBOL)
         else_if_condition = self.__parse_comparison()
@@ -1241,6 +1293,7 @@ class Parser:
             else_if_node.set_comment(comment.value)
         return else_if_node
 
+    @spanned
     def __parse_block(self):
         statements = []
         self.__consume(TokenKind.SYMBOL)
@@ -1249,6 +1302,7 @@ class Parser:
         self.__consume(TokenKind.SYMBOL, ignore_newline=False)
         return BlockNode(statements)
 
+    @spanned
     def __parse_comparison(self):
         if self.__detect_declaration():
             return self.__parse_declaration(parse_semicolon=False)
@@ -1257,6 +1311,7 @@ class Parser:
         else:
             return self.__parse_logical_or()
 
+    @spanned
     def __parse_logical_or(self):
         left = self.__parse_logical_and()
 
@@ -1269,6 +1324,7 @@ class Parser:
 
         return left
 
+    @spanned
     def __parse_logical_and(self):
         left = self.__parse_negation()
 
@@ -1281,6 +1337,7 @@ class Parser:
 
         return left
 
+    @spanned
     def __parse_negation(self):
         if (
             self.__match(TokenKind.LOGICAL_OPERATOR) and self.__current().value == "!"
@@ -1294,6 +1351,7 @@ class Parser:
 
         return self.__parse_bitwise_or()
 
+    @spanned
     def __parse_bitwise_or(self):
         left = self.__parse_bitwise_xor()
 
@@ -1304,6 +1362,7 @@ class Parser:
 
         return left
 
+    @spanned
     def __parse_bitwise_xor(self):
         left = self.__parse_bitwise_and()
 
@@ -1314,6 +1373,7 @@ class Parser:
 
         return left
 
+    @spanned
     def __parse_bitwise_and(self):
         left = self.__parse_shift()
 
@@ -1324,6 +1384,7 @@ class Parser:
 
         return left
 
+    @spanned
     def __parse_shift(self):
         left = self.__parse_relational()
 
@@ -1334,6 +1395,7 @@ class Parser:
 
         return left
 
+    @spanned
     def __parse_relational(self):
         left = self.__parse_expression()
 
@@ -1344,6 +1406,7 @@ class Parser:
 
         return left
 
+    @spanned
     def __parse_return_statement(self):
         # Consume the "return" keyword
         self.__consume(TokenKind.KEYWORD)
@@ -1363,6 +1426,7 @@ class Parser:
 
         return ReturnNode(expression)
 
+    @spanned
     def __parse_break_statement(self):
         # Consume the "break" keyword
         self.__consume(TokenKind.KEYWORD)
@@ -1377,6 +1441,7 @@ class Parser:
 
         return BreakNode()
 
+    @spanned
     def __parse_while_statement(self):
         # Consume the "while" keyword
         self.__consume(TokenKind.KEYWORD)
@@ -1400,6 +1465,7 @@ class Parser:
 
         return WhileLoopNode(condition, block_or_statement)
 
+    @spanned
     def __parse_library_import(self):
         # Consume the '#' symbol
         self.__consume(TokenKind.SYMBOL)
@@ -1412,6 +1478,7 @@ class Parser:
 
         return LibraryNode(library_name.value)
 
+    @spanned
     def __parse_for_loop(self) -> ForLoopNode:
         """ForLoop -> "for" "(" ForInitialization ";" Comparison ";" Assignment? ")" (Block | Statement)
 
@@ -1454,13 +1521,14 @@ class Parser:
         # Otherwise parse the signle statement
         else:
             statement = self.__parse_statement()
-        
+
         # Check for optional semicolon
         if self.__match(TokenKind.SYMBOL) and self.__current().value == ";":
             self.__consume(TokenKind.SYMBOL)
 
         return ForLoopNode(initialization, condition, increment, block, statement)
 
+    @spanned
     def __parse_enum_declaration(self) -> EnumDeclarationNode:
         """EnumDeclaration -> "enum" identifier "{" EnumValue ("," EnumValue)* "}"
 
@@ -1512,6 +1580,7 @@ class Parser:
 
         return EnumDeclarationNode(enum_name, enum_values)
 
+    @spanned
     def __parse_enum_value(self) -> EnumValueNode:
         """EnumValue -> identifier ("=" number)?
 
@@ -1533,6 +1602,7 @@ class Parser:
 
         return EnumValueNode(enum_value_name, enum_value)
 
+    @spanned
     def __parse_enum_access(self) -> EnumAccessNode:
         """EnumAccess -> identifier "::" identifier
 
@@ -1551,6 +1621,7 @@ class Parser:
 
         return EnumAccessNode(enum_name, enum_value_name)
 
+    @spanned
     def __parse_switch_statement(self) -> SwitchStatementNode:
         """SwitchStatement     -> "switch" "(" Expression ")" "{" (SwitchCase | Comment | MultiLineComment)* "}"
 
@@ -1583,7 +1654,7 @@ class Parser:
             or self.__match(TokenKind.MULTI_LINE_COMMENT)
         ):
             if self.__match(TokenKind.COMMENT):
-                statements.append(CommentNode(self.__consume(TokenKind.COMMENT).value))
+                statements.append(self.__parse_line_comment())
             elif self.__match(TokenKind.MULTI_LINE_COMMENT):
                 statements.append(self.__parse_multiline_comment())
             else:
@@ -1594,6 +1665,7 @@ class Parser:
 
         return SwitchStatementNode(switch_expression, statements)
 
+    @spanned
     def __parse_case_statement(self) -> CaseStatementNode:
         """SwitchCase -> "case" Expression ":" Statement* | "default" ":" Statement*
 
@@ -1636,6 +1708,7 @@ class Parser:
             None if is_default else case_expression, block, is_default
         )
 
+    @spanned
     def __parse_struct_declaration(self) -> StructDeclarationNode:
         """StructDeclaration -> "struct" identifier Inheritance? Block ";"
 
@@ -1668,6 +1741,7 @@ class Parser:
 
         return StructDeclarationNode(struct_name, block, inheritance)
 
+    @spanned
     def __parse_class_declaration(self) -> ClassDeclarationNode:
         """ClassDeclaration -> "class" identifier Block ";"
 
@@ -1703,6 +1777,7 @@ class Parser:
 
         return ClassDeclarationNode(class_name, block, inheritance)
 
+    @spanned
     def __parse_type_cast(self) -> TypeCastNode:
         """TypeCast -> "(" Type ")" Expression
 
@@ -1723,6 +1798,7 @@ class Parser:
 
         return TypeCastNode(type_, expression)
 
+    @spanned
     def __parse_for_loop_initialization(self) -> Any:
         """ForInitialization -> Declaration | Assignment | identifier
 
@@ -1735,8 +1811,9 @@ class Parser:
         elif self.__detect_assignment():
             return self.__parse_assignment(parse_semicolon=False)
         else:
-            return IdentifierNode(self.__consume(TokenKind.IDENTIFIER).value)
+            return self.__parse_identifier()
 
+    @spanned
     def __parse_class_static_access(self) -> ClassStaticAccessNode:
         """ClassStaticAccess -> identifier "::" (FunctionCall | identifier)
 
@@ -1758,9 +1835,9 @@ class Parser:
         # Otherwise, parse the identifier
         else:
             # Parse the identifier
-            identifier = self.__consume(TokenKind.IDENTIFIER).value
-            return ClassStaticAccessNode(class_name, IdentifierNode(identifier))
+            return ClassStaticAccessNode(class_name, self.__parse_identifier())
 
+    @spanned
     def __parse_double_colon_access(self) -> EnumAccessNode | ClassStaticAccessNode:
         """Parse the double colon access, which can be either an enum access or a class static access
 
@@ -1781,6 +1858,7 @@ class Parser:
                 f"Type '{self.__current().value}' is not defined. Token: {self.__current()}"
             )
 
+    @spanned
     def __parse_class_initialization(self) -> ClassInitializationNode:
         """ClassInitialization -> ("new")? Type "(" ArgumentList? ")"
 
@@ -1808,6 +1886,7 @@ class Parser:
 
         return ClassInitializationNode(class_type, arguments, new_keyword)
 
+    @spanned
     def __parse_continue_statement(self) -> ContinueNode:
         """ContinueStatement   -> "continue" ";"
 
@@ -1827,6 +1906,7 @@ class Parser:
 
         return ContinueNode()
 
+    @spanned
     def __parse_try_catch(self) -> TryCatchNode:
         """TryCatchStatement -> "try" Block "catch" Block ("finally" Block)?
 
@@ -1854,6 +1934,7 @@ class Parser:
 
         return TryCatchNode(try_block, catch_block, finally_block)
 
+    @spanned
     def __parse_do_while_loop(self) -> DoWhileLoopNode:
         """DoWhileLoop -> "do" Block "while" "(" Comparison ")" ";"
 
@@ -1883,6 +1964,7 @@ class Parser:
 
         return DoWhileLoopNode(condition, block)
 
+    @spanned
     def __parse_property_setter(self) -> PropertySetterNode:
         """PropertySetter -> # # "property" (Type | identifier) identifier
 
@@ -1907,6 +1989,7 @@ class Parser:
 
         return PropertySetterNode(property_type, property_name)
 
+    @spanned
     def __parse_event(self) -> EventNode:
         """Event -> # "event" ( ParameterList? )
 
@@ -1920,7 +2003,7 @@ class Parser:
         self.__consume(TokenKind.IDENTIFIER)
 
         # Consume the identifier
-        identifier = IdentifierNode(self.__consume(TokenKind.IDENTIFIER).value)
+        identifier = self.__parse_identifier()
 
         # Consume '('
         self.__consume(TokenKind.SYMBOL)
@@ -1933,6 +2016,7 @@ class Parser:
 
         return EventNode(identifier, parameters)
 
+    @spanned
     def __parse_multiline_comment(self) -> MultilineCommentNode:
         """MultiLineComment -> "/**" (any_character)* "*/" | "/*" (any_character)* "*/"
 
@@ -1947,6 +2031,7 @@ class Parser:
         lines = [line.strip() for line in lines if line.strip()]
         return MultilineCommentNode(lines)
 
+    @spanned
     def __parse_comment(self) -> CommentNode | MultilineCommentNode | None:
         """Comment -> "//" (any_character)* | MultiLineComment
 
@@ -1955,8 +2040,26 @@ class Parser:
         """
         comment = None
         if self.__match(TokenKind.COMMENT):
-            comment = CommentNode(self.__consume(TokenKind.COMMENT).value)
+            comment = self.__parse_line_comment()
         elif self.__match(TokenKind.MULTI_LINE_COMMENT):
             comment = self.__parse_multiline_comment()
 
         return comment
+
+    @spanned
+    def __parse_identifier(self) -> IdentifierNode:
+        """Parse a plain identifier into an IdentifierNode
+
+        Returns:
+            IdentifierNode: The parsed identifier node
+        """
+        return IdentifierNode(self.__consume(TokenKind.IDENTIFIER).value)
+
+    @spanned
+    def __parse_line_comment(self) -> CommentNode:
+        """Parse a single line comment into a CommentNode
+
+        Returns:
+            CommentNode: The parsed comment node
+        """
+        return CommentNode(self.__consume(TokenKind.COMMENT).value)
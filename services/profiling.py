@@ -0,0 +1,299 @@
+import cProfile
+import marshal
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from services.config import CPROFILE, SAMPLING
+
+DEFAULT_SAMPLE_INTERVAL = 0.001  # Seconds between two samples of the sampling profiler
+
+# Stacks rebuilt from a cProfile profile are cut when their share of the
+# profiled time falls below this, which keeps mutually recursive call graphs
+# (the parser) from producing an explosion of tiny stacks
+MIN_STACK_SHARE = 0.0001
+
+# Function key of pstats: (file name, first line, function name)
+Function = Tuple[str, int, str]
+
+# Subsystem of the functions defined in a source file, the first match wins.
+# With a name part, only functions whose name contains it match.
+SUBSYSTEMS = [
+    ("tokenizer", "services/tokenizer.py", None),
+    ("parser", "services/parser_.py", None),
+    ("nodes.format", "entities/nodes.py", "format"),
+    ("nodes", "entities/nodes.py", None),
+    ("formatter", "services/formatter_.py", None),
+    ("formatter", "services/format_passes.py", None),
+    ("rules", "services/rules.py", None),
+    ("visitor", "services/visitor.py", None),
+    ("spans", "services/spans.py", None),
+    ("tokens", "entities/token_.py", None),
+    ("caches", "services/cache.py", None),
+    ("caches", "services/result_cache.py", None),
+    ("caches", "services/hashing.py", None),
+    ("walker", "services/walker.py", None),
+    ("linter", "linter.py", None),
+]
+
+
+def subsystem(function: Function) -> str | None:
+    """The subsystem of a function, None for the standard library and built-ins."""
+    filename = function[0].replace(os.sep, "/")
+    for name, suffix, part in SUBSYSTEMS:
+        if filename.endswith(suffix) and (part is None or part in function[2]):
+            return name
+    return None
+
+
+def subsystem_totals(stats: Dict[Function, tuple]) -> Dict[str, float]:
+    """Seconds spent in each subsystem's own code.
+
+    Time in the standard library and in built-ins is charged to the subsystem
+    of the function calling them, so that e.g. len() in the tokenizer counts
+    as tokenizer time.
+    """
+    totals: Dict[str, float] = {}
+    for function, (_, _, own_seconds, _, callers) in stats.items():
+        name = subsystem(function)
+        if name is not None or not callers:
+            name = name or "other"
+            totals[name] = totals.get(name, 0.0) + own_seconds
+            continue
+        for caller, (_, _, seconds, _) in callers.items():
+            caller_name = subsystem(caller) or "other"
+            totals[caller_name] = totals.get(caller_name, 0.0) + seconds
+    return totals
+
+
+def function_label(function: Function) -> str:
+    """file:line(function), relative to the repository for the linter's own code."""
+    filename, line, name = function
+    if filename == "~":
+        return name
+    normalized = filename.replace(os.sep, "/")
+    for _, suffix, _ in SUBSYSTEMS:
+        if normalized.endswith(suffix):
+            filename = suffix
+            break
+    else:
+        filename = os.path.basename(filename)
+    return f"{filename}:{line}({name})"
+
+
+def collapsed_stacks(stats: Dict[Function, tuple]) -> Dict[Tuple[Function, ...], float]:
+    """Own seconds of each call stack, rebuilt from the caller edges of a profile.
+
+    cProfile only records which function called which, so the time of a
+    function is split between its callers in proportion to the time each
+    edge took. The stacks are an estimate: a function that is slow from one
+    caller and fast from another gets the same share below both.
+
+    Returns:
+        Dict[Tuple[Function, ...], float]: Stack, outermost first -> own seconds
+    """
+    # Function -> {callee: cumulative seconds of the calls from the function}
+    callees: Dict[Function, Dict[Function, float]] = {}
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, (_, _, _, seconds) in callers.items():
+            callees.setdefault(caller, {})[function] = seconds
+    roots = [function for function, entry in stats.items() if not entry[4]]
+    minimum = sum(stats[function][3] for function in roots) * MIN_STACK_SHARE
+
+    stacks: Dict[Tuple[Function, ...], float] = {}
+    # (stack, seconds of the last function spent below this stack)
+    pending = [((function,), stats[function][3]) for function in roots]
+    while pending:
+        stack, seconds = pending.pop()
+        function = stack[-1]
+        _, _, own_seconds, cumulative_seconds, _ = stats[function]
+        share = seconds / cumulative_seconds if cumulative_seconds else 0.0
+        if own_seconds * share > 0:
+            stacks[stack] = stacks.get(stack, 0.0) + own_seconds * share
+        for callee, callee_seconds in callees.get(function, {}).items():
+            # Recursive calls are already part of the time of the outer call
+            if callee in stack or callee_seconds * share < minimum:
+                continue
+            pending.append((stack + (callee,), callee_seconds * share))
+    return stacks
+
+
+def write_collapsed(path: str, stacks: Dict[Tuple[Function, ...], int]):
+    """Write stacks in the collapsed format read by flame graph tools."""
+    with open(path, "w") as file:
+        for stack, weight in sorted(stacks.items()):
+            frames = ";".join(
+                f"[{subsystem(function) or 'other'}] {function_label(function)}"
+                for function in stack
+            )
+            file.write(f"{frames} {weight}\n")
+
+
+class CProfiler:
+    """Deterministic profiling with cProfile.
+
+    The call counts are exact, but pure Python code is slowed down. cProfile
+    does not record whole call stacks, so the collapsed stacks it writes are
+    rebuilt from the callers of each function (see collapsed_stacks).
+    """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def enable(self):
+        self.profile.enable()
+
+    def disable(self):
+        self.profile.disable()
+
+    def stats(self) -> Dict[Function, tuple]:
+        """The profile in the format of pstats.Stats.stats."""
+        self.profile.create_stats()
+        return self.profile.stats
+
+    def write(self, path: str) -> List[str]:
+        """Write the pstats file and the collapsed stacks next to it.
+
+        The weights of the collapsed stacks are microseconds.
+
+        Returns:
+            List[str]: The paths written
+        """
+        self.profile.dump_stats(path)
+        collapsed_path = path + ".folded"
+        microseconds = {
+            stack: round(seconds * 1_000_000)
+            for stack, seconds in collapsed_stacks(self.stats()).items()
+        }
+        write_collapsed(
+            collapsed_path,
+            {stack: weight for stack, weight in microseconds.items() if weight},
+        )
+        return [path, collapsed_path]
+
+
+class SamplingProfiler:
+    """Statistical profiling by a thread that samples the stack of the profiled thread.
+
+    It only uses the standard library and barely slows the profiled code
+    down, at the price of approximate times and no call counts. Besides a
+    pstats file built from the samples, it writes the sampled stacks in the
+    collapsed format read by flame graph tools.
+
+    Args:
+        interval (float, optional): Seconds between two samples
+    """
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        # Stack, outermost first -> samples
+        self.samples: Dict[Tuple[Function, ...], int] = {}
+        self.seconds = 0.0  # Sampled time
+        self.__thread = None
+        self.__stop = threading.Event()
+        self.__switch_interval = None
+
+    def enable(self):
+        target = threading.get_ident()
+        self.__stop.clear()
+        # Let the sampler get the interpreter lock about as often as it wants to sample
+        self.__switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.__switch_interval, self.interval))
+        self.__thread = threading.Thread(
+            target=self.__sample, args=(target,), daemon=True
+        )
+        self.__thread.start()
+
+    def disable(self):
+        self.__stop.set()
+        self.__thread.join()
+        sys.setswitchinterval(self.__switch_interval)
+
+    def __sample(self, target: int):
+        last = time.perf_counter()
+        while not self.__stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            now = time.perf_counter()
+            self.seconds += now - last
+            last = now
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                key = tuple(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def stats(self) -> Dict[Function, tuple]:
+        """The samples in the format of pstats.Stats.stats, samples as call counts."""
+        total = sum(self.samples.values())
+        weight = self.seconds / total if total else 0.0
+        # Function -> [samples, samples, own seconds, cumulative seconds, callers]
+        entries: Dict[Function, list] = {}
+        for stack, count in self.samples.items():
+            seconds = count * weight
+            seen = set()
+            for depth, function in enumerate(stack):
+                entry = entries.setdefault(function, [0, 0, 0.0, 0.0, {}])
+                own = depth == len(stack) - 1
+                if function not in seen:
+                    # Recursive functions count once per stack
+                    seen.add(function)
+                    entry[0] += count
+                    entry[1] += count
+                    entry[3] += seconds
+                if own:
+                    entry[2] += seconds
+                if depth:
+                    caller = stack[depth - 1]
+                    calls, primitive_calls, caller_own, cumulative = entry[4].get(
+                        caller, (0, 0, 0.0, 0.0)
+                    )
+                    entry[4][caller] = (
+                        calls + count,
+                        primitive_calls + count,
+                        caller_own + (seconds if own else 0.0),
+                        cumulative + seconds,
+                    )
+        return {function: tuple(entry) for function, entry in entries.items()}
+
+    def write(self, path: str) -> List[str]:
+        """Write the pstats file and the collapsed stacks next to it.
+
+        Returns:
+            List[str]: The paths written
+        """
+        with open(path, "wb") as file:
+            marshal.dump(self.stats(), file)
+        collapsed_path = path + ".folded"
+        write_collapsed(collapsed_path, self.samples)
+        return [path, collapsed_path]
+
+
+def create_profiler(kind: str = CPROFILE):
+    """A CProfiler or a SamplingProfiler."""
+    return SamplingProfiler() if kind == SAMPLING else CProfiler()
+
+
+def print_summary(stats: Dict[Function, tuple], count: int):
+    """Print the time of each subsystem and the count functions with most own time."""
+    totals = subsystem_totals(stats)
+    total = sum(totals.values())
+    print("\n--- Profile by Subsystem ---")
+    for name, seconds in sorted(totals.items(), key=lambda item: item[1], reverse=True):
+        share = seconds / total * 100 if total else 0.0
+        print(f"{name:<14} {seconds * 1000:>10.2f} ms {share:>6.1f}%")
+
+    print(f"\nTop {count} functions by own time:")
+    ranked = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:count]
+    for function, (_, calls, own_seconds, cumulative_seconds, _) in ranked:
+        own = own_seconds * 1000
+        cumulative = cumulative_seconds * 1000
+        name = subsystem(function) or "other"
+        print(
+            f"{own:>10.2f} ms own {cumulative:>10.2f} ms total "
+            f"{calls:>9} calls  [{name}] {function_label(function)}"
+        )
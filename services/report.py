@@ -0,0 +1,157 @@
+import json
+import math
+import time
+from typing import Dict, List, Tuple
+
+from entities.result import BUDGET_EXCEEDED, ERROR, FileResult
+from services.files import write_atomic
+from services.rules import RuleStats
+
+REPORT_VERSION = 1
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values: List[float], rank: int) -> float:
+    """Nearest-rank percentile of an ascending list, 0 for an empty one."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(rank / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class RunReport:
+    """Collects the results of a run and computes its statistics."""
+
+    def __init__(self):
+        self.memory_threshold = None  # Peak bytes above which files are flagged
+        self.reset()
+
+    def reset(self):
+        """Forget the results and start a new run, keeping the settings."""
+        self.results: List[FileResult] = []
+        # Rule id -> RuleStats over all files
+        self.rule_stats: Dict[str, RuleStats] = {}
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def add(self, result: FileResult):
+        self.results.append(result)
+        if result.rule_stats:
+            for rule_id, stats in result.rule_stats.items():
+                self.rule_stats.setdefault(rule_id, RuleStats()).merge(stats)
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def wall_seconds(self) -> float:
+        end = self.finished if self.finished is not None else time.perf_counter()
+        return end - self.started
+
+    @property
+    def total(self) -> int:
+        return len(self.results)
+
+    @property
+    def errors(self) -> int:
+        return sum(1 for result in self.results if result.status == ERROR)
+
+    @property
+    def budget_exceeded(self) -> int:
+        return sum(1 for result in self.results if result.status == BUDGET_EXCEEDED)
+
+    @property
+    def successful(self) -> int:
+        return self.total - self.errors - self.budget_exceeded
+
+    @property
+    def changed(self) -> int:
+        return sum(1 for result in self.results if result.changed)
+
+    def stage_totals(self) -> Dict[str, Tuple[float, float]]:
+        """Stage name -> (wall seconds, CPU seconds) summed over all files.
+
+        The stages are in the order they first ran.
+        """
+        totals: Dict[str, Tuple[float, float]] = {}
+        for result in self.results:
+            for stage, seconds in result.timings.items():
+                wall, cpu = totals.get(stage, (0.0, 0.0))
+                totals[stage] = (
+                    wall + seconds,
+                    cpu + result.cpu_timings.get(stage, 0.0),
+                )
+        return totals
+
+    def slowest(self, count: int) -> List[FileResult]:
+        """The count files that took the longest, slowest first."""
+        return sorted(self.results, key=lambda result: result.seconds, reverse=True)[
+            :count
+        ]
+
+    def largest(self, count: int) -> List[FileResult]:
+        """The count files with the highest peak memory, largest first."""
+        return sorted(
+            self.results, key=lambda result: result.peak_memory, reverse=True
+        )[:count]
+
+    @property
+    def memory_flagged(self) -> List[FileResult]:
+        """The files whose peak memory exceeds the threshold."""
+        if self.memory_threshold is None:
+            return []
+        return [
+            result
+            for result in self.results
+            if result.peak_memory > self.memory_threshold
+        ]
+
+    def aggregates(self) -> dict:
+        """Throughput, latency percentiles and per-stage totals of the run."""
+        wall = self.wall_seconds
+        size = sum(result.size for result in self.results)
+        latencies = sorted(result.seconds for result in self.results)
+        totals = self.stage_totals()
+
+        aggregates = {
+            "files": self.total,
+            "successful": self.successful,
+            "errors": self.errors,
+            "budget_exceeded": self.budget_exceeded,
+            "changed": self.changed,
+            "bytes": size,
+            "tokens": sum(result.tokens or 0 for result in self.results),
+            "nodes": sum(result.nodes or 0 for result in self.results),
+            "diagnostics": sum(len(result.diagnostics) for result in self.results),
+            "wall_seconds": wall,
+            "files_per_second": self.total / wall if wall > 0 else 0.0,
+            "megabytes_per_second": size / (1024 * 1024) / wall if wall > 0 else 0.0,
+            "stage_seconds": {stage: wall for stage, (wall, _) in totals.items()},
+            "stage_cpu_seconds": {stage: cpu for stage, (_, cpu) in totals.items()},
+            "peak_memory": max(
+                (result.peak_memory for result in self.results), default=0
+            ),
+            "memory_threshold": self.memory_threshold,
+            "memory_flagged": [result.path for result in self.memory_flagged],
+        }
+        for rank in PERCENTILES:
+            aggregates[f"latency_p{rank}"] = percentile(latencies, rank)
+        return aggregates
+
+    def write(self, path: str):
+        """Write the aggregates and every file record as a JSON document."""
+        document = {
+            "version": REPORT_VERSION,
+            "aggregates": self.aggregates(),
+            "rules": {
+                rule_id: {
+                    "hits": stats.hits,
+                    "diagnostics": stats.diagnostics,
+                    "seconds": stats.seconds,
+                }
+                for rule_id, stats in self.rule_stats.items()
+            },
+            "files": [result.to_dict() for result in self.results],
+        }
+        write_atomic(path, json.dumps(document, indent=1) + "\n")
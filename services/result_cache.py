@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import pickle
+from typing import Dict, Tuple
+
+from entities.result import ERROR, OK, FileResult
+from services.cache import GRAMMAR_MODULES, sources_fingerprint
+from services.files import read_text, write_atomic
+
+RESULTS_FILE = "results.pickle"
+
+# Modules deciding the outcome of processing a parsed file. Together with the
+# grammar and the configuration they key the whole results cache.
+RESULT_MODULES = GRAMMAR_MODULES + [
+    os.path.join("services", "rules.py"),
+    os.path.join("services", "formatter_.py"),
+    os.path.join("services", "format_passes.py"),
+]
+
+
+def content_digest(code: str) -> str:
+    """Hash of a source text, as recorded in FileResult.digest."""
+    return hashlib.sha256(code.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def results_fingerprint(config: dict) -> str:
+    """Hash of the tool version, the sources of RESULT_MODULES and the configuration."""
+    digest = hashlib.sha256(sources_fingerprint(tuple(RESULT_MODULES)).encode())
+    digest.update(json.dumps(config, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Persistent outcomes of processed files, to skip files that did not change.
+
+    An entry is found by path and is valid while the file has the same size
+    and modification time, or, when only the modification time differs (a
+    fresh checkout, a touched file), the same content hash. The whole cache
+    is dropped when its fingerprint (see results_fingerprint) changes.
+
+    The cache lives in one file and is meant to be used by one process; the
+    workers of a parallel run return their results to the parent, which
+    stores them.
+
+    Args:
+        path (str): The cache file
+        fingerprint (str): The fingerprint of the current tool and configuration
+    """
+
+    def __init__(self, path: str, fingerprint: str):
+        self.path = path
+        self.fingerprint = fingerprint
+        # path -> (size, mtime_ns, digest, status, changed, error, diagnostics)
+        self.entries: Dict[str, Tuple] = {}
+        self.hits = 0
+        self.misses = 0
+        self.__dirty = False
+        self.__load()
+
+    def __load(self):
+        try:
+            with open(self.path, "rb") as file:
+                fingerprint, entries = pickle.load(file)
+        except FileNotFoundError:
+            return
+        except (
+            OSError,
+            pickle.UnpicklingError,
+            EOFError,
+            ValueError,
+            TypeError,
+            AttributeError,
+            ImportError,
+        ):
+            # Unreadable cache, start over
+            self.__dirty = True
+            return
+        if fingerprint == self.fingerprint:
+            self.entries = entries
+        else:
+            self.__dirty = True
+
+    def lookup(self, path: str) -> FileResult | None:
+        """Return the stored result of a file that did not change, or None."""
+        entry = self.entries.get(path)
+        if entry is None:
+            self.misses += 1
+            return None
+        size, mtime_ns, digest, status, changed, error, diagnostics = entry
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.misses += 1
+            return None
+        if stat.st_size != size:
+            self.misses += 1
+            return None
+        if stat.st_mtime_ns != mtime_ns:
+            # Same size, maybe the same content
+            code = read_text(path)
+            if code is None or content_digest(code) != digest:
+                self.misses += 1
+                return None
+            self.entries[path] = (size, stat.st_mtime_ns) + entry[2:]
+            self.__dirty = True
+
+        self.hits += 1
+        result = FileResult(path, status, changed, error)
+        result.size = size
+        result.mtime_ns = stat.st_mtime_ns
+        result.digest = digest
+        result.diagnostics = list(diagnostics)
+        return result
+
+    def store(self, result: FileResult):
+        """Remember the result of a file processed in full."""
+        if (
+            result.digest is None
+            or result.mtime_ns is None
+            or result.status not in (OK, ERROR)
+        ):
+            return
+        self.entries[result.path] = (
+            result.size,
+            result.mtime_ns,
+            result.digest,
+            result.status,
+            result.changed,
+            result.error,
+            tuple(result.diagnostics),
+        )
+        self.__dirty = True
+
+    def save(self):
+        """Write the cache atomically, if anything changed."""
+        if not self.__dirty:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        write_atomic(
+            self.path,
+            pickle.dumps((self.fingerprint, self.entries), pickle.HIGHEST_PROTOCOL),
+        )
+        self.__dirty = False
@@ -0,0 +1,238 @@
+import time
+from typing import Callable, Dict, List, Tuple
+
+from entities.diagnostic import Diagnostic
+from entities.nodes import (
+    AssignmentNode,
+    BlockNode,
+    CaseStatementNode,
+    CompoundAssignmentNode,
+    ElseClauseNode,
+    ElseIfClauseNode,
+    ForLoopNode,
+    IfStatementNode,
+    NewLineNode,
+    Node,
+    ProgramNode,
+    SwitchStatementNode,
+    WhileLoopNode,
+)
+from services.spans import LineIndex
+from services.visitor import Visitor
+
+# Registry of all known rules, keyed by rule id
+RULES: Dict[str, type] = {}
+
+
+def register_rule(rule_class: type) -> type:
+    """Class decorator adding a rule to the registry.
+
+    Raises:
+        ValueError: When a rule with the same id is already registered
+    """
+    if rule_class.id in RULES:
+        raise ValueError(f"Rule '{rule_class.id}' is already registered")
+    RULES[rule_class.id] = rule_class
+    return rule_class
+
+
+class Rule:
+    """Base class of lint rules.
+
+    A rule subscribes to the node classes listed in ``node_types``; the engine
+    calls ``check`` for every such node (subclasses included) during its single
+    traversal, and ``finish`` once the whole tree has been seen.
+    """
+
+    id: str = None
+    description: str = ""
+    node_types: Tuple[type, ...] = ()
+    enabled_by_default = True
+
+    def __init__(self):
+        self.diagnostics: List[Diagnostic] = []
+        self.line_index: LineIndex | None = None
+
+    def begin(self, diagnostics: List[Diagnostic], line_index: LineIndex = None):
+        """Prepare the rule for a new tree, reporting into the given list.
+
+        The line index, when given, is used to locate reported nodes.
+        """
+        self.diagnostics = diagnostics
+        self.line_index = line_index
+
+    def check(self, node: Node):
+        raise NotImplementedError
+
+    def finish(self):
+        pass
+
+    def report(self, node: Node, message: str, severity: str = "warning"):
+        line = column = None
+        if self.line_index is not None and node.span is not None:
+            line, column = self.line_index.position(node.span[0])
+        self.diagnostics.append(Diagnostic(self.id, message, severity, line, column))
+
+
+class RuleStats:
+    def __init__(self):
+        self.hits = 0  # Number of nodes handed to the rule
+        self.diagnostics = 0
+        self.seconds = 0.0
+
+    def merge(self, other: "RuleStats"):
+        self.hits += other.hits
+        self.diagnostics += other.diagnostics
+        self.seconds += other.seconds
+
+    def __repr__(self) -> str:
+        return (
+            f"RuleStats(hits={self.hits}, diagnostics={self.diagnostics}, "
+            f"seconds={self.seconds:.6f})"
+        )
+
+
+class RuleEngine(Visitor):
+    """Runs any number of rules over a tree in one traversal.
+
+    Every node class is mapped once to the rules subscribed to it, so the cost
+    of a traversal does not grow with the number of enabled rules, only with
+    the number of nodes they actually inspect.
+
+    Args:
+        rules (List[Rule]): The rule instances to run
+    """
+
+    def __init__(self, rules: List[Rule]):
+        self.rules = rules
+        self.stats: Dict[str, RuleStats] = {rule.id: RuleStats() for rule in rules}
+        self.nodes = 0  # Nodes traversed by the last run
+
+    @classmethod
+    def from_config(cls, config: dict) -> "RuleEngine":
+        """Create an engine with the rules enabled in the configuration.
+
+        Raises:
+            ValueError: When the configuration names an unknown rule
+        """
+        enabled = config.get("rules", {})
+        for rule_id in enabled:
+            if rule_id not in RULES:
+                raise ValueError(f"Unknown rule '{rule_id}' in configuration")
+
+        rules = [
+            rule_class()
+            for rule_id, rule_class in RULES.items()
+            if enabled.get(rule_id, rule_class.enabled_by_default)
+        ]
+        return cls(rules)
+
+    def take_stats(self) -> Dict[str, RuleStats]:
+        """Return the statistics gathered so far and start new ones."""
+        stats = self.stats
+        self.stats = {rule.id: RuleStats() for rule in self.rules}
+        return stats
+
+    def handlers(self, node_class: type) -> Tuple[Callable, Callable]:
+        subscribers = [
+            (rule, self.stats[rule.id])
+            for rule in self.rules
+            if issubclass(node_class, rule.node_types)
+        ]
+        if not subscribers:
+            return None, None
+
+        def enter(node):
+            for rule, stats in subscribers:
+                start = time.perf_counter()
+                reported = len(rule.diagnostics)
+                rule.check(node)
+                stats.seconds += time.perf_counter() - start
+                stats.hits += 1
+                stats.diagnostics += len(rule.diagnostics) - reported
+
+        return enter, None
+
+    def run(self, ast: ProgramNode, code: str = None) -> List[Diagnostic]:
+        """Run all rules over the tree.
+
+        Args:
+            ast (ProgramNode): The parsed program
+            code (str, optional): The source of the program, used to locate diagnostics
+
+        Returns:
+            List[Diagnostic]: The reported diagnostics, in traversal order
+        """
+        diagnostics = []
+        line_index = LineIndex(code) if code is not None else None
+        for rule in self.rules:
+            rule.begin(diagnostics, line_index)
+
+        self.nodes = self.visit(ast)
+
+        for rule in self.rules:
+            stats = self.stats[rule.id]
+            start = time.perf_counter()
+            reported = len(diagnostics)
+            rule.finish()
+            stats.seconds += time.perf_counter() - start
+            stats.diagnostics += len(diagnostics) - reported
+        return diagnostics
+
+
+# Built-in rules
+
+
+def _is_empty_block(node) -> bool:
+    return isinstance(node, BlockNode) and all(
+        isinstance(statement, NewLineNode) for statement in node.statements
+    )
+
+
+@register_rule
+class EmptyBlockRule(Rule):
+    id = "empty-block"
+    description = "Control flow statement with an empty block"
+    node_types = (
+        IfStatementNode,
+        ElseIfClauseNode,
+        ElseClauseNode,
+        WhileLoopNode,
+        ForLoopNode,
+    )
+
+    def check(self, node):
+        if isinstance(node, IfStatementNode):
+            block = node.if_block
+        elif isinstance(node, WhileLoopNode):
+            block = node.block_or_statement
+        else:
+            block = node.block
+        if _is_empty_block(block):
+            self.report(node, f"Empty block in {type(node).__name__}")
+
+
+@register_rule
+class SwitchWithoutDefaultRule(Rule):
+    id = "switch-default"
+    description = "Switch statement without a default case"
+    node_types = (SwitchStatementNode,)
+
+    def check(self, node):
+        for statement in node.statements:
+            if isinstance(statement, CaseStatementNode) and statement.is_default:
+                return
+        self.report(node, "Switch statement has no default case")
+
+
+@register_rule
+class AssignmentInConditionRule(Rule):
+    id = "assignment-in-condition"
+    description = "Assignment used as the condition of an if or while"
+    node_types = (IfStatementNode, ElseIfClauseNode, WhileLoopNode)
+
+    def check(self, node):
+        if isinstance(node.condition, (AssignmentNode, CompoundAssignmentNode)):
+            self.report(
+                node, "Assignment used as a condition, did you mean '=='?", "error"
+            )
@@ -0,0 +1,125 @@
+from bisect import bisect_right
+from typing import List, Tuple
+
+from entities.nodes import Node
+from services.visitor import POST_ORDER, iter_child_nodes, walk
+
+
+def fill_spans(root: Node):
+    """Give every node without a span the union of its children's spans.
+
+    The parser records spans for the nodes returned by its parse functions;
+    nodes assembled from already parsed parts (left-associative operator
+    chains, for example) are completed here, bottom-up.
+
+    Args:
+        root (Node): The root of the tree
+    """
+    for node in walk(root, POST_ORDER):
+        if node.span is not None:
+            continue
+        start = end = None
+        for child in iter_child_nodes(node):
+            if child.span is None:
+                continue
+            if start is None or child.span[0] < start:
+                start = child.span[0]
+            if end is None or child.span[1] > end:
+                end = child.span[1]
+        if start is not None:
+            node.span = (start, end)
+
+
+class SpanIndex:
+    """Maps source offsets to the innermost node covering them.
+
+    The spans of the tree are flattened once into sorted segments, each
+    labelled with the innermost node covering it, so a lookup is a single
+    binary search.
+
+    Args:
+        root (Node): The root of the tree
+    """
+
+    def __init__(self, root: Node):
+        # (start, -end, depth, order, node): outer nodes sort before the nodes they
+        # contain
+        intervals = []
+        stack = [(root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if node.span is not None and node.span[0] < node.span[1]:
+                intervals.append(
+                    (node.span[0], -node.span[1], depth, len(intervals), node)
+                )
+            children = iter_child_nodes(node)
+            for index in range(len(children) - 1, -1, -1):
+                stack.append((children[index], depth + 1))
+        intervals.sort(key=lambda interval: interval[:4])
+
+        self.offsets: List[int] = []
+        self.nodes: List[Node] = []
+        open_intervals: List[Tuple[int, Node]] = []  # (end, node), innermost last
+        for start, negative_end, _, _, node in intervals:
+            while open_intervals and open_intervals[-1][0] <= start:
+                end, _ = open_intervals.pop()
+                self.__add_segment(
+                    end, open_intervals[-1][1] if open_intervals else None
+                )
+            open_intervals.append((-negative_end, node))
+            self.__add_segment(start, node)
+        while open_intervals:
+            end, _ = open_intervals.pop()
+            self.__add_segment(end, open_intervals[-1][1] if open_intervals else None)
+
+    def __add_segment(self, offset: int, node: Node):
+        if self.offsets and self.offsets[-1] >= offset:
+            # A later segment starting at the same offset is more specific
+            self.offsets[-1] = offset
+            self.nodes[-1] = node
+            return
+        self.offsets.append(offset)
+        self.nodes.append(node)
+
+    def node_at(self, offset: int) -> Node | None:
+        """Return the innermost node whose span contains the offset, or None."""
+        index = bisect_right(self.offsets, offset) - 1
+        if index < 0:
+            return None
+        return self.nodes[index]
+
+
+class LineIndex:
+    """Converts between character offsets and 1-based line and column numbers.
+
+    Args:
+        code (str): The source text
+    """
+
+    def __init__(self, code: str):
+        self.length = len(code)
+        self.line_starts = [0]
+        position = code.find("\n")
+        while position != -1:
+            self.line_starts.append(position + 1)
+            position = code.find("\n", position + 1)
+
+    def position(self, offset: int) -> Tuple[int, int]:
+        """Return the (line, column) of an offset, both 1-based."""
+        line = bisect_right(self.line_starts, offset)
+        return line, offset - self.line_starts[line - 1] + 1
+
+    def line_end(self, line: int) -> int:
+        """Return the offset of the end of a 1-based line, before its newline."""
+        if line >= len(self.line_starts):
+            return self.length
+        return self.line_starts[max(line, 1)] - 1
+
+    def offset(self, line: int, column: int = 1) -> int:
+        """Return the offset of a 1-based line and column.
+
+        Past the last line, the offset is the end of the text.
+        """
+        if line > len(self.line_starts):
+            return self.length
+        return min(self.line_starts[max(line, 1) - 1] + column - 1, self.length)
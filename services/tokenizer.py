@@ -49,7 +49,12 @@ BASE_TYPE_KEYWORDS = [
     "long",
     "palette",
 ]
-TYPE_KEYWORDS = []
+# Every base type also exists as a dynamic array and a dynamic array of arrays
+TYPE_KEYWORDS = [
+    prefix + keyword
+    for keyword in BASE_TYPE_KEYWORDS
+    for prefix in ("", "dyn_", "dyn_dyn_")
+]
 LIBRARY_TYPE_KEYWORDS = [
     "OaTestResultEnvironment",
     "OaTestResultStatistic",
@@ -74,8 +79,9 @@ LIBRARY_TYPE_KEYWORDS = [
     "Trend",
     "Plot",
     "PmFitUi",
-    "HvFitUi"
+    "HvFitUi",
 ]
+ALL_TYPE_KEYWORDS = TYPE_KEYWORDS + LIBRARY_TYPE_KEYWORDS
 TEMPLATE_TYPE_KEYWORDS = ["vector", "shared_ptr"]
 ARITHMETIC_OPERATORS = [
     "+",
@@ -89,6 +95,21 @@ ARITHMETIC_OPERATORS = [
 ASSIGNMENT_OPERATORS = ["+=", "-=", "*=", "/=", "%=", "="]
 COMPARISON_OPERATORS = ["==", "!=", ">", ">=", "<", "<="]
 LOGICAL_OPERATORS = ["&&", "||", "!"]
+
+
+def _longest_first(operators):
+    return sorted(operators, key=len, reverse=True)
+
+
+# Operators tried longest first, so that e.g. "==" is not read as "=" twice
+SORTED_COMPARISON_OPERATORS = _longest_first(COMPARISON_OPERATORS)
+SORTED_ASSIGNMENT_OPERATORS = _longest_first(ASSIGNMENT_OPERATORS)
+SORTED_ARITHMETIC_OPERATORS = _longest_first(ARITHMETIC_OPERATORS)
+SORTED_LOGICAL_OPERATORS = _longest_first(LOGICAL_OPERATORS)
+
+# "else if" with any amount of whitespace in between
+ELSE_IF_PATTERN = re.compile(r"else\s+if\b")
+
 SYMBOLS = [
     "(",
     ")",
@@ -122,17 +143,10 @@ class Tokenizer:
         self.line = 1
         self.column = 1
 
-        self.__create_type_keywords()
-
-    def __create_type_keywords(self):
-        for keyword in BASE_TYPE_KEYWORDS:
-            TYPE_KEYWORDS.append(keyword)
-            TYPE_KEYWORDS.append("dyn_" + keyword)
-            TYPE_KEYWORDS.append("dyn_dyn_" + keyword)
-
     def tokenize(self):
         tokens = []
         while self.pos < len(self.code):
+            start = self.pos
             if token := self.__match_keyword():
                 self.column += len(token.value)
             elif main_keyword := self.__match_main_keyword():
@@ -208,21 +222,29 @@ class Tokenizer:
                 raise SyntaxError(
                     f"Unexpected character {self.code[self.pos]} at line {self.line}, column {self.column}"
                 )
+            token.start = start
+            token.end = self.pos
             tokens.append(token)
 
         if not tokens or tokens[-1].kind != TokenKind.EOF:
-            tokens.append(Token(TokenKind.EOF, "", self.line, self.column))
+            tokens.append(
+                Token(
+                    TokenKind.EOF,
+                    "",
+                    self.line,
+                    self.column,
+                    len(self.code),
+                    len(self.code),
+                )
+            )
 
         return tokens
 
     def __match_keyword(self):
-        # Regular expression to match "else if" with any amount of whitespace in between
-        else_if_pattern = re.compile(r"else\s+if\b")
-
         # Check for "else if" with flexible whitespace
-        match = else_if_pattern.match(self.code[self.pos :])
+        match = ELSE_IF_PATTERN.match(self.code, self.pos)
         if match:
-            self.pos += match.end()
+            self.pos = match.end()
             return Token(TokenKind.ELSE_IF, "else if", self.line, self.column)
 
         # Check for "if"
@@ -253,8 +275,7 @@ class Tokenizer:
         return None
 
     def __match_type_keyword(self):
-        keywordArr = TYPE_KEYWORDS + LIBRARY_TYPE_KEYWORDS
-        for keyword in keywordArr:
+        for keyword in ALL_TYPE_KEYWORDS:
             end_pos = self.pos + len(keyword)
             if self.code[self.pos : end_pos] == keyword:
                 # Check if the next character (if exists) is not a valid identifier continuation
@@ -266,18 +287,8 @@ class Tokenizer:
         return None
 
     def __match_operator(self):
-        # Helper function to sort operators by length in descending order
-        def sort_operators_by_length(operators):
-            return sorted(operators, key=len, reverse=True)
-
-        # Sort operators by length (longer operators first)
-        sorted_comparison_operators = sort_operators_by_length(COMPARISON_OPERATORS)
-        sorted_arithmetic_operators = sort_operators_by_length(ARITHMETIC_OPERATORS)
-        sorted_logical_operators = sort_operators_by_length(LOGICAL_OPERATORS)
-        sorted_assignment_operators = sort_operators_by_length(ASSIGNMENT_OPERATORS)
-
         # Check for comparison operators first
-        for operator in sorted_comparison_operators:
+        for operator in SORTED_COMPARISON_OPERATORS:
             if self.code[self.pos : self.pos + len(operator)] == operator:
                 # Special handling for '<' and '>'
                 if operator in {"<", ">"}:
@@ -291,7 +302,7 @@ class Tokenizer:
                 )
 
         # Check for assignment operators
-        for operator in sorted_assignment_operators:
+        for operator in SORTED_ASSIGNMENT_OPERATORS:
             if self.code[self.pos : self.pos + len(operator)] == operator:
                 self.pos += len(operator)
                 return Token(
@@ -299,7 +310,7 @@ class Tokenizer:
                 )
 
         # Check for arithmetic operators
-        for operator in sorted_arithmetic_operators:
+        for operator in SORTED_ARITHMETIC_OPERATORS:
             if self.code[self.pos : self.pos + len(operator)] == operator:
                 self.pos += len(operator)
                 return Token(
@@ -307,7 +318,7 @@ class Tokenizer:
                 )
 
         # Check for logical operators
-        for operator in sorted_logical_operators:
+        for operator in SORTED_LOGICAL_OPERATORS:
             if self.code[self.pos : self.pos + len(operator)] == operator:
                 self.pos += len(operator)
                 return Token(
@@ -433,11 +444,9 @@ class Tokenizer:
             self.pos += 1
 
         # Only return a match if we haven't detected an empty line (two consecutive newlines)
-        return (
-            self.code[start : self.pos] if start < self.pos else None,
-            new_line,
-            new_line_start,
-        )
+        if start == self.pos:
+            return None
+        return self.code[start : self.pos], new_line, new_line_start
 
     def __match_newline(self):
         start = self.pos
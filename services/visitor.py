@@ -0,0 +1,136 @@
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from entities.nodes import Node
+
+PRE_ORDER = "pre"
+POST_ORDER = "post"
+
+# Returned by a visit_* handler to stop the traversal from descending into the node
+SKIP = object()
+
+
+def iter_child_nodes(node: Node) -> List[Node]:
+    """Collect the direct children of a node, in source order.
+
+    The children are found through the ``child_fields`` metadata of the node
+    class. Fields holding lists or tuples (e.g. the identifiers of a
+    DeclarationNode) are flattened, and values that are not nodes are skipped.
+
+    Args:
+        node (Node): The node whose children are collected
+
+    Returns:
+        List[Node]: The child nodes
+    """
+    children = []
+    for field in node.child_fields:
+        value = getattr(node, field, None)
+        if isinstance(value, Node):
+            children.append(value)
+        elif isinstance(value, (list, tuple)):
+            _extend_with_nodes(children, value)
+    return children
+
+
+def _extend_with_nodes(children: List[Node], container):
+    # Containers are at most a couple of levels deep (list of tuples of lists)
+    for item in container:
+        if isinstance(item, Node):
+            children.append(item)
+        elif isinstance(item, (list, tuple)):
+            _extend_with_nodes(children, item)
+
+
+def walk(root: Node, order: str = PRE_ORDER) -> Iterator[Node]:
+    """Iterate over every node of a tree using an explicit stack.
+
+    Args:
+        root (Node): The node to start from (included in the output)
+        order (str, optional): PRE_ORDER yields a node before its children,
+            POST_ORDER yields it after them. Defaults to PRE_ORDER.
+
+    Raises:
+        ValueError: When the order is unknown
+
+    Yields:
+        Node: The nodes of the tree, children in source order
+    """
+    if order == PRE_ORDER:
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            yield node
+            children = iter_child_nodes(node)
+            children.reverse()
+            stack.extend(children)
+    elif order == POST_ORDER:
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                yield node
+                continue
+            stack.append((node, True))
+            children = iter_child_nodes(node)
+            for index in range(len(children) - 1, -1, -1):
+                stack.append((children[index], False))
+    else:
+        raise ValueError(f"Unknown traversal order '{order}'")
+
+
+class Visitor:
+    """Base class for AST passes.
+
+    Subclasses define ``visit_<NodeClass>`` methods, called before the
+    children of a node are visited, and ``leave_<NodeClass>`` methods, called
+    after them. A visit method can return SKIP to prune the subtree below the
+    node. Handlers are resolved once per node class into a dispatch table, so
+    nodes without handlers cost a single dictionary lookup.
+    """
+
+    def handlers(self, node_class: type) -> Tuple[Callable, Callable]:
+        """Resolve the (visit, leave) handlers of a node class.
+
+        Args:
+            node_class (type): The node class
+
+        Returns:
+            Tuple[Callable, Callable]: The visit and leave handlers, None when not
+                defined
+        """
+        name = node_class.__name__
+        return getattr(self, f"visit_{name}", None), getattr(
+            self, f"leave_{name}", None
+        )
+
+    def visit(self, root: Node):
+        """Traverse the tree rooted at the given node, calling the handlers.
+
+        Args:
+            root (Node): The root of the traversal
+
+        Returns:
+            int: The number of nodes visited, pruned subtrees excluded
+        """
+        dispatch: Dict[type, Tuple[Callable, Callable]] = {}
+        stack = [(root, False)]
+        visited = 0
+        while stack:
+            node, leaving = stack.pop()
+            node_class = type(node)
+            handlers = dispatch.get(node_class)
+            if handlers is None:
+                handlers = dispatch[node_class] = self.handlers(node_class)
+            enter, leave = handlers
+            if leaving:
+                leave(node)
+                continue
+            visited += 1
+            if enter is not None and enter(node) is SKIP:
+                continue
+            if leave is not None:
+                stack.append((node, True))
+            children = iter_child_nodes(node)
+            for index in range(len(children) - 1, -1, -1):
+                stack.append((children[index], False))
+        return visited
@@ -0,0 +1,235 @@
+import functools
+import os
+import re
+from typing import Callable, Iterator, List, Tuple
+
+IGNORE_FILE = ".ctllintignore"
+
+
+class IgnorePattern:
+    """One line of an ignore file, with the syntax of .gitignore."""
+
+    def __init__(
+        self, regex: re.Pattern, negated: bool, directory_only: bool, anchored: bool
+    ):
+        """
+        :param regex: Matches the path relative to the ignore file when anchored,
+            the name otherwise
+        :param negated: The pattern re-includes what an earlier pattern excluded
+            (leading "!")
+        :param directory_only: The pattern only matches directories (trailing "/")
+        :param anchored: The pattern contains a "/" other than a trailing one
+        """
+        self.regex = regex
+        self.negated = negated
+        self.directory_only = directory_only
+        self.anchored = anchored
+
+    def __repr__(self) -> str:
+        return (
+            f"IgnorePattern(regex={self.regex.pattern}, negated={self.negated}, "
+            f"directory_only={self.directory_only}, anchored={self.anchored})"
+        )
+
+
+def _translate(pattern: str) -> str:
+    """Regular expression of a glob, where only "**" matches "/"."""
+    parts = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith("**", index):
+            index += 2
+            if pattern.startswith("/", index):
+                # "**/" matches any number of leading directories, including none
+                parts.append("(?:.*/)?")
+                index += 1
+            else:
+                parts.append(".*")
+            continue
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "[":
+            end = pattern.find(
+                "]", index + 2 if pattern.startswith("[!", index) else index + 1
+            )
+            if end == -1:
+                parts.append(re.escape(char))
+            else:
+                content = pattern[index + 1 : end]
+                if content.startswith("!"):
+                    content = "^" + content[1:]
+                parts.append("[" + content.replace("\\", "\\\\") + "]")
+                index = end
+        elif char == "\\" and index + 1 < len(pattern):
+            index += 1
+            parts.append(re.escape(pattern[index]))
+        else:
+            parts.append(re.escape(char))
+        index += 1
+    return "".join(parts)
+
+
+def parse_ignore_file(text: str) -> List[IgnorePattern]:
+    """Parse the lines of an ignore file, skipping blank lines and comments."""
+    patterns = []
+    for line in text.splitlines():
+        if line.endswith(" ") and not line.endswith("\\ "):
+            line = line.rstrip(" ")
+        if not line or line.startswith("#"):
+            continue
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        directory_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        anchored = "/" in line
+        regex = re.compile(_translate(line.lstrip("/")) + r"\Z", re.DOTALL)
+        patterns.append(IgnorePattern(regex, negated, directory_only, anchored))
+    return patterns
+
+
+class IgnoreRules:
+    """The ignore patterns in effect in a directory.
+
+    They come from its own ignore file and those of its parents.
+
+    Args:
+        base (str): The directory of the ignore file
+        patterns (List[IgnorePattern]): The patterns of the ignore file
+        parent (IgnoreRules, optional): The rules of the parent directories
+    """
+
+    def __init__(
+        self, base: str, patterns: List[IgnorePattern], parent: "IgnoreRules" = None
+    ):
+        self.base = base
+        self.patterns = patterns
+        self.parent = parent
+
+    def ignored(self, path: str, is_directory: bool) -> bool:
+        """Whether a path below base is ignored, the last matching pattern deciding."""
+        return bool(self.__decide(path, is_directory))
+
+    def __decide(self, path: str, is_directory: bool) -> bool | None:
+        # The patterns of deeper ignore files come last, so they take precedence
+        decision = self.parent.__decide(path, is_directory) if self.parent else None
+        # Paths below base are built by joining names to it
+        relative = path[len(self.base) :].lstrip(os.sep).replace(os.sep, "/")
+        name = relative.rsplit("/", 1)[-1]
+        for pattern in self.patterns:
+            if pattern.directory_only and not is_directory:
+                continue
+            if pattern.regex.match(relative if pattern.anchored else name):
+                decision = not pattern.negated
+        return decision
+
+
+def _load_rules(directory: str, rules: IgnoreRules | None) -> IgnoreRules | None:
+    """The rules of a directory: those of its parent, plus its own ignore file."""
+    try:
+        with open(os.path.join(directory, IGNORE_FILE), "r", encoding="utf-8") as file:
+            text = file.read()
+    except OSError:
+        return rules
+    return IgnoreRules(directory, parse_ignore_file(text), rules)
+
+
+def is_ignored(path: str, root: str) -> bool:
+    """Whether a file is excluded by the ignore files between root and the file."""
+    rules = _load_rules(root, None)
+    directory = root
+    for part in os.path.relpath(path, root).split(os.sep)[:-1]:
+        directory = os.path.join(directory, part)
+        if rules is not None and rules.ignored(directory, True):
+            return True
+        rules = _load_rules(directory, rules)
+    return rules is not None and rules.ignored(path, False)
+
+
+# A directory listing: (path, None) for a file, (path, callable returning the
+# listing of the directory) for a subdirectory, in name order
+Listing = List[Tuple[str, Callable[[], "Listing"] | None]]
+
+
+def _scan(directory: str, rules: IgnoreRules | None, submit=None) -> Listing:
+    """List the .ctl files and the subdirectories of a directory that are not ignored.
+
+    With submit (the submit method of a thread pool) the subdirectories are
+    listed in the background right away, otherwise when their listing is
+    requested.
+    """
+    try:
+        with os.scandir(directory) as iterator:
+            entries = sorted(iterator, key=lambda entry: entry.name)
+    except OSError:
+        return []
+
+    rules = _load_rules(directory, rules)
+    listing = []
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if rules is not None and rules.ignored(entry.path, True):
+                    continue
+                if submit is not None:
+                    listing.append(
+                        (entry.path, submit(_scan, entry.path, rules, submit).result)
+                    )
+                else:
+                    listing.append(
+                        (entry.path, functools.partial(_scan, entry.path, rules))
+                    )
+            elif entry.name.endswith(".ctl") and entry.is_file():
+                if rules is None or not rules.ignored(entry.path, False):
+                    listing.append((entry.path, None))
+        except OSError:
+            continue
+    return listing
+
+
+def walk_ctl_files(root: str, threads: int = 1) -> Iterator[str]:
+    """Yield the .ctl files below a directory (or the file itself) as they are found.
+
+    Directories excluded by a .ctllintignore file (gitignore syntax, applying
+    to its directory and below) are pruned without being listed. The files
+    come in a stable depth-first order, with the entries of each directory
+    sorted by name.
+
+    Args:
+        root (str): The directory to walk
+        threads (int, optional): With more than one, directories are listed ahead by
+            a thread pool
+
+    Yields:
+        str: The path of each .ctl file
+    """
+    if os.path.isfile(root):
+        yield root
+        return
+
+    pool = None
+    submit = None
+    if threads > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        pool = ThreadPoolExecutor(max_workers=threads)
+        submit = pool.submit
+    try:
+        stack = [iter(_scan(root, None, submit))]
+        while stack:
+            for path, listing in stack[-1]:
+                if listing is None:
+                    yield path
+                else:
+                    stack.append(iter(listing()))
+                    break
+            else:
+                stack.pop()
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,231 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from typing import Callable, Dict, Iterable, Set, Tuple
+
+DEFAULT_DEBOUNCE = 0.2  # Seconds without events before a burst of changes is handled
+DEFAULT_POLL_INTERVAL = 1.0  # Seconds between two scans of the polling watcher
+
+# inotify event masks (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+)
+
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def _is_watched_file(name: str) -> bool:
+    return name.endswith(".ctl")
+
+
+def _directories(root: str) -> Iterable[str]:
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        yield directory
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+        except OSError:
+            continue
+
+
+class InotifyWatcher:
+    """Reports changed .ctl files below a directory using Linux inotify.
+
+    Raises:
+        OSError: When inotify is not available
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        library = ctypes.util.find_library("c")
+        libc = ctypes.CDLL(library or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.__libc = libc
+        self.__fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.__fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.__directories: Dict[int, str] = {}  # Watch descriptor -> directory
+        # Events were lost, the caller should process everything
+        self.rescan_needed = False
+        for directory in _directories(root):
+            self.__add_watch(directory)
+
+    def __add_watch(self, directory: str):
+        descriptor = self.__libc.inotify_add_watch(
+            self.__fd, os.fsencode(directory), WATCH_MASK
+        )
+        if descriptor >= 0:
+            self.__directories[descriptor] = directory
+
+    def wait(self, timeout: float = None) -> Set[str]:
+        """Block until events arrive or the timeout expires, return changed files."""
+        readable, _, _ = select.select([self.__fd], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self.__fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            descriptor, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                self.rescan_needed = True
+                continue
+            directory = self.__directories.get(descriptor)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.__directories[descriptor]
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Watch the new directory, and pick up the files created before
+                    # the watch was in place
+                    for subdirectory in _directories(path):
+                        self.__add_watch(subdirectory)
+                        changed.update(_ctl_files(subdirectory))
+                continue
+            if _is_watched_file(name):
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.__fd)
+
+
+def _ctl_files(directory: str) -> Iterable[str]:
+    try:
+        with os.scandir(directory) as entries:
+            return [
+                entry.path
+                for entry in entries
+                if _is_watched_file(entry.name) and entry.is_file()
+            ]
+    except OSError:
+        return []
+
+
+class PollingWatcher:
+    """Reports changed .ctl files below a directory by comparing modification times.
+
+    Used where inotify is not available. Every scan only stats the files, so
+    its cost grows with the size of the tree, not of the files.
+
+    Args:
+        root (str): The directory to watch
+        interval (float, optional): Seconds between two scans
+    """
+
+    def __init__(self, root: str, interval=DEFAULT_POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self.rescan_needed = False
+        self.__snapshot = self.__scan()
+
+    def __scan(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for directory in _directories(self.root):
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if _is_watched_file(entry.name) and entry.is_file():
+                            stat = entry.stat()
+                            snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                continue
+        return snapshot
+
+    def wait(self, timeout: float = None) -> Set[str]:
+        """Scan after the polling interval (or a shorter timeout).
+
+        Returns:
+            Set[str]: The changed files
+        """
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        snapshot = self.__scan()
+        previous = self.__snapshot
+        self.__snapshot = snapshot
+        changed = {
+            path for path, state in snapshot.items() if previous.get(path) != state
+        }
+        changed.update(path for path in previous if path not in snapshot)
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(root: str, interval=DEFAULT_POLL_INTERVAL):
+    """An InotifyWatcher when the platform has inotify, a PollingWatcher otherwise."""
+    try:
+        return InotifyWatcher(root)
+    except (OSError, AttributeError):
+        return PollingWatcher(root, interval)
+
+
+def watch(
+    root: str,
+    on_change: Callable[[Set[str]], None],
+    debounce=DEFAULT_DEBOUNCE,
+    watcher=None,
+):
+    """Call on_change with the .ctl files changed below root, until interrupted.
+
+    Events are collected until none arrived for ``debounce`` seconds, so a
+    burst of saves (or an editor writing through a temporary file) results
+    in one call with every file changed during the burst. Deleted files are
+    included; on_change should check which paths still exist.
+
+    Args:
+        root (str): The directory to watch
+        on_change (Callable[[Set[str]], None]): Called with each batch of changed paths
+        debounce (float, optional): Quiet period ending a burst
+        watcher (optional): The watcher to use, create_watcher(root) by default
+    """
+    watcher = watcher or create_watcher(root)
+    try:
+        while True:
+            changed = watcher.wait()
+            if not changed and not watcher.rescan_needed:
+                continue
+            while True:
+                more = watcher.wait(debounce)
+                if not more:
+                    break
+                changed.update(more)
+            if watcher.rescan_needed:
+                watcher.rescan_needed = False
+                changed.update(
+                    path
+                    for directory in _directories(root)
+                    for path in _ctl_files(directory)
+                )
+            on_change(changed)
+    finally:
+        watcher.close()
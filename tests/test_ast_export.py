@@ -0,0 +1,93 @@
+import io
+import json
+import sys
+
+import pytest
+
+from entities.nodes import BinaryExpressionNode, NumberNode, ProgramNode
+from services import ast_export
+from services.ast_export import JSON, JSON_LINES, export_ast, format_for_path
+from services.parser_ import Parser
+from services.tokenizer import Tokenizer
+
+CODE = "int f(int x) {\n  return x + 1;\n}\n\nmain() {\n  f(2);\n}"
+
+
+def parse(code: str):
+    return Parser(Tokenizer(code).tokenize()).parse()
+
+
+def exported(ast, fmt) -> str:
+    file = io.StringIO()
+    export_ast(ast, file, fmt)
+    return file.getvalue()
+
+
+def test_json_is_one_document_of_typed_nodes():
+    document = json.loads(exported(parse(CODE), JSON))
+
+    assert document["node"] == "ProgramNode"
+    assert [statement["node"] for statement in document["statements"]] == [
+        "FunctionDeclarationNode",
+        "NewLineNode",
+        "FunctionDeclarationNode",
+    ]
+    functions = document["statements"][::2]
+    assert [function["identifier"] for function in functions] == ["f", "main"]
+    assert functions[0]["span"] == [0, CODE.index("}") + 1]
+    assert "_span_index" not in document
+
+
+def test_json_lines_has_one_top_level_statement_per_line():
+    ast = parse(CODE)
+
+    lines = exported(ast, JSON_LINES).splitlines()
+
+    assert len(lines) == len(ast.statements)
+    assert [json.loads(line)["node"] for line in lines] == [
+        type(statement).__name__ for statement in ast.statements
+    ]
+    assert json.loads(lines[-1])["identifier"] == "main"
+
+
+def test_small_write_buffer_gives_the_same_output(monkeypatch):
+    ast = parse(CODE)
+    expected = exported(ast, JSON)
+    writes = []
+
+    class Recording(io.StringIO):
+        def write(self, text):
+            writes.append(text)
+            return super().write(text)
+
+    monkeypatch.setattr(ast_export, "WRITE_BUFFER_SIZE", 16)
+    file = Recording()
+    export_ast(ast, file, JSON)
+
+    assert file.getvalue() == expected
+    assert len(writes) > 1
+    assert max(map(len, writes)) < len(expected)
+
+
+def test_trees_deeper_than_the_recursion_limit_are_exported():
+    depth = sys.getrecursionlimit() * 2
+    node = NumberNode("1")
+    for _ in range(depth):
+        node = BinaryExpressionNode(node, "+", NumberNode("1"))
+
+    text = exported(ProgramNode([node]), JSON_LINES)
+
+    assert text.count('"BinaryExpressionNode"') == depth
+    assert text.endswith("}\n")
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        export_ast(parse(CODE), io.StringIO(), "xml")
+
+
+@pytest.mark.parametrize(
+    "path, fmt", [("ast.jsonl", JSON_LINES), ("ast.json", JSON), ("ast", JSON)]
+)
+def test_format_follows_the_extension(path, fmt):
+    assert format_for_path(path) == fmt
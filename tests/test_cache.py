@@ -0,0 +1,100 @@
+import os
+import pickle
+
+import pytest
+
+from services.cache import ASTCache
+from services.parser_ import Parser
+from services.tokenizer import Tokenizer
+
+CODE = "main() {\n  int a = 1;\n}"
+
+
+def parse(code: str):
+    return Parser(Tokenizer(code).tokenize()).parse()
+
+
+def entry_path(cache, code):
+    key = cache.key(code)
+    return os.path.join(cache.cache_dir, key[:2], key + ASTCache.SUFFIX)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ASTCache(str(tmp_path / "cache"))
+
+
+def test_stored_ast_is_a_hit(cache):
+    cache.store(CODE, parse(CODE))
+
+    ast = cache.load(CODE)
+
+    assert type(ast).__name__ == "ProgramNode"
+    assert (cache.hits, cache.misses) == (1, 0)
+    assert cache.load(CODE + "\n") is None
+    assert cache.misses == 1
+
+
+def test_cache_directory_is_private(tmp_path):
+    ASTCache(str(tmp_path / "cache"))
+
+    assert os.stat(tmp_path / "cache").st_mode & 0o077 == 0
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="POSIX permissions")
+def test_directory_writable_by_others_is_refused(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+
+    with pytest.raises(PermissionError):
+        ASTCache(str(shared))
+
+
+class Unloadable:
+    """Pickles fine, but loading it calls a function with a bad argument."""
+
+    def __init__(self, function, argument):
+        self.function = function
+        self.argument = argument
+
+    def __reduce__(self):
+        return self.function, (self.argument,)
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        b"not a pickle",
+        b"",
+        pickle.dumps(Unloadable(int, "x")),  # ValueError
+        pickle.dumps(Unloadable(len, 1)),  # TypeError
+    ],
+    ids=["garbage", "empty", "value-error", "type-error"],
+)
+def test_corrupt_entry_is_a_miss_and_is_removed(cache, payload):
+    cache.store(CODE, parse(CODE))
+    path = entry_path(cache, CODE)
+    with open(path, "wb") as file:
+        file.write(payload)
+
+    assert cache.load(CODE) is None
+    assert cache.misses == 1
+    assert not os.path.exists(path)
+
+
+def test_storing_an_entry_again_does_not_grow_the_size(cache):
+    other = CODE.replace("1", "2")
+    cache.store(other, parse(other))
+    os.utime(entry_path(cache, other), (0, 0))
+    ast = parse(CODE)
+    cache.store(CODE, ast)
+    cache.max_bytes = os.path.getsize(entry_path(cache, other)) + os.path.getsize(
+        entry_path(cache, CODE)
+    )
+
+    for _ in range(5):
+        cache.store(CODE, ast)
+
+    # Counting every store would have evicted the least recently used entry
+    assert os.path.exists(entry_path(cache, other))
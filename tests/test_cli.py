@@ -0,0 +1,141 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+LINTER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "linter.py")
+
+FORMATTED = "main() {\n  int a = 1;\n}"
+UNFORMATTED = "main()\n{\n  int a=1;\n}\n"
+
+
+def run_linter(*args, cwd, input=None):
+    return subprocess.run(
+        [sys.executable, LINTER, *args],
+        cwd=cwd,
+        input=input,
+        capture_output=True,
+        text=True,
+    )
+
+
+@pytest.fixture
+def folder(tmp_path):
+    (tmp_path / "formatted.ctl").write_text(FORMATTED)
+    (tmp_path / "unformatted.ctl").write_text(UNFORMATTED)
+    return tmp_path
+
+
+def test_check_fails_when_a_file_would_change(folder):
+    completed = run_linter(str(folder), "--check", cwd=folder)
+
+    assert completed.returncode == 1
+    assert f"Would reformat {folder / 'unformatted.ctl'}" in completed.stdout
+    assert (folder / "unformatted.ctl").read_text() == UNFORMATTED
+
+
+def test_check_passes_when_nothing_would_change(folder):
+    (folder / "unformatted.ctl").unlink()
+
+    completed = run_linter(str(folder), "--check", cwd=folder)
+
+    assert completed.returncode == 0
+    assert "Would reformat" not in completed.stdout
+
+
+def test_diff_prints_an_applicable_patch_and_succeeds(folder):
+    completed = run_linter("unformatted.ctl", "--diff", cwd=folder)
+
+    assert completed.returncode == 0
+    assert "-  int a=1;\n" in completed.stdout
+    assert "+  int a = 1;\n" in completed.stdout
+    assert (folder / "unformatted.ctl").read_text() == UNFORMATTED
+
+    patch = completed.stdout.split("\n--- Linting Results ---")[0]
+    subprocess.run(
+        ["patch", "-s", "-p0"], cwd=folder, input=patch, text=True, check=True
+    )
+    assert (folder / "unformatted.ctl").read_text() == FORMATTED
+
+
+def test_check_with_diff_fails_when_a_file_would_change(folder):
+    completed = run_linter(str(folder), "--check", "--diff", cwd=folder)
+
+    assert completed.returncode == 1
+    assert "+  int a = 1;" in completed.stdout
+
+
+@pytest.mark.parametrize(
+    "code, returncode", [(FORMATTED, 0), (UNFORMATTED, 1)], ids=["clean", "dirty"]
+)
+def test_check_of_standard_input(tmp_path, code, returncode):
+    completed = run_linter("-", "--check", cwd=tmp_path, input=code)
+
+    assert completed.returncode == returncode
+    assert completed.stdout == ""
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ('{"indent": 2', "Expecting"),
+        ("[1, 2]", "The configuration must be a JSON object"),
+    ],
+)
+@pytest.mark.parametrize("command", [["."], ["daemon"], ["lsp"]])
+def test_bad_configuration_is_a_usage_error(folder, command, text, message):
+    (folder / "bad.json").write_text(text)
+
+    completed = run_linter(*command, "-c", "bad.json", cwd=folder)
+
+    assert completed.returncode == 2
+    assert f"bad.json: {message}" in completed.stderr
+    assert "Traceback" not in completed.stderr
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="POSIX permissions")
+def test_cache_directory_writable_by_others_is_a_usage_error(folder):
+    (folder / "shared").mkdir()
+    (folder / "shared").chmod(0o777)
+
+    completed = run_linter(str(folder), "--cache-dir", "shared", cwd=folder)
+
+    assert completed.returncode == 2
+    assert "must not be writable by others" in completed.stderr
+    assert "Traceback" not in completed.stderr
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_file_crashing_the_parser_is_reported_and_the_run_goes_on(folder, jobs):
+    (folder / "truncated.ctl").write_text("main() {")
+    for number in range(4):
+        (folder / f"other{number}.ctl").write_text(FORMATTED)
+
+    completed = run_linter(str(folder), "--check", "-j", jobs, cwd=folder)
+
+    assert "Traceback" not in completed.stderr
+    assert f"Error in {folder / 'truncated.ctl'}: IndexError" in completed.stdout
+    assert "Total files processed: 7" in completed.stdout
+    assert "Files with errors: 1" in completed.stdout
+
+
+def test_chunk_of_a_dead_worker_is_reported_file_by_file(monkeypatch, capsys):
+    from collections import deque
+    from concurrent.futures import Future
+    from concurrent.futures.process import BrokenProcessPool
+
+    import linter
+    from services.report import RunReport
+
+    monkeypatch.setattr(linter, "run_report", RunReport())
+    chunk = Future()
+    chunk.set_exception(BrokenProcessPool("A child process terminated abruptly"))
+    entries = deque([["a.ctl", chunk, 0], ["b.ctl", chunk, 1]])
+
+    linter.report_results(entries, cacheable=False, wait=True)
+
+    assert linter.run_report.errors == 2
+    output = capsys.readouterr().out
+    assert "Error in a.ctl: BrokenProcessPool" in output
+    assert "Error in b.ctl: BrokenProcessPool" in output
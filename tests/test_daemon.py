@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+from services import daemon_client
+from services.config import load_config
+from services.daemon import LintDaemon
+from services.daemon_client import request
+
+UNFORMATTED = "main()\n{\n  int a=1;\n}\n"
+
+
+@pytest.fixture
+def socket_path():
+    # Unix socket paths are limited to about a hundred bytes
+    directory = tempfile.mkdtemp(prefix="ctllint-")
+    yield os.path.join(directory, "daemon.sock")
+    shutil.rmtree(directory)
+
+
+def serve(daemon):
+    """Run the daemon in a thread until the test is done."""
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    for _ in range(500):
+        if os.path.exists(daemon.socket_path):
+            break
+        threading.Event().wait(0.01)
+    yield daemon
+    if thread.is_alive():
+        request({"command": "shutdown"}, daemon.socket_path)
+        thread.join(5)
+
+
+@pytest.fixture
+def daemon(socket_path):
+    yield from serve(LintDaemon(load_config(None), socket_path))
+
+
+@pytest.fixture
+def impatient_daemon(socket_path):
+    yield from serve(LintDaemon(load_config(None), socket_path, timeout=0.3))
+
+
+def lint(socket_path, code, **fields):
+    return request(dict({"command": "lint", "code": code}, **fields), socket_path)
+
+
+def test_formats_and_answers_identical_requests_from_memory(daemon, socket_path):
+    first = lint(socket_path, UNFORMATTED)
+    second = lint(socket_path, UNFORMATTED)
+
+    assert first["error"] is None
+    assert first["formatted"] == "main() {\n  int a = 1;\n}"
+    assert second["formatted"] == first["formatted"]
+    assert daemon.hits == 1
+
+
+@pytest.mark.parametrize(
+    "lines",
+    [[5], "1:2", [[1]], [[1, "2"]], [[True, 2]], [[3, 1]], [[0, 1]]],
+    ids=["number", "string", "single", "text", "boolean", "reversed", "zero"],
+)
+def test_malformed_line_ranges_get_an_error(daemon, socket_path, lines):
+    response = lint(socket_path, UNFORMATTED, lines=lines)
+
+    assert "Invalid line range" in response["error"] or "list" in response["error"]
+    assert "formatted" not in response
+
+
+@pytest.mark.parametrize(
+    "code",
+    ["main() {\n", 'main()\n{\n  string s = "x;\n}\n'],
+    ids=["parser-failure", "unterminated-string"],
+)
+def test_unparsable_code_gets_an_error_and_the_daemon_keeps_serving(
+    daemon, socket_path, code
+):
+    response = lint(socket_path, code)
+
+    assert response["formatted"] is None
+    assert response["error"]
+    assert lint(socket_path, UNFORMATTED)["error"] is None
+
+
+def test_unknown_command_gets_an_error(daemon, socket_path):
+    assert request({"command": "reload"}, socket_path) == {
+        "error": "Unknown command 'reload'"
+    }
+
+
+def test_client_rejects_a_malformed_line_range(daemon, socket_path, tmp_path, capsys):
+    path = tmp_path / "a.ctl"
+    path.write_text(UNFORMATTED)
+
+    with pytest.raises(SystemExit) as exit:
+        daemon_client.main([str(path), "--socket", socket_path, "--lines", "5"])
+
+    assert exit.value.code == 2
+    assert "Expected START:END, got '5'" in capsys.readouterr().err
+
+
+def test_client_formats_a_line_range(daemon, socket_path, tmp_path, capsys):
+    path = tmp_path / "a.ctl"
+    path.write_text(UNFORMATTED)
+
+    code = daemon_client.main([str(path), "--socket", socket_path, "--lines", "1:4"])
+
+    assert code == 0
+    assert capsys.readouterr().out == "main() {\n  int a = 1;\n}\n"
+
+
+def test_client_shuts_the_daemon_down_without_a_file(daemon, socket_path):
+    assert daemon_client.main(["--shutdown", "--socket", socket_path]) == 0
+
+    for _ in range(500):
+        if not os.path.exists(socket_path):
+            break
+        threading.Event().wait(0.01)
+    assert not os.path.exists(socket_path)
+
+
+def test_client_shutdown_without_a_daemon_is_an_error(socket_path, capsys):
+    assert daemon_client.main(["--shutdown", "--socket", socket_path]) == 2
+    assert "cannot reach the lint daemon" in capsys.readouterr().err
+
+
+def test_request_over_the_time_limit_fails_and_the_next_ones_are_served(
+    impatient_daemon, socket_path
+):
+    slow = "main() {\n" + "  int a = 1;\n" * 2000 + "}\n"
+
+    response = lint(socket_path, slow)
+
+    assert response["formatted"] is None
+    assert "exceeded the time budget of 0.3 s" in response["error"]
+    assert lint(socket_path, UNFORMATTED)["formatted"] == "main() {\n  int a = 1;\n}"
+    # Failures are not remembered
+    assert lint(socket_path, slow)["error"]
+    assert impatient_daemon.hits == 0
@@ -0,0 +1,243 @@
+import json
+import os
+
+import pytest
+
+from entities.diagnostic import Diagnostic
+from entities.result import BUDGET_EXCEEDED, ERROR, OK, FileResult
+from services.diagnostic_sink import (
+    BUDGET_RULE,
+    PARSE_ERROR_RULE,
+    SARIF_VERSION,
+    DiagnosticSink,
+)
+
+# The parts of the SARIF 2.1.0 schema covering the properties the sink writes
+SARIF_SUBSET_SCHEMA = {
+    "type": "object",
+    "required": ["version", "runs"],
+    "properties": {
+        "$schema": {"type": "string", "format": "uri"},
+        "version": {"enum": ["2.1.0"]},
+        "runs": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["tool"],
+                "properties": {
+                    "tool": {
+                        "type": "object",
+                        "required": ["driver"],
+                        "properties": {
+                            "driver": {
+                                "type": "object",
+                                "required": ["name"],
+                                "properties": {
+                                    "name": {"type": "string"},
+                                    "rules": {
+                                        "type": "array",
+                                        "uniqueItems": True,
+                                        "items": {
+                                            "type": "object",
+                                            "required": ["id"],
+                                            "properties": {
+                                                "id": {"type": "string"},
+                                                "shortDescription": {
+                                                    "type": "object",
+                                                    "required": ["text"],
+                                                },
+                                            },
+                                        },
+                                    },
+                                },
+                            }
+                        },
+                    },
+                    "columnKind": {"enum": ["utf16CodeUnits", "unicodeCodePoints"]},
+                    "results": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "required": ["message"],
+                            "properties": {
+                                "ruleId": {"type": "string"},
+                                "ruleIndex": {"type": "integer", "minimum": -1},
+                                "level": {"enum": ["none", "note", "warning", "error"]},
+                                "message": {
+                                    "type": "object",
+                                    "required": ["text"],
+                                    "properties": {"text": {"type": "string"}},
+                                },
+                                "locations": {
+                                    "type": "array",
+                                    "items": {
+                                        "type": "object",
+                                        "properties": {
+                                            "physicalLocation": {
+                                                "type": "object",
+                                                "properties": {
+                                                    "artifactLocation": {
+                                                        "type": "object",
+                                                        "properties": {
+                                                            "uri": {"type": "string"}
+                                                        },
+                                                    },
+                                                    "region": {
+                                                        "type": "object",
+                                                        "properties": {
+                                                            "startLine": {
+                                                                "type": "integer",
+                                                                "minimum": 1,
+                                                            },
+                                                            "startColumn": {
+                                                                "type": "integer",
+                                                                "minimum": 1,
+                                                            },
+                                                        },
+                                                    },
+                                                },
+                                            }
+                                        },
+                                    },
+                                },
+                            },
+                        },
+                    },
+                },
+            },
+        },
+    },
+}
+
+
+def result(path, status=OK, error=None, diagnostics=()):
+    file_result = FileResult(path, status, error=error)
+    file_result.diagnostics = list(diagnostics)
+    return file_result
+
+
+def empty_block(line=2):
+    return Diagnostic(
+        "empty-block", "Control flow statement with an empty block", "warning", line, 3
+    )
+
+
+@pytest.fixture
+def results():
+    return [
+        result("a.ctl", diagnostics=[empty_block(2), empty_block(5)]),
+        result("clean.ctl"),
+        result("b.ctl", ERROR, 'Unexpected character "\\"" at line 3, column 14'),
+        result("c.ctl", BUDGET_EXCEEDED, "Exceeded the time budget of 1 s"),
+    ]
+
+
+def write(path, results, format=None):
+    sink = DiagnosticSink(str(path), format)
+    for file_result in results:
+        sink.add(file_result)
+    sink.close()
+    return sink
+
+
+def test_text_has_one_line_per_record(tmp_path, results):
+    path = tmp_path / "lint_errors.txt"
+
+    sink = write(path, results)
+
+    assert path.read_text().splitlines() == [
+        "a.ctl:2:3: warning: [empty-block] Control flow statement with an empty block",
+        "a.ctl:5:3: warning: [empty-block] Control flow statement with an empty block",
+        'b.ctl:3:14: error: [parse-error] Unexpected character "\\"" at line 3, '
+        "column 14",
+        "c.ctl: error: [budget-exceeded] Exceeded the time budget of 1 s",
+    ]
+    assert sink.count == 4
+
+
+def test_clean_run_writes_no_text_file(tmp_path):
+    path = tmp_path / "lint_errors.txt"
+
+    write(path, [result("clean.ctl")])
+
+    assert not path.exists()
+
+
+def test_json_lines_records_carry_their_path(tmp_path, results):
+    path = tmp_path / "diagnostics.jsonl"
+
+    write(path, results)
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [(record["path"], record["rule"]) for record in records] == [
+        ("a.ctl", "empty-block"),
+        ("a.ctl", "empty-block"),
+        ("b.ctl", PARSE_ERROR_RULE),
+        ("c.ctl", BUDGET_RULE),
+    ]
+    assert records[2]["line"] == 3 and records[2]["column"] == 14
+
+
+def test_sarif_log_is_consistent(tmp_path, results, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "diagnostics.sarif"
+
+    write(path, results)
+
+    log = json.loads(path.read_text())
+    assert log["version"] == SARIF_VERSION
+    (run,) = log["runs"]
+    rules = run["tool"]["driver"]["rules"]
+    rule_ids = [rule["id"] for rule in rules]
+    assert len(set(rule_ids)) == len(rule_ids)
+    assert all(rule["shortDescription"]["text"] for rule in rules)
+    assert [result["ruleId"] for result in run["results"]] == [
+        "empty-block",
+        "empty-block",
+        PARSE_ERROR_RULE,
+        BUDGET_RULE,
+    ]
+    for sarif_result in run["results"]:
+        assert rule_ids[sarif_result["ruleIndex"]] == sarif_result["ruleId"]
+        assert sarif_result["level"] in ("none", "note", "warning", "error")
+        (location,) = sarif_result["locations"]
+        uri = location["physicalLocation"]["artifactLocation"]["uri"]
+        assert not os.path.isabs(uri) and "\\" not in uri
+    regions = [
+        sarif_result["locations"][0]["physicalLocation"].get("region")
+        for sarif_result in run["results"]
+    ]
+    assert regions == [
+        {"startLine": 2, "startColumn": 3},
+        {"startLine": 5, "startColumn": 3},
+        {"startLine": 3, "startColumn": 14},
+        None,
+    ]
+
+
+def test_sarif_log_validates_against_the_schema(tmp_path, results):
+    jsonschema = pytest.importorskip("jsonschema")
+    path = tmp_path / "diagnostics.sarif"
+
+    write(path, results)
+
+    jsonschema.validate(json.loads(path.read_text()), SARIF_SUBSET_SCHEMA)
+
+
+@pytest.mark.parametrize("name", ["lint_errors.txt", "d.jsonl", "d.sarif"])
+def test_adding_a_file_again_replaces_its_records(tmp_path, name):
+    path = tmp_path / name
+    sink = DiagnosticSink(str(path), flush_interval=0)
+    sink.add(result("a.ctl", diagnostics=[empty_block(2)]))
+    sink.add(result("b.ctl", diagnostics=[empty_block(7)]))
+
+    sink.add(result("a.ctl", diagnostics=[empty_block(4)]))
+    sink.close()
+
+    text = path.read_text()
+    assert (
+        ":2:" not in text and '"startLine": 2' not in text and '"line": 2' not in text
+    )
+    assert sink.count == 2
+    # Still in the order the paths were first added
+    assert text.index("a.ctl") < text.index("b.ctl")
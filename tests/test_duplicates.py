@@ -0,0 +1,122 @@
+import os
+import pickle
+import subprocess
+import sys
+
+import pytest
+
+from services.duplicates import FUNCTION, DuplicateIndex
+
+LINTER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "linter.py")
+
+BODY = """
+{
+  int total = 0;
+  for (int i = 0; i < 10; i++)
+  {
+    total = total + i * 2;
+    if (total > 5)
+    {
+      DebugN("large", total, makeDynString(1, 2));
+    }
+  }
+  return total;
+}
+"""
+
+
+def write(folder, name, text):
+    path = folder / name
+    path.write_text(text)
+    return str(path)
+
+
+@pytest.fixture
+def files(tmp_path):
+    return [
+        write(tmp_path, "a.ctl", "int first()" + BODY),
+        # Comments and blank lines do not make a copy different
+        write(
+            tmp_path, "b.ctl", "// copy\nint second()\n" + BODY.replace("\n", "\n\n")
+        ),
+        write(tmp_path, "c.ctl", "main() {\n  int a = 1;\n}\n"),
+    ]
+
+
+def test_copied_functions_form_a_group(tmp_path, files):
+    index = DuplicateIndex(str(tmp_path / "index"), min_size=10)
+    index.update(files)
+
+    groups = [group for group in index.clone_groups() if group.kind == FUNCTION]
+
+    assert len(groups) == 1
+    assert [path for path, _ in groups[0].occurrences] == files[:2]
+    assert [fragment.name for _, fragment in groups[0].occurrences] == [
+        "first",
+        "second",
+    ]
+
+
+def test_unchanged_files_are_not_hashed_again(tmp_path, files):
+    path = str(tmp_path / "index")
+    index = DuplicateIndex(path, min_size=10)
+    index.update(files)
+    index.save()
+
+    reloaded = DuplicateIndex(path, min_size=10)
+    reloaded.update(files)
+
+    assert reloaded.hashed == 0
+    assert len(reloaded.clone_groups()) == len(index.clone_groups())
+
+
+@pytest.mark.parametrize(
+    "code", ["main() {", "main() {\n  int a = ;\n}", 'main() {\n  string s = "']
+)
+def test_file_failing_to_parse_is_reported_and_the_others_are_indexed(
+    tmp_path, files, code
+):
+    bad = write(tmp_path, "bad.ctl", code)
+    index = DuplicateIndex(str(tmp_path / "index"), min_size=10)
+
+    index.update([bad, *files])
+
+    assert [path for path, _ in index.errors] == [bad]
+    assert index.hashed == 4
+    assert index.clone_groups()
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        b"garbage",
+        # A class that no longer exists where the index says it is
+        b"\x80\x04cno_such_module\nFragment\n.",
+        pickle.dumps((None, {})),
+    ],
+    ids=["garbage", "moved-class", "old-header"],
+)
+def test_unreadable_index_is_rebuilt(tmp_path, files, content):
+    path = tmp_path / "index"
+    path.write_bytes(content)
+
+    index = DuplicateIndex(str(path), min_size=10)
+    index.update(files)
+
+    assert index.hashed == len(files)
+
+
+def test_command_reports_bad_files_and_saves_the_index(tmp_path, files):
+    write(tmp_path, "bad.ctl", "main() {")
+
+    completed = subprocess.run(
+        [sys.executable, LINTER, "dupes", str(tmp_path), "--min-size", "10"],
+        cwd=tmp_path,
+        capture_output=True,
+        text=True,
+    )
+
+    assert completed.returncode == 0, completed.stderr
+    assert f"Error in {tmp_path / 'bad.ctl'}" in completed.stdout
+    assert "1 errors" in completed.stdout
+    assert os.path.exists(tmp_path / ".ctllint-dupes")
@@ -0,0 +1,100 @@
+from entities.nodes import BlockNode, DeclarationNode, NewLineNode, ProgramNode
+from services.format_passes import (
+    BlankLinesAroundDeclarations,
+    CollapseBlankLines,
+    FormatPass,
+    PassPipeline,
+)
+from services.formatter_ import Formatter
+from services.parser_ import Parser
+from services.tokenizer import Tokenizer
+
+CODE = (
+    "int a;\nint f() {\n  return 1;\n}\nint g() {\n  return 2;\n}\n\n\n\n"
+    "int b;\n\n\n\nint c;\n"
+)
+
+
+def parse(code: str):
+    return Parser(Tokenizer(code).tokenize()).parse()
+
+
+def kinds(statements):
+    return [type(statement).__name__ for statement in statements]
+
+
+def test_declarations_get_exactly_one_blank_line_around_them():
+    formatted = Formatter(parse(CODE)).format()
+
+    assert formatted == (
+        "int a;\n\nint f() {\n  return 1;\n}\n\nint g() {\n  return 2;\n}\n\n"
+        "int b;\n\nint c;"
+    )
+
+
+def test_pipeline_builds_new_statement_lists_and_keeps_the_statements():
+    ast = parse(CODE)
+    before = ast.statements
+    copy = list(before)
+
+    PassPipeline.default().run(ast)
+
+    assert ast.statements is not before
+    assert before == copy
+    kept = [statement for statement in copy if not isinstance(statement, NewLineNode)]
+    assert [
+        statement
+        for statement in ast.statements
+        if not isinstance(statement, NewLineNode)
+    ] == kept
+
+
+def test_blank_line_before_the_closing_brace_of_a_block_is_dropped():
+    function = parse("int f() {\n  return 1;\n}").statements[0]
+    block = BlockNode([NewLineNode(), NewLineNode(), function])
+    program = ProgramNode([block])
+
+    PassPipeline.default().run(program)
+
+    assert kinds(block.statements) == ["NewLineNode", "FunctionDeclarationNode"]
+
+
+def test_passes_only_see_the_node_types_they_declare():
+    seen = []
+
+    class Recording(FormatPass):
+        node_types = (DeclarationNode,)
+
+        def rewrite(self, statement, output):
+            seen.append(type(statement).__name__)
+            yield statement
+
+    PassPipeline([Recording()]).run(parse(CODE))
+
+    assert seen == ["DeclarationNode"] * 3
+
+
+def test_nodes_produced_by_a_pass_go_through_the_later_passes_only():
+    class Doubling(FormatPass):
+        node_types = (NewLineNode,)
+
+        def rewrite(self, statement, output):
+            yield statement
+            yield NewLineNode()
+
+    program = ProgramNode([NewLineNode()])
+    PassPipeline([Doubling(), CollapseBlankLines()]).run(program)
+    assert kinds(program.statements) == ["NewLineNode"]
+
+    program = ProgramNode([NewLineNode()])
+    PassPipeline([CollapseBlankLines(), Doubling()]).run(program)
+    assert kinds(program.statements) == ["NewLineNode", "NewLineNode"]
+
+
+def test_many_declarations_are_separated_once():
+    count = 500
+    ast = parse("int f() {\n  return 1;\n}\n" * count)
+
+    PassPipeline([BlankLinesAroundDeclarations(), CollapseBlankLines()]).run(ast)
+
+    assert kinds(ast.statements) == ["FunctionDeclarationNode", "NewLineNode"] * count
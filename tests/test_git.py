@@ -0,0 +1,100 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from services.git_ import GitError, changed_files, read_staged, staged_files
+
+LINTER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "linter.py")
+
+FORMATTED = "main() {\n  int a = 1;\n}"
+UNFORMATTED = "main()\n{\n  int a=1;\n}\n"
+
+
+def git(*args, cwd):
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+    )
+
+
+def run_linter(*args, cwd):
+    return subprocess.run(
+        [sys.executable, LINTER, *args], cwd=cwd, capture_output=True, text=True
+    )
+
+
+@pytest.fixture
+def repository(tmp_path):
+    root = tmp_path / "repository"
+    (root / "lib").mkdir(parents=True)
+    for name in ("a.ctl", "b.ctl", "lib/c.ctl", "lib/d.ctl"):
+        (root / name).write_text(FORMATTED)
+    git("init", "-q", cwd=root)
+    git("add", ".", cwd=root)
+    git("commit", "-q", "-m", "initial", cwd=root)
+    return root
+
+
+def test_changed_files_lists_modified_and_untracked_files_under_the_directory(
+    repository, monkeypatch
+):
+    (repository / "a.ctl").write_text(UNFORMATTED)
+    (repository / "lib" / "c.ctl").write_text(UNFORMATTED)
+    (repository / "lib" / "new.ctl").write_text(FORMATTED)
+    (repository / "lib" / "notes.txt").write_text("")
+    monkeypatch.chdir(repository)
+
+    assert changed_files("HEAD") == ["a.ctl", "lib/c.ctl", "lib/new.ctl"]
+    assert changed_files("HEAD", "lib") == ["lib/c.ctl", "lib/new.ctl"]
+
+
+def test_symlinked_checkout_finds_the_changed_files(repository, tmp_path):
+    (repository / "lib" / "c.ctl").write_text(UNFORMATTED)
+    link = tmp_path / "link"
+    link.symlink_to(repository, target_is_directory=True)
+
+    paths = changed_files("HEAD", str(link / "lib"))
+
+    assert [os.path.basename(path) for path in paths] == ["c.ctl"]
+    assert os.path.samefile(paths[0], repository / "lib" / "c.ctl")
+    assert os.path.abspath(paths[0]).startswith(str(link))
+
+
+def test_staged_files_and_their_staged_content(repository, monkeypatch):
+    (repository / "b.ctl").write_text(UNFORMATTED)
+    git("add", "b.ctl", cwd=repository)
+    (repository / "b.ctl").write_text(FORMATTED + "\n")
+    monkeypatch.chdir(repository)
+
+    assert staged_files() == ["b.ctl"]
+    assert read_staged("b.ctl") == UNFORMATTED
+
+
+def test_unknown_ref_is_a_git_error(repository):
+    with pytest.raises(GitError):
+        changed_files("no-such-ref", str(repository))
+
+
+def test_staged_check_reads_the_index_and_writes_nothing(repository):
+    (repository / "b.ctl").write_text(UNFORMATTED)
+    git("add", "b.ctl", cwd=repository)
+    (repository / "b.ctl").write_text(FORMATTED)
+    (repository / "a.ctl").write_text(UNFORMATTED)
+
+    completed = run_linter(".", "--staged", cwd=repository)
+
+    assert completed.returncode == 1
+    assert "Would reformat b.ctl" in completed.stdout
+    assert "a.ctl" not in completed.stdout
+    assert (repository / "b.ctl").read_text() == FORMATTED
+
+
+def test_staged_is_not_allowed_with_diff_against(repository):
+    completed = run_linter(".", "--staged", "--diff-against", "HEAD", cwd=repository)
+
+    assert completed.returncode == 2
+    assert "--staged is not allowed with --diff-against" in completed.stderr
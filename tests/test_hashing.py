@@ -0,0 +1,110 @@
+import pytest
+
+from entities.nodes import FunctionDeclarationNode, IfStatementNode
+from services.formatter_ import Formatter
+from services.hashing import compute_digests, structural_hash, structurally_equal
+from services.parser_ import Parser
+from services.tokenizer import Tokenizer
+from services.visitor import walk
+
+# The same if statement at two depths, and in a second function
+CODE = """int g(int a)
+{
+  if (a>1)
+  {
+    f(makeDynString(1,2));
+  }
+  while (a)
+  {
+    if (a>1)
+    {
+      f(makeDynString(1,2));
+    }
+  }
+}
+
+int h(int a)
+{
+  if (a>1)
+  {
+    f(makeDynString(1,2));
+  }
+}
+"""
+
+
+def parse(code: str):
+    return Parser(Tokenizer(code).tokenize()).parse()
+
+
+def nodes_of(ast, node_type):
+    return [node for node in walk(ast) if isinstance(node, node_type)]
+
+
+@pytest.fixture(autouse=True)
+def empty_memo():
+    Formatter.memo.clear()
+    yield
+    Formatter.memo.clear()
+
+
+def test_equal_subtrees_share_a_hash_wherever_they_are():
+    first, second, third = nodes_of(parse(CODE), IfStatementNode)
+
+    assert first.span != second.span
+    assert structurally_equal(first, second)
+    assert structurally_equal(second, third)
+    assert structural_hash(first) == structural_hash(third)
+
+
+def test_different_subtrees_have_different_hashes():
+    first, second = nodes_of(parse(CODE), FunctionDeclarationNode)
+    changed = nodes_of(parse(CODE.replace("(1,2)", "(1,3)", 1)), IfStatementNode)[0]
+
+    assert not structurally_equal(first, second)
+    assert not structurally_equal(changed, nodes_of(parse(CODE), IfStatementNode)[1])
+
+
+def test_stable_digests_ignore_spans():
+    ast = parse(CODE)
+    shifted = parse("\n\n" + CODE)
+    digests = compute_digests(ast)
+    shifted_digests = compute_digests(shifted)
+
+    functions = nodes_of(ast, FunctionDeclarationNode)
+    shifted_functions = nodes_of(shifted, FunctionDeclarationNode)
+    assert [digests[id(node)] for node in functions] == [
+        shifted_digests[id(node)] for node in shifted_functions
+    ]
+
+
+def test_memoized_formatting_gives_the_fresh_output():
+    fresh = Formatter(parse(CODE)).format()
+
+    first = Formatter(parse(CODE), memoize=True).format()
+    assert Formatter.memo
+    memo_size = len(Formatter.memo)
+    # Everything is a hit the second time
+    second = Formatter(parse(CODE), memoize=True).format()
+
+    assert first == second == fresh
+    assert len(Formatter.memo) == memo_size
+
+
+def test_memo_hits_keep_the_indentation_of_each_occurrence():
+    fresh = Formatter(parse(CODE)).format()
+    memoized = Formatter(parse(CODE), memoize=True).format()
+
+    assert memoized == fresh
+    assert "\n  if (a > 1) {\n" in memoized
+    assert "\n    if (a > 1) {\n" in memoized
+
+
+def test_changed_subtree_is_not_a_memo_hit():
+    Formatter(parse(CODE), memoize=True).format()
+    changed = CODE.replace("makeDynString(1,2)", "makeDynString(1,2,3)")
+
+    assert (
+        Formatter(parse(changed), memoize=True).format()
+        == Formatter(parse(changed)).format()
+    )
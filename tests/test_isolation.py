@@ -0,0 +1,53 @@
+import os
+import time
+
+import pytest
+
+from entities.result import BUDGET_EXCEEDED, OK, FileResult
+from services.isolation import UNFINISHED_STAGE, Budget, IsolatedPool
+
+
+def initialize():
+    pass
+
+
+def process(path, on_lap):
+    """Complete a stage, then hang on "slow"; the messages hold the worker pid."""
+    on_lap("tokenize", 0.001)
+    if path == "slow":
+        while True:
+            time.sleep(0.01)
+    result = FileResult(path, OK)
+    result.messages.append(str(os.getpid()))
+    return result
+
+
+@pytest.fixture
+def pool():
+    pool = IsolatedPool(1, Budget(seconds=0.3), initialize, process)
+    yield pool
+    pool.shutdown()
+
+
+def test_budget_kills_the_worker_and_replaces_it(pool):
+    first = pool.submit("fast").result(timeout=10)
+    assert first.status == OK
+
+    killed = pool.submit("slow").result(timeout=10)
+
+    assert killed.status == BUDGET_EXCEEDED
+    assert "time budget" in killed.error
+    assert "tokenize" in killed.timings
+    assert UNFINISHED_STAGE in killed.timings
+
+    after = pool.submit("fast").result(timeout=10)
+    assert after.status == OK
+    assert after.messages != first.messages
+
+
+def test_files_queued_behind_a_killed_file_are_processed(pool):
+    futures = [pool.submit(path) for path in ("slow", "a", "b")]
+
+    statuses = [future.result(timeout=10).status for future in futures]
+
+    assert statuses == [BUDGET_EXCEEDED, OK, OK]
@@ -0,0 +1,224 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from services.lsp import REQUEST_CANCELLED, REQUEST_FAILED, Document, read_message
+
+LINTER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "linter.py")
+
+FORMATTED = "main() {\n  int a = 1;\n}"
+UNFORMATTED = "main()\n{\n  int a=1;\n}\n"
+
+# Fails in the tokenizer, with a TokenError
+UNTERMINATED = 'main()\n{\n  string s = "x;\n}\n'
+
+# Takes the parser about a second, far over the time limit of the server
+SLOW = "main() {\n" + "  int a = 1;\n" * 2000 + "}\n"
+
+
+class Client:
+    """Drives a language server process over its standard input and output."""
+
+    def __init__(self, *args):
+        self.process = subprocess.Popen(
+            [sys.executable, LINTER, "lsp", "--debounce", "0", *args],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self.next_id = 0
+
+    def notify(self, method: str, params: dict):
+        self.__write({"jsonrpc": "2.0", "method": method, "params": params})
+
+    def send(self, method: str, params: dict = None) -> int:
+        """Send a request without waiting for the response, return its id."""
+        self.next_id += 1
+        self.__write(
+            {"jsonrpc": "2.0", "id": self.next_id, "method": method, "params": params}
+        )
+        return self.next_id
+
+    def request(self, method: str, params: dict = None) -> dict:
+        request_id = self.send(method, params)
+        return self.receive(lambda message: message.get("id") == request_id)
+
+    def receive(self, matches) -> dict:
+        """The next message accepted by matches, skipping the others."""
+        while True:
+            message = read_message(self.process.stdout)
+            assert message is not None, "The server stopped"
+            if matches(message):
+                return message
+
+    def open(self, uri: str, text: str) -> list:
+        """Open a document and return the diagnostics published for it."""
+        self.notify(
+            "textDocument/didOpen",
+            {"textDocument": {"uri": uri, "text": text, "version": 1}},
+        )
+        message = self.receive(
+            lambda message: message.get("method") == "textDocument/publishDiagnostics"
+            and message["params"]["uri"] == uri
+        )
+        return message["params"]["diagnostics"]
+
+    def format(self, uri: str) -> dict:
+        return self.request("textDocument/formatting", {"textDocument": {"uri": uri}})
+
+    def close(self) -> int:
+        self.request("shutdown")
+        self.notify("exit", {})
+        return self.process.wait(10)
+
+    def __write(self, message: dict):
+        data = json.dumps(message).encode("utf-8")
+        self.process.stdin.write(b"Content-Length: %d\r\n\r\n" % len(data) + data)
+        self.process.stdin.flush()
+
+
+@pytest.fixture
+def client():
+    client = Client("--timeout", "0.3")
+    client.request("initialize", {})
+    yield client
+    if client.process.poll() is None:
+        client.process.kill()
+        client.process.wait()
+
+
+def test_formats_a_document(client):
+    client.open("file:///a.ctl", UNFORMATTED)
+
+    edits = client.format("file:///a.ctl")["result"]
+
+    assert [edit["newText"] for edit in edits] == [FORMATTED]
+    assert client.close() == 0
+
+
+def test_syntax_error_is_published_at_its_location(client):
+    diagnostics = client.open("file:///a.ctl", UNTERMINATED)
+
+    assert len(diagnostics) == 1
+    assert diagnostics[0]["range"]["start"] == {"line": 2, "character": 10}
+    assert diagnostics[0]["message"].startswith('Unexpected character "')
+
+
+def test_parser_failure_is_published_and_the_server_keeps_serving(client):
+    diagnostics = client.open("file:///broken.ctl", "main() {\n")
+    response = client.format("file:///broken.ctl")
+
+    assert diagnostics[0]["message"].startswith("Could not lint the document:")
+    assert response["error"]["code"] == REQUEST_FAILED
+    assert client.open("file:///a.ctl", FORMATTED) == []
+    assert client.close() == 0
+
+
+def test_document_over_the_time_limit_does_not_freeze_the_session(client):
+    diagnostics = client.open("file:///slow.ctl", SLOW)
+    response = client.format("file:///slow.ctl")
+
+    assert "exceeded the time budget of 0.3 s" in diagnostics[0]["message"]
+    assert "exceeded the time budget" in response["error"]["message"]
+    # The killed worker was replaced
+    client.open("file:///a.ctl", UNFORMATTED)
+    assert client.format("file:///a.ctl")["result"][0]["newText"] == FORMATTED
+    assert client.close() == 0
+
+
+def test_failing_notification_is_logged_and_the_server_keeps_serving(client):
+    client.open("file:///a.ctl", UNFORMATTED)
+    client.notify(
+        "textDocument/didChange",
+        {
+            "textDocument": {"uri": "file:///a.ctl", "version": 2},
+            "contentChanges": [{"range": "not a range", "text": ""}],
+        },
+    )
+
+    log = client.receive(lambda message: message.get("method") == "window/logMessage")
+
+    assert log["params"]["message"].startswith("textDocument/didChange failed")
+    assert client.format("file:///a.ctl")["result"][0]["newText"] == FORMATTED
+    assert client.close() == 0
+
+
+@pytest.mark.parametrize(
+    "method", ["textDocument/formatting", "textDocument/documentSymbol"]
+)
+def test_tokenizer_error_fails_the_request_and_keeps_the_worker(client, method):
+    client.open("file:///bad.ctl", UNTERMINATED)
+
+    response = client.request(method, {"textDocument": {"uri": "file:///bad.ctl"}})
+
+    assert response["error"]["code"] == REQUEST_FAILED
+    assert 'Unexpected character "' in response["error"]["message"]
+    assert "exited" not in response["error"]["message"]
+    client.open("file:///a.ctl", UNFORMATTED)
+    assert client.format("file:///a.ctl")["result"][0]["newText"] == FORMATTED
+    assert client.close() == 0
+
+
+def test_request_cancelled_while_the_worker_is_busy():
+    client = Client("--timeout", "5")
+    try:
+        client.request("initialize", {})
+        client.notify(
+            "textDocument/didOpen",
+            {"textDocument": {"uri": "file:///slow.ctl", "text": SLOW, "version": 1}},
+        )
+        request_id = client.send(
+            "textDocument/formatting", {"textDocument": {"uri": "file:///slow.ctl"}}
+        )
+        client.notify("$/cancelRequest", {"id": request_id})
+
+        response = client.receive(lambda message: message.get("id") == request_id)
+
+        assert response["error"]["code"] == REQUEST_CANCELLED
+        client.open("file:///a.ctl", UNFORMATTED)
+        assert client.format("file:///a.ctl")["result"][0]["newText"] == FORMATTED
+        assert client.close() == 0
+    finally:
+        if client.process.poll() is None:
+            client.process.kill()
+            client.process.wait()
+
+
+def test_cancelling_an_answered_request_changes_nothing(client):
+    client.open("file:///a.ctl", UNFORMATTED)
+    request_id = client.send(
+        "textDocument/formatting", {"textDocument": {"uri": "file:///a.ctl"}}
+    )
+    response = client.receive(lambda message: message.get("id") == request_id)
+    client.notify("$/cancelRequest", {"id": request_id})
+
+    assert response["result"][0]["newText"] == FORMATTED
+    assert client.format("file:///a.ctl")["result"][0]["newText"] == FORMATTED
+    assert client.close() == 0
+
+
+@pytest.mark.parametrize(
+    "start, end, expected",
+    [
+        # Past the end of the line: the end of that line, not the next one
+        ((1, 100), (1, 100), "main() {\n  int a = 1; // x\n}\n"),
+        ((0, 8), (1, 100), "main() { // x\n}\n"),
+        ((5, 0), (5, 0), "main() {\n  int a = 1;\n}\n // x"),
+    ],
+)
+def test_incremental_change_clamps_positions_to_their_line(start, end, expected):
+    document = Document("file:///a.ctl", "main() {\n  int a = 1;\n}\n", 1)
+
+    document.apply_change(
+        {
+            "range": {
+                "start": {"line": start[0], "character": start[1]},
+                "end": {"line": end[0], "character": end[1]},
+            },
+            "text": " // x",
+        }
+    )
+
+    assert document.text == expected
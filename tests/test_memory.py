@@ -0,0 +1,107 @@
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+
+import pytest
+
+import linter
+from services.config import load_config
+from services.rules import RuleEngine
+
+LINTER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "linter.py")
+
+CODE = "main() {\n  int a = 1;\n  if (a) {\n    a = a + 1;\n  }\n}\n"
+
+STAGES = ["read", "tokenize", "parse", "lint", "format", "write"]
+
+
+@pytest.fixture
+def traced(monkeypatch):
+    """This process set up as configure(memory=True) does, in check mode."""
+    monkeypatch.setattr(
+        linter, "rule_engine", RuleEngine.from_config(load_config(None))
+    )
+    monkeypatch.setattr(linter, "ast_cache", None)
+    monkeypatch.setattr(linter, "memoize_formatting", False)
+    monkeypatch.setattr(linter, "check_mode", True)
+    monkeypatch.setattr(linter, "diff_mode", False)
+    monkeypatch.setattr(linter, "measure_cpu", False)
+    monkeypatch.setattr(linter, "measure_memory", True)
+    tracemalloc.start()
+    yield
+    tracemalloc.stop()
+
+
+@pytest.fixture
+def folder(tmp_path):
+    for number in range(3):
+        (tmp_path / f"{number}.ctl").write_text(CODE * 3**number)
+    return tmp_path
+
+
+def run_linter(*args, cwd):
+    return subprocess.run(
+        [sys.executable, LINTER, *args],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_processing_records_the_peak_and_no_snapshot(traced, tmp_path):
+    path = tmp_path / "a.ctl"
+    path.write_text(CODE * 20)
+
+    result = linter.process_file(str(path))
+
+    assert result.peak_memory > len(CODE) * 100
+    assert result.memory_sites == []
+    assert list(result.timings) == STAGES
+
+
+def test_traced_sites_are_the_allocations_of_processing_the_file(traced, tmp_path):
+    path = tmp_path / "a.ctl"
+    path.write_text(CODE * 20)
+
+    sites = linter.trace_allocations(str(path))
+
+    assert 0 < len(sites) <= linter.MEMORY_SITES
+    assert all(size > 0 and blocks > 0 for _, size, blocks in sites)
+    assert any(os.path.join("services", "") in site for site, _, _ in sites)
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_only_the_largest_files_are_traced_after_the_run(folder, jobs):
+    completed = run_linter(
+        ".", "--check", "-j", jobs, "--memory", "1", "--report", "report.json",
+        cwd=folder,
+    )  # fmt: skip
+
+    assert completed.returncode == 1, completed.stderr
+    files = json.loads((folder / "report.json").read_text())["files"]
+    largest = max(files, key=lambda file: file["peak_memory"])
+    assert largest["path"].endswith("2.ctl")
+    assert largest["memory_sites"]
+    for file in files:
+        assert file["peak_memory"] > 0
+        assert "memory" not in file["timings"]
+        assert file["seconds"] == pytest.approx(sum(file["timings"].values()))
+        if file is not largest:
+            assert file["memory_sites"] == []
+    output = completed.stdout.split("--- Memory ---\n")[1]
+    assert output.startswith("Largest 1 files by peak memory:\n")
+    assert "blocks" in output
+
+
+def test_files_over_the_threshold_are_traced_and_listed(folder):
+    completed = run_linter(
+        ".", "--check", "--memory", "0", "--memory-threshold", "0.000001",
+        "--report", "report.json",
+        cwd=folder,
+    )  # fmt: skip
+
+    files = json.loads((folder / "report.json").read_text())["files"]
+    assert all(file["memory_sites"] for file in files)
+    assert "Files over 0.00 MB: 3" in completed.stdout
@@ -0,0 +1,117 @@
+import os
+import pstats
+import subprocess
+import sys
+
+import pytest
+
+from services.parser_ import Parser
+from services.profiling import CProfiler, SamplingProfiler, collapsed_stacks, subsystem
+from services.tokenizer import Tokenizer
+
+LINTER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "linter.py")
+
+CODE = "int f(int x) {\n  if (x > 1) {\n    return f(x - 1) * 2;\n  }\n  return x;\n}\n"
+
+A = ("a.py", 1, "a")
+B = ("b.py", 1, "b")
+C = ("c.py", 1, "c")
+D = ("d.py", 1, "d")
+
+
+def entry(own, cumulative, callers):
+    """A pstats entry, each caller given with the cumulative seconds of its calls."""
+    return (
+        1,
+        1,
+        own,
+        cumulative,
+        {caller: (1, 1, 0.0, seconds) for caller, seconds in callers.items()},
+    )
+
+
+def parse_collapsed(path):
+    stacks = {}
+    with open(path) as file:
+        for line in file:
+            frames, weight = line.rsplit(" ", 1)
+            stacks[tuple(frames.split(";"))] = int(weight)
+    return stacks
+
+
+def work():
+    for _ in range(20):
+        Parser(Tokenizer(CODE * 10).tokenize()).parse()
+
+
+@pytest.mark.parametrize(
+    "filename, name",
+    [
+        (os.path.join("x", "services", "tokenizer.py"), "tokenizer"),
+        (os.path.join("x", "entities", "token_.py"), "tokens"),
+        (os.path.join("lib", "re", "__init__.py"), None),
+    ],
+)
+def test_subsystem_follows_the_file(filename, name):
+    assert subsystem((filename, 1, "function")) == name
+
+
+def test_collapsed_stacks_split_the_time_of_a_function_between_its_callers():
+    stats = {
+        A: entry(1.0, 10.0, {}),
+        B: entry(8.0, 8.0, {A: 6.0, D: 2.0}),
+        # Recursive, the inner calls are part of the outer call
+        C: entry(3.0, 3.0, {A: 3.0, C: 1.0}),
+        D: entry(0.0, 2.0, {}),
+    }
+
+    stacks = collapsed_stacks(stats)
+
+    assert stacks == pytest.approx({(A,): 1.0, (A, B): 6.0, (A, C): 3.0, (D, B): 2.0})
+
+
+def test_cprofile_writes_collapsed_stacks_covering_the_profile(tmp_path):
+    profiler = CProfiler()
+    profiler.enable()
+    work()
+    profiler.disable()
+
+    paths = profiler.write(str(tmp_path / "run.prof"))
+
+    assert paths == [str(tmp_path / "run.prof"), str(tmp_path / "run.prof.folded")]
+    stats = pstats.Stats(paths[0]).stats
+    stacks = parse_collapsed(paths[1])
+    assert all(weight > 0 for weight in stacks.values())
+    assert any(stack[-1].startswith("[tokenizer] ") for stack in stacks)
+    assert any(stack[-1].startswith("[parser] ") for stack in stacks)
+    # Only the stacks below the cut-off share are missing
+    own = sum(own_seconds for _, _, own_seconds, _, _ in stats.values())
+    assert sum(stacks.values()) / 1_000_000 == pytest.approx(own, rel=0.05)
+
+
+def test_sampling_profiler_writes_the_sampled_stacks(tmp_path):
+    profiler = SamplingProfiler()
+    profiler.enable()
+    work()
+    profiler.disable()
+
+    paths = profiler.write(str(tmp_path / "run.prof"))
+
+    stacks = parse_collapsed(paths[1])
+    assert sum(stacks.values()) == sum(profiler.samples.values())
+
+
+@pytest.mark.parametrize("profiler", ["cprofile", "sampling"])
+def test_profile_option_reports_both_files(tmp_path, profiler):
+    (tmp_path / "a.ctl").write_text(CODE)
+
+    completed = subprocess.run(
+        [sys.executable, LINTER, "a.ctl", "--check", "--profile", "run.prof"]
+        + ["--profiler", profiler],
+        cwd=tmp_path,
+        capture_output=True,
+        text=True,
+    )
+
+    assert "Profile saved to run.prof, run.prof.folded" in completed.stdout
+    assert (tmp_path / "run.prof.folded").exists()
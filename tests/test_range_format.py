@@ -0,0 +1,106 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from services.formatter_ import Formatter
+from services.git_ import changed_line_ranges
+from services.parser_ import Parser
+from services.tokenizer import Tokenizer
+
+LINTER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "linter.py")
+
+# Two unformatted functions, separated by more blank lines than the formatter keeps
+CODE = "main()\n{\n  int a=1;\n}\n\n\n\nint f()\n{\n  return 2*3;\n}\n"
+FIRST_FORMATTED = "main() {\n  int a = 1;\n}"
+SECOND = "int f()\n{\n  return 2*3;\n}\n"
+SECOND_FORMATTED = "int f() {\n  return 2 * 3;\n}"
+
+
+def format_ranges(code, line_ranges):
+    ast = Parser(Tokenizer(code).tokenize()).parse()
+    return Formatter(ast).format_ranges(code, line_ranges)
+
+
+def git(*args, cwd):
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+    )
+
+
+def run_linter(*args, cwd):
+    return subprocess.run(
+        [sys.executable, LINTER, *args], cwd=cwd, capture_output=True, text=True
+    )
+
+
+@pytest.mark.parametrize("line_ranges", [[(1, 1)], [(3, 3)], [(2, 5)]])
+def test_only_the_statement_overlapping_the_range_is_formatted(line_ranges):
+    formatted = format_ranges(CODE, line_ranges)
+
+    assert formatted == FIRST_FORMATTED + CODE[CODE.index("}") + 1 :]
+    assert formatted.endswith("\n\n\n\n" + SECOND)
+
+
+def test_blank_lines_between_statements_touch_nothing():
+    assert format_ranges(CODE, [(6, 6)]) == CODE
+
+
+def test_several_ranges_format_every_overlapping_statement():
+    formatted = format_ranges(CODE, [(1, 1), (10, 20)])
+
+    assert formatted == FIRST_FORMATTED + "\n\n\n\n" + SECOND_FORMATTED + "\n"
+
+
+def test_lines_option_rewrites_only_the_range(tmp_path):
+    path = tmp_path / "a.ctl"
+    path.write_text(CODE)
+
+    completed = run_linter(str(path), "--lines", "9:9", cwd=tmp_path)
+
+    assert completed.returncode == 0
+    assert path.read_text() == CODE[: CODE.index("int f")] + SECOND_FORMATTED + "\n"
+
+
+@pytest.fixture
+def repository(tmp_path):
+    git("init", "-q", cwd=tmp_path)
+    (tmp_path / "a.ctl").write_text(CODE)
+    (tmp_path / "b.ctl").write_text(CODE)
+    git("add", ".", cwd=tmp_path)
+    git("commit", "-q", "-m", "initial", cwd=tmp_path)
+    return tmp_path
+
+
+def test_changed_line_ranges_follow_the_hunks(repository):
+    path = repository / "a.ctl"
+    lines = CODE.split("\n")
+    lines[2] = "  int a=2;"
+    del lines[8]
+    path.write_text("\n".join(lines))
+
+    assert changed_line_ranges(str(path), "HEAD") == [(3, 3), (8, 8)]
+
+
+def test_untracked_file_is_changed_as_a_whole(repository):
+    path = repository / "new.ctl"
+    path.write_text(CODE)
+
+    assert changed_line_ranges(str(path), "HEAD") == [(1, CODE.count("\n") + 1)]
+
+
+def test_diff_against_formats_only_the_changed_statements(repository):
+    changed = CODE.replace("2*3", "2*4")
+    (repository / "a.ctl").write_text(changed)
+
+    completed = run_linter(str(repository), "--diff-against", "HEAD", cwd=repository)
+
+    assert completed.returncode == 0, completed.stderr
+    assert (repository / "a.ctl").read_text() == changed[
+        : changed.index("int f")
+    ] + SECOND_FORMATTED.replace("3", "4") + "\n"
+    assert (repository / "b.ctl").read_text() == CODE
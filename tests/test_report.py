@@ -0,0 +1,92 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from entities.result import BUDGET_EXCEEDED, ERROR, OK, FileResult
+from services.parser_ import Parser
+from services.report import RunReport, percentile
+from services.tokenizer import Tokenizer
+from services.visitor import walk
+
+LINTER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "linter.py")
+
+CODE = "main() {\n  int a = 1;\n  if (a) {\n    a = a + 1;\n  }\n}"
+
+
+def result(path, status=OK, seconds=0.0, size=0, changed=False):
+    file_result = FileResult(path, status, changed)
+    file_result.timings = {"parse": seconds}
+    file_result.size = size
+    return file_result
+
+
+@pytest.mark.parametrize(
+    "rank, expected", [(0, 1.0), (50, 5.0), (95, 10.0), (99, 10.0), (100, 10.0)]
+)
+def test_percentile_is_the_nearest_rank(rank, expected):
+    assert percentile([float(value) for value in range(1, 11)], rank) == expected
+
+
+def test_percentile_of_no_values_is_zero():
+    assert percentile([], 50) == 0.0
+
+
+def test_counts_follow_the_statuses():
+    report = RunReport()
+    for status, changed in [(OK, False), (OK, True), (ERROR, False)]:
+        report.add(result("a.ctl", status, changed=changed))
+    report.add(result("b.ctl", BUDGET_EXCEEDED))
+
+    assert (report.total, report.successful, report.errors) == (4, 2, 1)
+    assert (report.budget_exceeded, report.changed) == (1, 1)
+
+
+def test_aggregates_sum_the_files_and_rank_the_latencies():
+    report = RunReport()
+    for number in range(1, 101):
+        report.add(result(f"{number}.ctl", seconds=number / 1000, size=1024))
+    report.finish()
+
+    aggregates = report.aggregates()
+
+    assert aggregates["files"] == 100
+    assert aggregates["bytes"] == 100 * 1024
+    assert aggregates["latency_p50"] == pytest.approx(0.050)
+    assert aggregates["latency_p95"] == pytest.approx(0.095)
+    assert aggregates["latency_p99"] == pytest.approx(0.099)
+    assert aggregates["stage_seconds"]["parse"] == pytest.approx(5.05)
+    assert aggregates["files_per_second"] == pytest.approx(100 / report.wall_seconds)
+    assert [file.path for file in report.slowest(2)] == ["100.ctl", "99.ctl"]
+
+
+def test_report_option_writes_every_file_and_its_counts(tmp_path):
+    (tmp_path / "a.ctl").write_text(CODE)
+    (tmp_path / "b.ctl").write_text("main() {")
+
+    completed = subprocess.run(
+        [sys.executable, LINTER, str(tmp_path), "--check", "--report", "run.json"],
+        cwd=tmp_path,
+        capture_output=True,
+        text=True,
+    )
+
+    assert "Traceback" not in completed.stderr
+    with open(tmp_path / "run.json") as file:
+        document = json.load(file)
+    files = {os.path.basename(file["path"]): file for file in document["files"]}
+    assert files["a.ctl"]["status"] == OK
+    assert files["a.ctl"]["size"] == len(CODE)
+    assert files["a.ctl"]["tokens"] == len(Tokenizer(CODE).tokenize())
+    assert files["a.ctl"]["nodes"] == sum(
+        1 for _ in walk(Parser(Tokenizer(CODE).tokenize()).parse())
+    )
+    assert files["a.ctl"]["seconds"] == pytest.approx(
+        sum(files["a.ctl"]["timings"].values())
+    )
+    assert files["b.ctl"]["status"] == ERROR
+    aggregates = document["aggregates"]
+    assert (aggregates["files"], aggregates["errors"]) == (2, 1)
+    assert aggregates["tokens"] == files["a.ctl"]["tokens"]
@@ -0,0 +1,115 @@
+import os
+
+import pytest
+
+from entities.diagnostic import Diagnostic
+from entities.result import BUDGET_EXCEEDED, OK, FileResult
+from services.result_cache import ResultCache, content_digest, results_fingerprint
+
+CODE = "main() {\n  int a = 1;\n}"
+
+
+def processed(path, status=OK) -> FileResult:
+    """The result of a file as process_file records it."""
+    with open(path) as file:
+        code = file.read()
+    stat = os.stat(path)
+    result = FileResult(str(path), status)
+    result.size = stat.st_size
+    result.mtime_ns = stat.st_mtime_ns
+    result.digest = content_digest(code)
+    result.diagnostics = [Diagnostic("empty-block", "Empty block", "warning", 1, 8)]
+    return result
+
+
+def set_mtime(path, mtime_ns):
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "a.ctl"
+    path.write_text(CODE)
+    set_mtime(path, 1_000_000_000_000_000_000)
+    return path
+
+
+@pytest.fixture
+def cache_file(tmp_path, source):
+    cache = ResultCache(str(tmp_path / "cache" / "results.pickle"), "fingerprint")
+    cache.store(processed(source))
+    cache.save()
+    return cache.path
+
+
+def test_unchanged_file_is_a_hit_after_reloading(cache_file, source):
+    cache = ResultCache(cache_file, "fingerprint")
+
+    result = cache.lookup(str(source))
+
+    assert result is not None
+    assert result.status == OK
+    assert [diagnostic.rule for diagnostic in result.diagnostics] == ["empty-block"]
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_edit_of_the_same_size_is_a_miss(cache_file, source):
+    source.write_text(CODE.replace("1", "2"))
+    set_mtime(source, 1_000_000_000_000_000_001)
+    cache = ResultCache(cache_file, "fingerprint")
+
+    assert cache.lookup(str(source)) is None
+    assert cache.misses == 1
+
+
+def test_edit_changing_the_size_is_a_miss(cache_file, source):
+    source.write_text(CODE.replace("1", "10"))
+    set_mtime(source, 1_000_000_000_000_000_000)
+    cache = ResultCache(cache_file, "fingerprint")
+
+    assert cache.lookup(str(source)) is None
+
+
+def test_touched_file_is_a_hit_and_its_new_time_is_kept(cache_file, source):
+    set_mtime(source, 1_000_000_000_000_000_042)
+    cache = ResultCache(cache_file, "fingerprint")
+
+    assert cache.lookup(str(source)) is not None
+    cache.save()
+
+    reloaded = ResultCache(cache_file, "fingerprint")
+    assert reloaded.entries[str(source)][1] == 1_000_000_000_000_000_042
+
+
+def test_new_fingerprint_drops_every_entry(cache_file, source):
+    cache = ResultCache(cache_file, "another fingerprint")
+
+    assert cache.entries == {}
+    assert cache.lookup(str(source)) is None
+
+
+def test_unreadable_cache_starts_over(cache_file, source):
+    with open(cache_file, "wb") as file:
+        file.write(b"not a pickle")
+
+    cache = ResultCache(cache_file, "fingerprint")
+
+    assert cache.lookup(str(source)) is None
+    cache.store(processed(source))
+    cache.save()
+    assert ResultCache(cache_file, "fingerprint").lookup(str(source)) is not None
+
+
+def test_incomplete_results_are_not_stored(tmp_path, source):
+    cache = ResultCache(str(tmp_path / "results.pickle"), "fingerprint")
+
+    cache.store(processed(source, BUDGET_EXCEEDED))
+
+    assert cache.entries == {}
+
+
+def test_fingerprint_follows_the_configuration():
+    config = {"indent": 2, "rules": {}}
+
+    assert results_fingerprint(config) == results_fingerprint(dict(config))
+    assert results_fingerprint(config) != results_fingerprint(dict(config, indent=4))
@@ -0,0 +1,97 @@
+import pytest
+
+from entities.nodes import BinaryExpressionNode, ReturnNode
+from services.parser_ import Parser
+from services.spans import LineIndex
+from services.tokenizer import Tokenizer
+from services.visitor import iter_child_nodes, walk
+
+CODE = (
+    "int f(int x) {\n"
+    "  return x + 1;\n"
+    "}\n"
+    "\n"
+    "main() {\n"
+    "  if (f(2) > 1) {\n"
+    "    f(3 * (4 + 5));\n"
+    "  }\n"
+    "}\n"
+)
+
+
+def parse(code: str):
+    return Parser(Tokenizer(code).tokenize()).parse()
+
+
+def innermost(root, offset):
+    """The deepest node containing the offset, found by scanning the whole tree."""
+    found = None
+    stack = [(root, 0)]
+    best_depth = -1
+    while stack:
+        node, depth = stack.pop()
+        if node.span is not None and node.span[0] <= offset < node.span[1]:
+            if depth > best_depth:
+                found, best_depth = node, depth
+        for child in iter_child_nodes(node):
+            stack.append((child, depth + 1))
+    return found
+
+
+def test_every_parsed_node_has_a_span_within_its_parent():
+    ast = parse(CODE)
+
+    for node in walk(ast):
+        assert node.span is not None, type(node).__name__
+        for child in iter_child_nodes(node):
+            assert node.span[0] <= child.span[0] <= child.span[1] <= node.span[1]
+
+
+def test_spans_cover_the_source_of_the_node():
+    ast = parse(CODE)
+    sources = {
+        CODE[node.span[0] : node.span[1]]
+        for node in walk(ast)
+        if isinstance(node, (BinaryExpressionNode, ReturnNode))
+    }
+
+    assert {"x + 1", "return x + 1;", "3 * (4 + 5)", "4 + 5"} <= sources
+
+
+def test_node_at_returns_the_innermost_node_at_every_offset():
+    ast = parse(CODE)
+
+    for offset in range(len(CODE) + 2):
+        assert ast.node_at(offset) is innermost(ast, offset), offset
+
+
+def test_node_at_outside_the_program_is_none():
+    ast = parse("  main() {\n}")
+
+    assert ast.node_at(-1) is None
+    assert ast.node_at(100) is None
+
+
+def test_node_at_follows_the_tree_after_invalidation():
+    ast = parse(CODE)
+    offset = CODE.index("x + 1")
+    before = ast.node_at(offset)
+
+    ast.statements.pop(0)
+    assert ast.node_at(offset) is before
+    ast.invalidate_span_index()
+
+    assert ast.node_at(offset) is innermost(ast, offset)
+    assert ast.node_at(offset) is not before
+
+
+@pytest.mark.parametrize("code", [CODE, "", "a", "\n\n", "a\nb"])
+def test_line_index_offsets_and_positions_agree(code):
+    index = LineIndex(code)
+
+    for offset in range(len(code)):
+        line, column = index.position(offset)
+        assert line == code.count("\n", 0, offset) + 1
+        assert column == offset - code.rfind("\n", 0, offset)
+        assert index.offset(line, column) == offset
+    assert index.offset(len(code.split("\n")) + 5) == len(code)
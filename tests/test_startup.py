@@ -0,0 +1,115 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+# Cold start of the linter. Runs that do not need them must not import the
+# modules of other commands and options, and the startup must stay close to
+# that of a bare interpreter running argparse.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TINY_FILE = "main()\n{\n  int x = 1;\n}\n"
+
+# Must not be imported when formatting one file without options
+DEFERRED_MODULES = [
+    "concurrent.futures",
+    "ctypes",
+    "difflib",
+    "hashlib",
+    "multiprocessing",
+    "socket",
+    "subprocess",
+    "tempfile",
+    "threading",
+    "services.ast_export",
+    "services.cache",
+    "services.daemon",
+    "services.daemon_client",
+    "services.diagnostic_sink",
+    "services.duplicates",
+    "services.git_",
+    "services.isolation",
+    "services.lsp",
+    "services.profiling",
+    "services.result_cache",
+    "services.walker",
+    "services.watch",
+]
+
+# Imports linter and runs its main(), so that the lazy imports of the run are
+# seen too
+RUNNER = "import sys, linter; sys.argv = ['linter.py', *sys.argv[1:]]; linter.main()"
+
+# Nothing but the interpreter and argparse, which the linter needs anyway
+BASELINE = "import argparse; argparse.ArgumentParser().parse_args(['--help'])"
+
+# How many times slower than the baseline `linter.py --help` may start, the
+# CTLLINT_STARTUP_RATIO environment variable overrides it. Wall-clock ratios
+# are steadier between machines than times. The margin leaves room for noise,
+# the small regressions are caught by DEFERRED_MODULES.
+DEFAULT_STARTUP_RATIO = 3.0
+
+RUNS = 7  # The fastest run of each command is compared
+
+
+def imported_modules(tmp_path) -> set:
+    """Names of the modules imported by formatting a small file."""
+    path = tmp_path / "tiny.ctl"
+    path.write_text(TINY_FILE)
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            RUNNER,
+            str(path),
+            "--check",
+            "--diagnostics",
+            str(tmp_path / "diagnostics.txt"),
+        ],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    assert process.returncode in (0, 1), process.stderr
+    modules = set()
+    for line in process.stderr.splitlines():
+        if line.startswith("import time:") and "cumulative" not in line:
+            modules.add(line.split("|")[-1].strip())
+    return modules
+
+
+def fastest_run(*args) -> float:
+    best = None
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+@pytest.fixture(scope="module")
+def imported(tmp_path_factory):
+    return imported_modules(tmp_path_factory.mktemp("startup"))
+
+
+@pytest.mark.parametrize("module", DEFERRED_MODULES)
+def test_formatting_one_file_does_not_import(imported, module):
+    assert module not in imported
+
+
+def test_startup_stays_close_to_a_bare_interpreter():
+    ratio = float(os.environ.get("CTLLINT_STARTUP_RATIO", DEFAULT_STARTUP_RATIO))
+
+    baseline = fastest_run("-c", BASELINE)
+    linter = fastest_run(os.path.join(ROOT, "linter.py"), "--help")
+
+    assert linter <= baseline * ratio, (
+        f"linter.py --help takes {linter * 1000:.0f} ms, more than {ratio} times the "
+        f"{baseline * 1000:.0f} ms of the baseline"
+    )
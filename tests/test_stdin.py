@@ -0,0 +1,121 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+LINTER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "linter.py")
+
+FORMATTED = "main() {\n  int a = 1;\n}"
+UNFORMATTED = "main()\n{\n  int a=1;\n}\n"
+EMPTY_IF = "main() {\n  if (a) {\n  }\n}"
+TRUNCATED = "main() {\n  int a=1;\n"
+
+
+def run_stdin(*args, input, cwd):
+    return subprocess.run(
+        [sys.executable, LINTER, "-", *args],
+        cwd=cwd,
+        input=input,
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_formatted_code_goes_to_standard_output_and_nothing_to_disk(tmp_path):
+    completed = run_stdin(input=UNFORMATTED, cwd=tmp_path)
+
+    assert completed.returncode == 0
+    assert completed.stdout == FORMATTED
+    assert completed.stderr == ""
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_diff_is_labelled_with_the_stdin_filename(tmp_path):
+    completed = run_stdin(
+        "--diff", "--stdin-filename", "src/a.ctl", input=UNFORMATTED, cwd=tmp_path
+    )
+
+    assert completed.returncode == 0
+    assert completed.stdout.startswith("--- src/a.ctl\n+++ src/a.ctl\n")
+    assert "+  int a = 1;\n" in completed.stdout
+
+
+def test_text_diagnostics_go_to_standard_error(tmp_path):
+    completed = run_stdin("--stdin-filename", "src/a.ctl", input=EMPTY_IF, cwd=tmp_path)
+
+    assert completed.returncode == 0
+    assert completed.stderr.startswith("src/a.ctl: ")
+    assert "Empty block" in completed.stderr
+    assert "Empty block" not in completed.stdout
+
+
+def test_json_diagnostics_are_one_object_on_standard_error(tmp_path):
+    completed = run_stdin(
+        "--stdin-diagnostics", "json", "--stdin-filename", "a.ctl",
+        input=UNFORMATTED + EMPTY_IF, cwd=tmp_path,
+    )  # fmt: skip
+
+    document = json.loads(completed.stderr)
+    assert document["path"] == "a.ctl"
+    assert document["error"] is None
+    assert document["changed"] is True
+    assert [diagnostic["rule"] for diagnostic in document["diagnostics"]] == [
+        "empty-block"
+    ]
+
+
+@pytest.mark.parametrize("diagnostics", ["text", "json"])
+def test_malformed_code_is_an_error_without_output(tmp_path, diagnostics):
+    completed = run_stdin(
+        "--stdin-diagnostics", diagnostics, input=TRUNCATED, cwd=tmp_path
+    )
+
+    assert completed.returncode == 1
+    assert completed.stdout == ""
+    assert "Traceback" not in completed.stderr
+    if diagnostics == "json":
+        assert json.loads(completed.stderr)["error"]
+    else:
+        assert completed.stderr.startswith("Error in <stdin>: ")
+
+
+def test_stdin_filename_finds_the_nearest_configuration(tmp_path):
+    (tmp_path / "config.json").write_text('{"rules": {"empty-block": true}}')
+    (tmp_path / "deep").mkdir()
+    (tmp_path / "deep" / "config.json").write_text('{"rules": {"empty-block": false}}')
+
+    nested = run_stdin(
+        "--stdin-filename", "deep/inner/a.ctl", input=EMPTY_IF, cwd=tmp_path
+    )
+    top = run_stdin("--stdin-filename", "a.ctl", input=EMPTY_IF, cwd=tmp_path)
+
+    assert "Empty block" not in nested.stderr
+    assert "Empty block" in top.stderr
+
+
+def test_lines_only_format_the_given_statements(tmp_path):
+    code = "int x=1;\nint y=2;\n"
+
+    completed = run_stdin("--lines", "2:2", input=code, cwd=tmp_path)
+
+    assert completed.stdout == "int x=1;\nint y = 2;\n"
+
+
+def test_cache_directory_is_used(tmp_path):
+    cache = tmp_path / "cache"
+
+    first = run_stdin("--cache-dir", str(cache), input=UNFORMATTED, cwd=tmp_path)
+    second = run_stdin("--cache-dir", str(cache), input=UNFORMATTED, cwd=tmp_path)
+
+    assert any(files for _, _, files in os.walk(cache))
+    assert first.stdout == second.stdout == FORMATTED
+
+
+@pytest.mark.parametrize("option", [["-o", "out.ctl"], ["--staged"], ["--watch", "1"]])
+def test_options_writing_or_finding_files_are_usage_errors(tmp_path, option):
+    completed = run_stdin(*option, input=FORMATTED, cwd=tmp_path)
+
+    assert completed.returncode == 2
+    assert "not allowed with -" in completed.stderr
@@ -0,0 +1,113 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import linter
+from entities.result import FileResult
+from services.config import load_config
+from services.report import RunReport
+from services.rules import RuleEngine
+
+LINTER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "linter.py")
+
+CODE = "main() {\n  int a = 1;\n  if (a) {\n    a = a + 1;\n  }\n}"
+
+STAGES = ["read", "tokenize", "parse", "lint", "format", "write"]
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "a.ctl"
+    path.write_text(CODE)
+    return path
+
+
+def configure(monkeypatch, timings):
+    """Set up this process as configure() does, without touching the files."""
+    monkeypatch.setattr(
+        linter, "rule_engine", RuleEngine.from_config(load_config(None))
+    )
+    monkeypatch.setattr(linter, "ast_cache", None)
+    monkeypatch.setattr(linter, "memoize_formatting", False)
+    monkeypatch.setattr(linter, "check_mode", True)
+    monkeypatch.setattr(linter, "diff_mode", False)
+    monkeypatch.setattr(linter, "measure_cpu", timings)
+    monkeypatch.setattr(linter, "measure_memory", False)
+
+
+def test_every_stage_gets_its_wall_and_cpu_time(monkeypatch, source):
+    configure(monkeypatch, timings=True)
+
+    result = linter.process_file(str(source))
+
+    assert list(result.timings) == STAGES
+    assert list(result.cpu_timings) == STAGES
+    assert all(seconds >= 0 for seconds in result.timings.values())
+    assert all(seconds >= 0 for seconds in result.cpu_timings.values())
+    assert result.seconds == pytest.approx(sum(result.timings.values()))
+
+
+def test_cpu_time_is_not_measured_without_the_option(monkeypatch, source):
+    configure(monkeypatch, timings=False)
+
+    result = linter.process_file(str(source))
+
+    # The wall times are kept for the report, which is cheap
+    assert list(result.timings) == STAGES
+    assert result.cpu_timings == {}
+
+
+def test_failed_file_charges_the_rest_to_a_failed_stage(monkeypatch, tmp_path):
+    configure(monkeypatch, timings=True)
+    path = tmp_path / "bad.ctl"
+    path.write_text('main() {\n  string s = "open;\n}')
+
+    result = linter.process_file(str(path))
+
+    assert list(result.timings)[0] == "read"
+    assert list(result.timings)[-1] == "failed"
+
+
+def test_stage_totals_add_up_the_files_in_the_order_stages_first_ran():
+    report = RunReport()
+    for timings, cpu_timings in [
+        ({"read": 0.1, "parse": 0.2}, {"read": 0.01, "parse": 0.15}),
+        ({"read": 0.3, "git": 0.4, "parse": 0.5}, {"parse": 0.45}),
+    ]:
+        result = FileResult("a.ctl")
+        result.timings = timings
+        result.cpu_timings = cpu_timings
+        report.add(result)
+
+    totals = report.stage_totals()
+
+    assert list(totals) == ["read", "parse", "git"]
+    assert totals["read"] == pytest.approx((0.4, 0.01))
+    assert totals["parse"] == pytest.approx((0.7, 0.6))
+    assert totals["git"] == pytest.approx((0.4, 0.0))
+
+
+def test_timings_option_prints_the_stages_and_the_slowest_files(tmp_path):
+    for number in range(3):
+        (tmp_path / f"{number}.ctl").write_text(CODE * (number + 1))
+
+    completed = subprocess.run(
+        [sys.executable, LINTER, str(tmp_path), "--check", "--timings", "2"],
+        cwd=tmp_path,
+        capture_output=True,
+        text=True,
+    )
+
+    assert completed.returncode in (0, 1), completed.stderr
+    output = completed.stdout.split("--- Timings ---\n")[1]
+    table, slowest = output.split("\nSlowest 2 files:\n")
+    assert [line.split()[0] for line in table.splitlines()[1:]] == STAGES + ["total"]
+    files = slowest.strip().splitlines()
+    assert len(files) == 2
+    for line in files:
+        size = int(line.split("ms")[1].split("bytes")[0])
+        path = line.split("bytes")[1].split("(")[0].strip()
+        assert size == os.path.getsize(path)
+        assert "parse" in line
@@ -0,0 +1,120 @@
+import sys
+
+import pytest
+
+from entities.nodes import BinaryExpressionNode, FunctionDeclarationNode, NumberNode
+from services.parser_ import Parser
+from services.tokenizer import Tokenizer
+from services.visitor import (
+    POST_ORDER,
+    PRE_ORDER,
+    SKIP,
+    Visitor,
+    iter_child_nodes,
+    walk,
+)
+
+CODE = "int f(int x) {\n  return x + 1;\n}\n\nmain() {\n  f(2);\n}"
+
+
+def parse(code: str):
+    return Parser(Tokenizer(code).tokenize()).parse()
+
+
+def names(nodes):
+    return [type(node).__name__ for node in nodes]
+
+
+def deep_sum(depth: int):
+    """1 + 1 + ... nested to the left, deeper than the recursion limit."""
+    node = NumberNode("1")
+    for _ in range(depth):
+        node = BinaryExpressionNode(node, "+", NumberNode("1"))
+    return node
+
+
+def test_pre_order_yields_parents_before_children_in_source_order():
+    ast = parse(CODE)
+
+    nodes = list(walk(ast, PRE_ORDER))
+
+    assert nodes[0] is ast
+    functions = [node for node in nodes if isinstance(node, FunctionDeclarationNode)]
+    assert [function.identifier for function in functions] == ["f", "main"]
+    for node in nodes:
+        for child in iter_child_nodes(node):
+            assert nodes.index(node) < nodes.index(child)
+
+
+def test_post_order_yields_children_before_parents():
+    ast = parse(CODE)
+
+    nodes = list(walk(ast, POST_ORDER))
+
+    assert nodes[-1] is ast
+    for node in nodes:
+        for child in iter_child_nodes(node):
+            assert nodes.index(child) < nodes.index(node)
+    assert sorted(map(id, nodes)) == sorted(map(id, walk(ast, PRE_ORDER)))
+
+
+def test_unknown_order_is_rejected():
+    with pytest.raises(ValueError):
+        list(walk(parse(CODE), "level"))
+
+
+def test_walk_and_visit_handle_trees_deeper_than_the_recursion_limit():
+    depth = sys.getrecursionlimit() * 2
+
+    assert sum(1 for _ in walk(deep_sum(depth))) == 2 * depth + 1
+    assert Visitor().visit(deep_sum(depth)) == 2 * depth + 1
+
+
+def test_visitor_calls_visit_and_leave_handlers_around_the_children():
+    events = []
+
+    class Recorder(Visitor):
+        def visit_FunctionDeclarationNode(self, node):
+            events.append(("visit", node.identifier))
+
+        def leave_FunctionDeclarationNode(self, node):
+            events.append(("leave", node.identifier))
+
+        def visit_BlockNode(self, node):
+            events.append(("block",))
+
+    Recorder().visit(parse(CODE))
+
+    assert events == [
+        ("visit", "f"),
+        ("block",),
+        ("leave", "f"),
+        ("visit", "main"),
+        ("block",),
+        ("leave", "main"),
+    ]
+
+
+def test_skip_prunes_the_subtree_and_the_leave_handler_of_the_node():
+    seen = []
+
+    class Pruning(Visitor):
+        def visit_FunctionDeclarationNode(self, node):
+            seen.append(node.identifier)
+            return SKIP if node.identifier == "f" else None
+
+        def leave_FunctionDeclarationNode(self, node):
+            seen.append(f"/{node.identifier}")
+
+        def visit_BlockNode(self, node):
+            seen.append("block")
+
+    ast = parse(CODE)
+    visited = Pruning().visit(ast)
+
+    assert seen == ["f", "main", "block", "/main"]
+    pruned = next(
+        node for node in walk(ast) if isinstance(node, FunctionDeclarationNode)
+    )
+    below_pruned = sum(1 for _ in walk(pruned)) - 1
+    assert visited == sum(1 for _ in walk(ast)) - below_pruned
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+from services.walker import IGNORE_FILE, is_ignored, walk_ctl_files
+
+
+def create(root, files):
+    for name, text in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    create(
+        tmp_path,
+        {
+            IGNORE_FILE: "*.gen.ctl\n!keep.gen.ctl\nbuild/\n!build/inside.ctl\n",
+            "main.ctl": "",
+            "skip.gen.ctl": "",
+            "keep.gen.ctl": "",
+            "build/inside.ctl": "",
+            "lib/util.ctl": "",
+            "lib/util.gen.ctl": "",
+            f"lib/{IGNORE_FILE}": "!util.gen.ctl\nold/\n",
+            "lib/old/legacy.ctl": "",
+        },
+    )
+    return tmp_path
+
+
+def relative(root, paths):
+    return [os.path.relpath(path, root).replace(os.sep, "/") for path in paths]
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_walk_applies_negations_and_prunes_ignored_directories(tree, threads):
+    files = relative(tree, walk_ctl_files(str(tree), threads))
+
+    # A deeper ignore file re-includes a file, but nothing re-includes a file
+    # in an excluded directory
+    assert files == ["keep.gen.ctl", "lib/util.ctl", "lib/util.gen.ctl", "main.ctl"]
+
+
+def test_ignored_directories_are_not_listed(tree, monkeypatch):
+    listed = []
+    scandir = os.scandir
+
+    def recording_scandir(path):
+        listed.append(os.path.relpath(path, tree))
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", recording_scandir)
+    list(walk_ctl_files(str(tree)))
+
+    assert sorted(listed) == [".", "lib"]
+
+
+@pytest.mark.parametrize(
+    "name, ignored",
+    [
+        ("main.ctl", False),
+        ("skip.gen.ctl", True),
+        ("keep.gen.ctl", False),
+        ("build/inside.ctl", True),
+        ("lib/util.gen.ctl", False),
+        ("lib/old/legacy.ctl", True),
+    ],
+)
+def test_is_ignored_agrees_with_the_walk(tree, name, ignored):
+    assert is_ignored(str(tree / name), str(tree)) == ignored
@@ -0,0 +1,156 @@
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from services.watch import InotifyWatcher, PollingWatcher, watch
+
+LINTER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "linter.py")
+
+FORMATTED = "main() {\n  int a = 1;\n}"
+UNFORMATTED = "main()\n{\n  int a=1;\n}\n"
+
+
+def inotify_available():
+    try:
+        InotifyWatcher(".").close()
+    except (OSError, AttributeError):
+        return False
+    return True
+
+
+def wait_for(watcher, expected, timeout=5.0):
+    """Collect the changes reported until they include the expected paths."""
+    changed = set()
+    deadline = time.monotonic() + timeout
+    while not expected <= changed and time.monotonic() < deadline:
+        changed |= watcher.wait(0.1)
+    return changed
+
+
+@pytest.fixture
+def tree(tmp_path):
+    (tmp_path / "lib").mkdir()
+    (tmp_path / "a.ctl").write_text(FORMATTED)
+    (tmp_path / "lib" / "b.ctl").write_text(FORMATTED)
+    return tmp_path
+
+
+def change_tree(tree):
+    """Modify, delete and create files, the last ones in a new directory."""
+    (tree / "a.ctl").write_text(UNFORMATTED)
+    (tree / "lib" / "b.ctl").unlink()
+    (tree / "notes.txt").write_text("")
+    (tree / "new").mkdir()
+    (tree / "new" / "c.ctl").write_text(FORMATTED)
+    return {
+        str(tree / "a.ctl"),
+        str(tree / "lib" / "b.ctl"),
+        str(tree / "new" / "c.ctl"),
+    }
+
+
+def test_polling_watcher_reports_modified_deleted_and_created_files(tree):
+    watcher = PollingWatcher(str(tree), interval=0.05)
+    expected = change_tree(tree)
+
+    assert wait_for(watcher, expected) == expected
+
+
+@pytest.mark.skipif(not inotify_available(), reason="inotify is not available")
+def test_inotify_watcher_reports_modified_deleted_and_created_files(tree):
+    watcher = InotifyWatcher(str(tree))
+    try:
+        expected = change_tree(tree)
+
+        assert wait_for(watcher, expected) == expected
+    finally:
+        watcher.close()
+
+
+class ScriptedWatcher:
+    """Reports the given batches of changes, one per wait, then nothing."""
+
+    def __init__(self, batches, rescan_after=None):
+        self.batches = list(batches)
+        self.rescan_after = rescan_after
+        self.rescan_needed = False
+        self.closed = False
+
+    def wait(self, timeout=None):
+        if not self.batches:
+            raise KeyboardInterrupt
+        batch = self.batches.pop(0)
+        if batch == self.rescan_after:
+            self.rescan_needed = True
+        return set(batch)
+
+    def close(self):
+        self.closed = True
+
+
+def test_bursts_of_changes_are_handled_together(tmp_path):
+    calls = []
+    watcher = ScriptedWatcher([{"a"}, {"b"}, {"a", "c"}, set(), {"d"}, set()])
+
+    with pytest.raises(KeyboardInterrupt):
+        watch(str(tmp_path), calls.append, debounce=0, watcher=watcher)
+
+    assert calls == [{"a", "b", "c"}, {"d"}]
+    assert watcher.closed
+
+
+def test_lost_events_rescan_every_file(tree):
+    calls = []
+    watcher = ScriptedWatcher([set(), set()], rescan_after=set())
+
+    with pytest.raises(KeyboardInterrupt):
+        watch(str(tree), calls.append, debounce=0, watcher=watcher)
+
+    assert calls == [{str(tree / "a.ctl"), str(tree / "lib" / "b.ctl")}]
+
+
+def test_watch_option_formats_changed_files_once(tree):
+    process = subprocess.Popen(
+        [sys.executable, LINTER, "--watch", str(tree)],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    lines = queue.Queue()
+    threading.Thread(
+        target=lambda: [lines.put(line) for line in process.stdout], daemon=True
+    ).start()
+
+    def read_until(text, timeout=10):
+        deadline = time.monotonic() + timeout
+        seen = []
+        while time.monotonic() < deadline:
+            try:
+                line = lines.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            seen.append(line)
+            if text in line:
+                return seen
+        raise AssertionError(f"{text!r} not printed, got {seen!r}")
+
+    try:
+        read_until("Watching")
+        # The watcher is set up right after the message
+        time.sleep(0.5)
+        (tree / "a.ctl").write_text(UNFORMATTED)
+
+        output = read_until("Processed 1 changed files")
+
+        assert f"Formatted code saved to {tree / 'a.ctl'}\n" in output
+        assert (tree / "a.ctl").read_text() == FORMATTED
+        # Writing the formatted code back is not a change to process again
+        time.sleep(1)
+        assert lines.empty()
+    finally:
+        process.kill()
+        process.wait()